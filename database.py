@@ -1,10 +1,19 @@
 """
 SQLite-based database layer for managing paciente data.
 """
+import base64
+import functools
+import hashlib
+import json
 import os
+import pathlib
+import re
 import sqlite3
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 def bool_to_int(value: Optional[bool]) -> int:
@@ -15,6 +24,371 @@ def int_to_bool(value: Optional[int]) -> bool:
     return bool(value)
 
 
+def _texto_ou_vazio(value: Optional[str]) -> str:
+    return value or ''
+
+
+class ConexaoEscrita(sqlite3.Connection):
+    """
+    Conexão de escrita com pilha de savepoints (unidade de trabalho).
+
+    Cada escopo é um savepoint: os de transação (Database.transacao()) e os de
+    método (_escrita chamado dentro de uma transação). Dentro da pilha, commit()
+    aceita o trabalho até o escopo de transação mais próximo e rollback() desfaz
+    o que veio desde então; o COMMIT real acontece uma vez, ao sair do escopo mais
+    externo. Fora de escopo() o comportamento é o de sqlite3.Connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (nome do savepoint, é escopo de método)
+        self.savepoints: List[Tuple[str, bool]] = []
+        # Chamado na própria transação, logo antes de cada COMMIT real
+        self.antes_do_commit: Optional[Callable[[sqlite3.Connection], None]] = None
+
+    def _confirmar(self) -> None:
+        if self.in_transaction and self.antes_do_commit is not None:
+            self.antes_do_commit(self)
+        sqlite3.Connection.commit(self)
+
+    def _inicio_pendente(self) -> int:
+        """Índice do primeiro escopo de método acima do último escopo de transação."""
+        i = len(self.savepoints)
+        while i > 0 and self.savepoints[i - 1][1]:
+            i -= 1
+        return i
+
+    def _reabrir(self, inicio: int) -> None:
+        # RELEASE/ROLLBACK TO encerram os savepoints internos; recria a pilha a partir de `inicio`
+        for nome, _ in self.savepoints[inicio + 1:]:
+            self.execute(f'SAVEPOINT {nome}')
+
+    def commit(self) -> None:
+        if not self.savepoints:
+            self._confirmar()
+            return
+        inicio = self._inicio_pendente()
+        if inicio == len(self.savepoints):
+            return
+        nome = self.savepoints[inicio][0]
+        self.execute(f'RELEASE {nome}')
+        self.execute(f'SAVEPOINT {nome}')
+        self._reabrir(inicio)
+
+    def rollback(self) -> None:
+        if not self.savepoints:
+            super().rollback()
+            return
+        if not self.in_transaction:
+            return
+        inicio = min(self._inicio_pendente(), len(self.savepoints) - 1)
+        self.execute(f'ROLLBACK TO {self.savepoints[inicio][0]}')
+        self._reabrir(inicio)
+
+    @contextmanager
+    def escopo(self, de_metodo: bool = False):
+        """
+        Abre um savepoint (e BEGIN IMMEDIATE, se não houver transação). Exceção:
+        desfaz o escopo. Sucesso: escopo de transação é aceito (vale como commit()
+        para quem está em volta); escopo de método desfaz o que ficou sem commit(),
+        como PoolConexoes.escrita() faz com métodos avulsos.
+        """
+        iniciou = not self.in_transaction
+        if iniciou:
+            self.execute('BEGIN IMMEDIATE')
+        nome = f'unidade_trabalho_{len(self.savepoints)}'
+        self.execute(f'SAVEPOINT {nome}')
+        self.savepoints.append((nome, de_metodo))
+        try:
+            yield self
+        except BaseException:
+            del self.savepoints[-1]
+            if self.in_transaction:
+                if iniciou:
+                    sqlite3.Connection.rollback(self)
+                else:
+                    self.execute(f'ROLLBACK TO {nome}')
+                    self.execute(f'RELEASE {nome}')
+            raise
+        del self.savepoints[-1]
+        if de_metodo:
+            self.execute(f'ROLLBACK TO {nome}')
+        self.execute(f'RELEASE {nome}')
+        if iniciou:
+            self._confirmar()
+        elif not de_metodo:
+            self.commit()
+
+
+class PoolConexoes:
+    """
+    Pool de conexões SQLite: uma conexão de leitura por thread (emprestada do pool)
+    e uma única conexão de escrita, serializada por lock.
+
+    Em WAL mode as leituras rodam em paralelo entre as threads do Waitress e não
+    esperam pela escrita. A conexão de leitura fica vinculada à thread até
+    liberar_leitor() (ao fim de cada request) ou até a thread terminar.
+    """
+
+    def __init__(self, db_path: str, max_leitores: int = 8, timeout: float = 30.0):
+        self.db_path = db_path
+        self.max_leitores = max(1, int(max_leitores))
+        self.timeout = timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._livres: List[sqlite3.Connection] = []
+        self._em_uso: Dict[int, Tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._total_leitores = 0
+        self._local = threading.local()
+        self._lock_escrita = threading.RLock()
+        self._antes_do_commit: Optional[Callable[[sqlite3.Connection], None]] = None
+        self._escritor = self._abrir(somente_leitura=False)
+        # Blocos de escrita concluídos (nível mais externo); base do agendador de manutenção
+        self.escritas = 0
+        # Conexão que nunca escreve, só para PRAGMA data_version (versao_dados)
+        self._sentinela: Optional[sqlite3.Connection] = None
+        self._lock_sentinela = threading.Lock()
+        self._geracao_sentinela = 0
+
+    def _abrir(self, somente_leitura: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, timeout=self.timeout,
+            factory=sqlite3.Connection if somente_leitura else ConexaoEscrita
+        )
+        conn.row_factory = sqlite3.Row
+        if somente_leitura:
+            # Garante que nenhuma escrita passe por fora da conexão serializada
+            conn.execute('PRAGMA query_only=ON;')
+        else:
+            conn.antes_do_commit = self._antes_do_commit
+        return conn
+
+    def definir_antes_do_commit(self, funcao: Optional[Callable[[sqlite3.Connection], None]]) -> None:
+        """Função chamada na transação da conexão de escrita antes de cada COMMIT (também após reabri-la)."""
+        with self._lock_escrita:
+            self._antes_do_commit = funcao
+            self._escritor.antes_do_commit = funcao
+
+    @staticmethod
+    def _saudavel(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _recuperar_orfas(self) -> None:
+        """Devolve ao pool conexões vinculadas a threads que já terminaram (chamar com _cond)."""
+        for ident, (thread, conn) in list(self._em_uso.items()):
+            if not thread.is_alive():
+                del self._em_uso[ident]
+                if conn is not None:
+                    self._livres.append(conn)
+                else:
+                    self._total_leitores -= 1
+
+    def adquirir_leitor(self) -> sqlite3.Connection:
+        """Empresta uma conexão de leitura à thread atual (bloqueia se o pool estiver cheio)."""
+        conn = getattr(self._local, 'leitor', None)
+        if conn is not None:
+            return conn
+        ident = threading.get_ident()
+        with self._cond:
+            while True:
+                if self._livres:
+                    conn = self._livres.pop()
+                    break
+                if self._total_leitores < self.max_leitores:
+                    self._total_leitores += 1
+                    conn = None
+                    break
+                self._recuperar_orfas()
+                if self._livres:
+                    continue
+                if not self._cond.wait(self.timeout):
+                    raise sqlite3.OperationalError('Pool de conexões esgotado: nenhuma conexão de leitura livre')
+            self._em_uso[ident] = (threading.current_thread(), conn)
+        try:
+            if conn is None or not self._saudavel(conn):
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                conn = self._abrir(somente_leitura=True)
+        except Exception:
+            with self._cond:
+                self._em_uso.pop(ident, None)
+                self._total_leitores -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._em_uso[ident] = (threading.current_thread(), conn)
+        self._local.leitor = conn
+        return conn
+
+    def liberar_leitor(self) -> None:
+        """Devolve ao pool a conexão de leitura da thread atual (se houver)."""
+        conn = getattr(self._local, 'leitor', None)
+        if conn is None:
+            return
+        self._local.leitor = None
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+        with self._cond:
+            self._em_uso.pop(threading.get_ident(), None)
+            self._livres.append(conn)
+            self._cond.notify()
+
+    @property
+    def escrevendo(self) -> bool:
+        """True se a thread atual está dentro de escrita()."""
+        return getattr(self._local, 'profundidade_escrita', 0) > 0
+
+    def conexao(self) -> sqlite3.Connection:
+        """
+        Conexão adequada para a thread atual: a de escrita dentro de escrita(), a do
+        instantâneo dentro de instantaneo(), senão a de leitura.
+        """
+        if self.escrevendo:
+            return self._escritor
+        instantaneo = getattr(self._local, 'instantaneo', None)
+        if instantaneo is not None:
+            return instantaneo
+        return self.adquirir_leitor()
+
+    def versao_dados(self) -> Tuple[int, int]:
+        """
+        (geração, PRAGMA data_version) de uma conexão que nunca escreve: muda a cada
+        COMMIT de qualquer outra conexão no arquivo, deste processo ou de outro.
+        """
+        with self._lock_sentinela:
+            if self._sentinela is not None:
+                try:
+                    return self._geracao_sentinela, self._sentinela.execute('PRAGMA data_version').fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            # Conexão nova recomeça a contagem do data_version; a geração evita repetir um token antigo
+            self._sentinela = self._abrir(somente_leitura=True)
+            self._geracao_sentinela += 1
+            return self._geracao_sentinela, self._sentinela.execute('PRAGMA data_version').fetchone()[0]
+
+    @contextmanager
+    def instantaneo(self):
+        """
+        Conexão somente leitura dedicada (URI mode=ro, fora do pool) com um único BEGIN:
+        todas as leituras do bloco veem o banco no mesmo ponto no tempo. Em WAL ela não
+        espera pela escrita nem a bloqueia. Reentrante na mesma thread.
+        """
+        atual = getattr(self._local, 'instantaneo', None)
+        if atual is not None:
+            yield atual
+            return
+        try:
+            uri = pathlib.Path(os.path.abspath(self.db_path)).as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            dedicada = True
+        except (sqlite3.Error, ValueError):
+            # Ex.: caminho de rede que não vira URI; o leitor do pool também segura um snapshot
+            conn = self.adquirir_leitor()
+            dedicada = False
+        try:
+            conn.execute('BEGIN')
+            # O snapshot do WAL é fixado na primeira leitura, não no BEGIN
+            conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+            self._local.instantaneo = conn
+            yield conn
+        finally:
+            self._local.instantaneo = None
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            if dedicada:
+                conn.close()
+
+    @contextmanager
+    def escrita(self):
+        """Serializa o bloco na conexão de escrita. Reentrante na mesma thread."""
+        with self._lock_escrita:
+            profundidade = getattr(self._local, 'profundidade_escrita', 0)
+            if profundidade == 0 and not self._saudavel(self._escritor):
+                try:
+                    self._escritor.close()
+                except sqlite3.Error:
+                    pass
+                self._escritor = self._abrir(somente_leitura=False)
+            self._local.profundidade_escrita = profundidade + 1
+            try:
+                yield self._escritor
+            finally:
+                self._local.profundidade_escrita = profundidade
+                if profundidade == 0:
+                    self._escritor.savepoints.clear()
+                    self.escritas += 1
+                if profundidade == 0 and self._escritor.in_transaction:
+                    # Nada pendente deve sobreviver ao fim da operação (ex.: INSERT que falhou)
+                    try:
+                        self._escritor.rollback()
+                    except sqlite3.Error:
+                        pass
+
+    def estatisticas(self) -> Dict:
+        with self._cond:
+            return {
+                'max_leitores': self.max_leitores,
+                'leitores_abertos': self._total_leitores,
+                'leitores_livres': len(self._livres),
+                'leitores_em_uso': len(self._em_uso),
+            }
+
+    def fechar(self) -> None:
+        with self._cond:
+            conexoes = list(self._livres) + [conn for _, conn in self._em_uso.values() if conn is not None]
+            self._livres.clear()
+            self._em_uso.clear()
+            self._total_leitores = 0
+        for conn in conexoes:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        with self._lock_escrita:
+            self._escritor.close()
+        with self._lock_sentinela:
+            if self._sentinela is not None:
+                self._sentinela.close()
+                self._sentinela = None
+
+
+def _escrita(func):
+    """
+    Executa o método do Database na conexão de escrita (serializada). Dentro de
+    Database.transacao() o método roda num savepoint próprio: seus commit() não
+    gravam no disco e o que ele deixar sem commit é desfeito, como fora dela.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._pool.escrita() as conn:
+            if not conn.savepoints:
+                return func(self, *args, **kwargs)
+            with conn.escopo(de_metodo=True):
+                return func(self, *args, **kwargs)
+    return wrapper
+
+
+def _transacional(func):
+    """Executa o método inteiro como uma única transação (Database.transacao())."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.transacao():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class Database:
     def __init__(self, db_path: Optional[str] = None):
         # Verificar se há um caminho configurado via variável de ambiente
@@ -50,464 +424,1256 @@ class Database:
             pass
         
         # Configurar timeout maior para banco compartilhado em rede
-        # WAL mode para melhor concorrência (opcional, mas recomendado)
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30.0)
-        self.conn.row_factory = sqlite3.Row
+        # Pool: leitura por thread + uma conexão de escrita serializada
+        max_leitores = int(os.getenv('DB_POOL_MAX_LEITORES') or int(os.getenv('WAITRESS_THREADS', '8')) + 4)
+        self._pool = PoolConexoes(self.db_path, max_leitores=max_leitores, timeout=30.0)
+        self._decodificadores: Dict[Tuple[str, ...], Callable[[Tuple], Dict]] = {}
         # Habilitar WAL mode para melhor suporte a múltiplos acessos simultâneos
-        try:
-            self.conn.execute('PRAGMA journal_mode=WAL;')
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            # Se WAL não for suportado (ex: em alguns sistemas de arquivos de rede), continuar normalmente
-            pass
+        with self._pool.escrita() as conn:
+            try:
+                # Só vale para banco novo (antes da primeira tabela); os existentes são
+                # convertidos por vacuum_incremental(converter=True)
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL;')
+                conn.execute('PRAGMA journal_mode=WAL;')
+                conn.commit()
+            except sqlite3.OperationalError:
+                # Se WAL não for suportado (ex: em alguns sistemas de arquivos de rede), continuar normalmente
+                pass
         
         # Carregar PC_ID
         from config import get_pc_id
         self.pc_id = get_pc_id()
         
-        self._ensure_schema()
-        # Migrar dados existentes (preencher campos novos para registros antigos)
-        self._migrar_dados_existentes()
-
-    def _ensure_schema(self) -> None:
-        ddl = """
-        CREATE TABLE IF NOT EXISTS pacientes (
-            id TEXT PRIMARY KEY,
-            nome_gestante TEXT NOT NULL,
-            unidade_saude TEXT,
-            data_salvamento TEXT,
-            inicio_pre_natal_antes_12s INTEGER,
-            inicio_pre_natal_semanas INTEGER,
-            inicio_pre_natal_observacao TEXT,
-            consultas_pre_natal INTEGER,
-            vacinas_completas TEXT,
-            plano_parto INTEGER,
-            participou_grupos INTEGER,
-            avaliacao_odontologica INTEGER,
-            estratificacao INTEGER,
-            estratificacao_problema TEXT,
-            cartao_pre_natal_completo INTEGER,
-            dum TEXT,
-            dpp TEXT,
-            ganhou_kit INTEGER,
-            kit_tipo TEXT,
-            proxima_avaliacao TEXT,
-            proxima_avaliacao_hora TEXT,
-            arquivo_origem TEXT
+        # Schema e dados antigos: só os passos ainda não aplicados (PRAGMA user_version)
+        self._aplicar_migracoes()
+        self._busca_fts = self._verificar_busca_pacientes()
+        # Depois das migrações: a v9 é que cria hash_conteudo
+        self._pool.definir_antes_do_commit(self._preencher_hash_conteudo)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Conexão da thread atual: a de escrita dentro de escrita(), senão uma de leitura do pool."""
+        return self._pool.conexao()
+
+    def escrita(self):
+        """Context manager que serializa um bloco de escrita na conexão de escrita."""
+        return self._pool.escrita()
+
+    def versao_dados(self) -> Tuple[int, int]:
+        """Token de mudança do banco: muda a cada COMMIT (de qualquer thread ou processo)."""
+        return self._pool.versao_dados()
+
+    def instantaneo(self):
+        """
+        Context manager de leitura consistente para relatórios e exportações: dentro do
+        bloco, self.conn é uma conexão mode=ro com um snapshot único do banco.
+        """
+        return self._pool.instantaneo()
+
+    @contextmanager
+    def transacao(self):
+        """
+        Unidade de trabalho: tudo no bloco vira uma transação, com um único COMMIT ao
+        sair do bloco mais externo (ou ROLLBACK se sair por exceção). Aninhável: blocos
+        internos usam savepoints e uma exceção desfaz só o bloco onde ocorreu.
+        Os commit() dos métodos chamados dentro do bloco não gravam no disco.
+        """
+        with self._pool.escrita() as conn:
+            with conn.escopo():
+                yield conn
+
+    def liberar_conexao(self) -> None:
+        """Devolve ao pool a conexão de leitura da thread atual (fim do request)."""
+        self._pool.liberar_leitor()
+
+    # Migrações versionadas: (versão, método), aplicadas em ordem uma única vez.
+    # A última versão aplicada fica gravada em PRAGMA user_version.
+    MIGRACOES: Tuple[Tuple[int, str], ...] = (
+        (1, '_migracao_schema_base'),
+        (2, '_migracao_preencher_campos_sync'),
+        (3, '_migracao_indicadores_diarios'),
+        (4, '_migracao_busca_pacientes'),
+        (5, '_migracao_indices_paginacao'),
+        (6, '_migracao_unidades'),
+        (7, '_migracao_indices_ativos'),
+        (8, '_migracao_mudancas'),
+        (9, '_migracao_hash_conteudo'),
+        (10, '_migracao_hash_sem_metadados_locais'),
+        (11, '_migracao_sessoes_sync'),
+        (12, '_migracao_indicadores_bolsa_covid'),
+        (13, '_migracao_indices_conflito'),
+    )
+
+    # Colunas da v1, congeladas: criam a tabela em bancos novos e completam bancos antigos.
+    # Migração posterior que adicionar coluna declara só as colunas dela (ex.: v6)
+    COLUNAS_PACIENTES_V1: Tuple[Tuple[str, str], ...] = (
+        ('id', 'TEXT PRIMARY KEY'),
+        ('nome_gestante', 'TEXT NOT NULL'),
+        ('unidade_saude', 'TEXT'),
+        ('data_salvamento', 'TEXT'),
+        ('inicio_pre_natal_antes_12s', 'INTEGER'),
+        ('inicio_pre_natal_semanas', 'INTEGER'),
+        ('inicio_pre_natal_observacao', 'TEXT'),
+        ('consultas_pre_natal', 'INTEGER'),
+        ('vacinas_completas', 'TEXT'),
+        ('plano_parto', 'INTEGER'),
+        ('participou_grupos', 'INTEGER'),
+        ('avaliacao_odontologica', 'INTEGER'),
+        ('estratificacao', 'INTEGER'),
+        ('estratificacao_problema', 'TEXT'),
+        ('cartao_pre_natal_completo', 'INTEGER'),
+        ('dum', 'TEXT'),
+        ('dpp', 'TEXT'),
+        ('ganhou_kit', 'INTEGER'),
+        ('kit_tipo', 'TEXT'),
+        ('proxima_avaliacao', 'TEXT'),
+        ('proxima_avaliacao_hora', 'TEXT'),
+        ('arquivo_origem', 'TEXT'),
+        ('ja_ganhou_crianca', 'INTEGER'),
+        ('data_ganhou_crianca', 'TEXT'),
+        ('quantidade_filhos', 'INTEGER'),
+        ('generos_filhos', 'TEXT'),
+        ('metodo_preventivo', 'TEXT'),
+        ('metodo_preventivo_outros', 'TEXT'),
+        ('possui_bolsa_familia', 'INTEGER'),
+        ('tem_vacina_covid', 'INTEGER'),
+        ('plano_parto_entregue_por_unidade', 'TEXT'),
+        ('pc_id', 'TEXT'),
+        ('ultima_modificacao', 'TEXT'),
+        ('versao', 'INTEGER DEFAULT 1'),
+        ('status', "TEXT DEFAULT 'ativo'"),
+        ('removido_em', 'TEXT'),
+        ('removido_por', 'TEXT'),
+    )
+
+    COLUNAS_AGENDAMENTOS_V1: Tuple[Tuple[str, str], ...] = (
+        ('id', 'TEXT PRIMARY KEY'),
+        ('paciente_id', 'TEXT NOT NULL'),
+        ('data_consulta', 'TEXT NOT NULL'),
+        ('hora_consulta', 'TEXT NOT NULL'),
+        ('tipo_consulta', 'TEXT'),
+        ('observacoes', 'TEXT'),
+        ('status', "TEXT DEFAULT 'agendado'"),
+        ('data_criacao', 'TEXT'),
+        ('data_atualizacao', 'TEXT'),
+        ('pc_id', 'TEXT'),
+        ('ultima_modificacao', 'TEXT'),
+        ('versao', 'INTEGER DEFAULT 1'),
+        ('removido_em', 'TEXT'),
+        ('removido_por', 'TEXT'),
+    )
+
+    # v6: chave inteira da dimensão unidades
+    COLUNAS_PACIENTES_V6: Tuple[Tuple[str, str], ...] = (('unidade_id', 'INTEGER'),)
+
+    # v9: digest do conteúdo, nas duas tabelas
+    COLUNAS_HASH_V9: Tuple[Tuple[str, str], ...] = (('hash_conteudo', 'TEXT'),)
+
+    # Esquema atual de cada tabela: v1 + colunas das migrações seguintes
+    COLUNAS_PACIENTES: Tuple[Tuple[str, str], ...] = COLUNAS_PACIENTES_V1 + COLUNAS_PACIENTES_V6 + COLUNAS_HASH_V9
+    COLUNAS_AGENDAMENTOS: Tuple[Tuple[str, str], ...] = COLUNAS_AGENDAMENTOS_V1 + COLUNAS_HASH_V9
+    ESQUEMA: Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], ...] = (
+        ('pacientes', COLUNAS_PACIENTES), ('agendamentos', COLUNAS_AGENDAMENTOS),
+    )
+
+    # Esquemas congelados dos triggers das migrações antigas: uma coluna nova em COLUNAS_*
+    # não pode entrar num trigger criado antes da migração que a adiciona
+    ESQUEMA_V8: Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], ...] = (
+        ('pacientes', COLUNAS_PACIENTES_V1 + COLUNAS_PACIENTES_V6), ('agendamentos', COLUNAS_AGENDAMENTOS_V1),
+    )
+    ESQUEMA_V9: Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], ...] = (
+        ('pacientes', COLUNAS_PACIENTES_V1 + COLUNAS_PACIENTES_V6 + COLUNAS_HASH_V9),
+        ('agendamentos', COLUNAS_AGENDAMENTOS_V1 + COLUNAS_HASH_V9),
+    )
+
+    def _aplicar_migracoes(self) -> None:
+        """
+        Aplica as migrações pendentes. Um banco já migrado abre com uma única
+        leitura de PRAGMA user_version. Cada passo roda em BEGIN IMMEDIATE e
+        relê a versão, então dois processos abrindo o mesmo arquivo não repetem passos.
+        """
+        versao_alvo = self.MIGRACOES[-1][0]
+        with self._pool.escrita() as conn:
+            versao = conn.execute('PRAGMA user_version').fetchone()[0]
+            if versao >= versao_alvo:
+                return
+            for numero, metodo in self.MIGRACOES:
+                if numero <= versao:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    if conn.execute('PRAGMA user_version').fetchone()[0] >= numero:
+                        # Outro processo aplicou este passo enquanto esperávamos o lock
+                        conn.rollback()
+                        continue
+                    getattr(self, metodo)(conn)
+                    conn.execute(f'PRAGMA user_version = {int(numero)}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+    @staticmethod
+    def _criar_ou_completar_tabela(conn: sqlite3.Connection, tabela: str, colunas: Tuple[Tuple[str, str], ...]) -> None:
+        """Cria a tabela se não existir; se existir (banco antigo), adiciona só as colunas que faltam."""
+        existentes = {row['name'] for row in conn.execute(f'PRAGMA table_info({tabela})')}
+        if not existentes:
+            extra = ',\n            FOREIGN KEY (paciente_id) REFERENCES pacientes(id)' if tabela == 'agendamentos' else ''
+            definicoes = ',\n            '.join(f'{nome} {tipo}' for nome, tipo in colunas)
+            conn.execute(f'CREATE TABLE {tabela} (\n            {definicoes}{extra}\n        )')
+            return
+        for nome, tipo in colunas:
+            if nome not in existentes:
+                conn.execute(f'ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}')
+
+    def _migracao_schema_base(self, conn: sqlite3.Connection) -> None:
+        """v1: tabelas pacientes/agendamentos com as colunas da v1 e índices."""
+        self._criar_ou_completar_tabela(conn, 'pacientes', self.COLUNAS_PACIENTES_V1)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_nome ON pacientes(nome_gestante)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_unidade ON pacientes(unidade_saude)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_status ON pacientes(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_pc_id ON pacientes(pc_id)")
+
+        self._criar_ou_completar_tabela(conn, 'agendamentos', self.COLUNAS_AGENDAMENTOS_V1)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamento_paciente ON agendamentos(paciente_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamento_data ON agendamentos(data_consulta)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_status ON agendamentos(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_pc_id ON agendamentos(pc_id)")
+
+    def _migracao_preencher_campos_sync(self, conn: sqlite3.Connection) -> None:
+        """
+        v2: preenche campos de sincronização em registros antigos.
+        Mantém compatibilidade com dados que não possuem os novos campos.
+        """
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute("""
+            UPDATE pacientes 
+            SET 
+                pc_id = ?,
+                ultima_modificacao = COALESCE(ultima_modificacao, data_salvamento, ?),
+                versao = COALESCE(versao, 1),
+                status = COALESCE(status, 'ativo')
+            WHERE pc_id IS NULL OR ultima_modificacao IS NULL OR versao IS NULL OR status IS NULL
+        """, (self.pc_id, agora))
+        conn.execute("""
+            UPDATE agendamentos 
+            SET 
+                pc_id = ?,
+                ultima_modificacao = COALESCE(ultima_modificacao, data_atualizacao, data_criacao, ?),
+                versao = COALESCE(versao, 1)
+            WHERE pc_id IS NULL OR ultima_modificacao IS NULL OR versao IS NULL
+        """, (self.pc_id, agora))
+
+    def _migracao_indicadores_diarios(self, conn: sqlite3.Connection) -> None:
+        """v3: tabela indicadores_diarios, triggers que a mantêm e carga inicial."""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS indicadores_diarios (
+                data TEXT NOT NULL,
+                unidade TEXT NOT NULL,
+                indicador TEXT NOT NULL,
+                balde TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (data, unidade, indicador, balde)
+            ) WITHOUT ROWID
+        """)
+        for sql in self._sql_triggers_indicadores_diarios():
+            conn.execute(sql)
+        self._recalcular_indicadores_diarios(conn)
+
+    # Balde de cada indicador para uma linha de pacientes ({p} = NEW., OLD. ou alias).
+    # Mesma semântica de _SQL_AGREGADOS_ESTATISTICAS; NULL = a linha não entra no indicador.
+    _BALDES_INDICADORES: Tuple[Tuple[str, str], ...] = (
+        ('total', "'total'"),
+        ('inicio_pre_natal_antes_12s',
+         "CASE {p}inicio_pre_natal_antes_12s WHEN 1 THEN 'sim' WHEN 0 THEN 'nao' END"),
+        ('consultas_pre_natal',
+         "CASE WHEN COALESCE({p}consultas_pre_natal, 0) >= 6 THEN 'mais_6' ELSE 'ate_6' END"),
+        ('vacinas_completas',
+         "CASE WHEN INSTR(LOWER(COALESCE({p}vacinas_completas, '')), 'completa') > 0 THEN 'completa'"
+         " WHEN INSTR(LOWER(COALESCE({p}vacinas_completas, '')), 'incompleta') > 0 THEN 'incompleta'"
+         " ELSE 'nao_avaliado' END"),
+        ('plano_parto', "CASE {p}plano_parto WHEN 1 THEN 'sim' WHEN 0 THEN 'nao' END"),
+        ('participou_grupos', "CASE {p}participou_grupos WHEN 1 THEN 'sim' WHEN 0 THEN 'nao' END"),
+        # NULL conta como "não"; outros valores (fora do domínio) não entram
+        ('possui_bolsa_familia',
+         "CASE WHEN {p}possui_bolsa_familia = 1 THEN 'sim'"
+         " WHEN {p}possui_bolsa_familia = 0 OR {p}possui_bolsa_familia IS NULL THEN 'nao' END"),
+        ('tem_vacina_covid',
+         "CASE WHEN {p}tem_vacina_covid = 1 THEN 'sim'"
+         " WHEN {p}tem_vacina_covid = 0 OR {p}tem_vacina_covid IS NULL THEN 'nao' END"),
+    )
+
+    # Colunas que, ao mudar, movem o paciente de balde
+    _COLUNAS_INDICADORES_DIARIOS = (
+        'data_salvamento', 'unidade_saude', 'inicio_pre_natal_antes_12s', 'consultas_pre_natal',
+        'vacinas_completas', 'plano_parto', 'participou_grupos', 'possui_bolsa_familia', 'tem_vacina_covid',
+    )
+
+    @staticmethod
+    def _sql_data_indicadores(p: str) -> str:
+        """Chave de data do rollup: parte antes do primeiro espaço de data_salvamento ('' se não houver)."""
+        return (f"CASE WHEN COALESCE({p}data_salvamento, '') = '' THEN ''"
+                f" WHEN INSTR({p}data_salvamento, ' ') > 0"
+                f" THEN SUBSTR({p}data_salvamento, 1, INSTR({p}data_salvamento, ' ') - 1)"
+                f" ELSE {p}data_salvamento END")
+
+    @classmethod
+    def _sql_limpar_zerados(cls, p: str) -> str:
+        """Remove baldes zerados só do (data, unidade) da linha `p` (sem varrer o rollup inteiro)."""
+        return (f"DELETE FROM indicadores_diarios WHERE data = {cls._sql_data_indicadores(p)}"
+                f" AND unidade = LOWER(COALESCE({p}unidade_saude, '')) AND total = 0")
+
+    @classmethod
+    def _sql_delta_indicadores(cls, prefixo: str, sinal: int, origem: str = '') -> str:
+        """
+        INSERT ... ON CONFLICT que soma `sinal` nos baldes da linha `prefixo`
+        (`origem` = FROM opcional, para recalcular a partir de pacientes).
+        """
+        p = prefixo
+        data = cls._sql_data_indicadores(p)
+        selects = " UNION ALL ".join(
+            f"SELECT {data} AS data, LOWER(COALESCE({p}unidade_saude, '')) AS unidade, "
+            f"'{indicador}' AS indicador, {balde.format(p=p)} AS balde {origem}"
+            for indicador, balde in cls._BALDES_INDICADORES
         )
+        return (
+            "INSERT INTO indicadores_diarios (data, unidade, indicador, balde, total) "
+            f"SELECT data, unidade, indicador, balde, COUNT(*) * {int(sinal)} FROM ({selects}) "
+            "WHERE balde IS NOT NULL GROUP BY data, unidade, indicador, balde "
+            "ON CONFLICT (data, unidade, indicador, balde) DO UPDATE SET total = total + excluded.total"
+        )
+
+    @classmethod
+    def _sql_triggers_indicadores_diarios(cls) -> List[str]:
         """
-        self.conn.execute(ddl)
-        # Adicionar coluna estratificacao_problema se não existir (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN estratificacao_problema TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        # Adicionar colunas de início do pré-natal se não existirem (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN inicio_pre_natal_semanas INTEGER")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN inicio_pre_natal_observacao TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        # Adicionar coluna proxima_avaliacao se não existir (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN proxima_avaliacao TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        # Adicionar coluna proxima_avaliacao_hora se não existir (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN proxima_avaliacao_hora TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        # Adicionar colunas DUM, DPP, ganhou_kit e kit_tipo se não existirem (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN dum TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN dpp TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN ganhou_kit INTEGER")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN kit_tipo TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        # Adicionar novas colunas de histórico reprodutivo se não existirem (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN ja_ganhou_crianca INTEGER")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN data_ganhou_crianca TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN quantidade_filhos INTEGER")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN generos_filhos TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN metodo_preventivo TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN metodo_preventivo_outros TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN possui_bolsa_familia INTEGER")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN tem_vacina_covid INTEGER")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN plano_parto_entregue_por_unidade TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        # Adicionar novas colunas de sincronização se não existirem (migração)
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN pc_id TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN ultima_modificacao TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
+        Triggers que mantêm indicadores_diarios. O INSERT OR REPLACE remove a linha
+        antiga sem disparar DELETE (recursive_triggers desligado), por isso o BEFORE INSERT
+        desconta a versão anterior do mesmo id antes da nova ser somada.
+        """
+        colunas = ', '.join(cls._COLUNAS_INDICADORES_DIARIOS)
+        limpar_antigo = (
+            "DELETE FROM indicadores_diarios WHERE total = 0"
+            f" AND data = (SELECT {cls._sql_data_indicadores('')} FROM pacientes WHERE id = NEW.id)"
+            " AND unidade = (SELECT LOWER(COALESCE(unidade_saude, '')) FROM pacientes WHERE id = NEW.id)"
+        )
+        return [
+            "DROP TRIGGER IF EXISTS trg_pacientes_indicadores_substituir",
+            "DROP TRIGGER IF EXISTS trg_pacientes_indicadores_inserir",
+            "DROP TRIGGER IF EXISTS trg_pacientes_indicadores_atualizar",
+            "DROP TRIGGER IF EXISTS trg_pacientes_indicadores_excluir",
+            f"""CREATE TRIGGER trg_pacientes_indicadores_substituir
+                BEFORE INSERT ON pacientes
+                WHEN EXISTS (SELECT 1 FROM pacientes WHERE id = NEW.id)
+                BEGIN
+                    {cls._sql_delta_indicadores('antigo.', -1, 'FROM pacientes AS antigo WHERE antigo.id = NEW.id')};
+                    {limpar_antigo};
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_indicadores_inserir
+                AFTER INSERT ON pacientes
+                BEGIN
+                    {cls._sql_delta_indicadores('NEW.', 1)};
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_indicadores_atualizar
+                AFTER UPDATE OF {colunas} ON pacientes
+                BEGIN
+                    {cls._sql_delta_indicadores('OLD.', -1)};
+                    {cls._sql_delta_indicadores('NEW.', 1)};
+                    {cls._sql_limpar_zerados('OLD.')};
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_indicadores_excluir
+                AFTER DELETE ON pacientes
+                BEGIN
+                    {cls._sql_delta_indicadores('OLD.', -1)};
+                    {cls._sql_limpar_zerados('OLD.')};
+                END""",
+        ]
+
+    def _recalcular_indicadores_diarios(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM indicadores_diarios")
+        conn.execute(self._sql_delta_indicadores('p.', 1, 'FROM pacientes AS p'))
+
+    @_escrita
+    def reconstruir_indicadores_diarios(self) -> Dict:
+        """Recalcula indicadores_diarios do zero a partir de pacientes (e recria os triggers)."""
         try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN versao INTEGER DEFAULT 1")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
+            conn = self.conn
+            for sql in self._sql_triggers_indicadores_diarios():
+                conn.execute(sql)
+            self._recalcular_indicadores_diarios(conn)
+            conn.commit()
+            total = conn.execute("SELECT COUNT(*) FROM indicadores_diarios").fetchone()[0]
+            return {'success': True, 'message': f'Indicadores diários reconstruídos ({total} linhas)'}
+        except Exception as e:
+            self.conn.rollback()
+            return {'success': False, 'message': f'Erro ao reconstruir indicadores: {str(e)}'}
+
+    # Índice de texto (FTS5) de nome e unidade; o conteúdo fica em pacientes (external content)
+    _SQL_CRIAR_BUSCA_PACIENTES = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_busca USING fts5(
+            nome_gestante, unidade_saude,
+            content='pacientes', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """
+
+    def _migracao_busca_pacientes(self, conn: sqlite3.Connection) -> None:
+        """v4: índice FTS5 de busca por nome. Sem FTS5 no SQLite, a busca segue com LIKE."""
         try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN status TEXT DEFAULT 'ativo'")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
+            conn.execute(self._SQL_CRIAR_BUSCA_PACIENTES)
+        except sqlite3.OperationalError as e:
+            print(f"Aviso: FTS5 indisponível, busca por nome usará LIKE ({e})")
+            return
+        for sql in self._sql_triggers_busca_pacientes():
+            conn.execute(sql)
+        conn.execute("INSERT INTO pacientes_busca(pacientes_busca) VALUES ('rebuild')")
+
+    @staticmethod
+    def _sql_triggers_busca_pacientes() -> List[str]:
+        """
+        Triggers que mantêm pacientes_busca. Como em indicadores_diarios, o BEFORE INSERT
+        cobre o INSERT OR REPLACE (a linha substituída não dispara o trigger de DELETE).
+        """
+        remover = ("INSERT INTO pacientes_busca(pacientes_busca, rowid, nome_gestante, unidade_saude) "
+                   "VALUES ('delete', OLD.rowid, OLD.nome_gestante, OLD.unidade_saude)")
+        inserir = ("INSERT INTO pacientes_busca(rowid, nome_gestante, unidade_saude) "
+                   "VALUES (NEW.rowid, NEW.nome_gestante, NEW.unidade_saude)")
+        return [
+            "DROP TRIGGER IF EXISTS trg_pacientes_busca_substituir",
+            "DROP TRIGGER IF EXISTS trg_pacientes_busca_inserir",
+            "DROP TRIGGER IF EXISTS trg_pacientes_busca_atualizar",
+            "DROP TRIGGER IF EXISTS trg_pacientes_busca_excluir",
+            """CREATE TRIGGER trg_pacientes_busca_substituir
+                BEFORE INSERT ON pacientes
+                WHEN EXISTS (SELECT 1 FROM pacientes WHERE id = NEW.id)
+                BEGIN
+                    INSERT INTO pacientes_busca(pacientes_busca, rowid, nome_gestante, unidade_saude)
+                    SELECT 'delete', rowid, nome_gestante, unidade_saude FROM pacientes WHERE id = NEW.id;
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_busca_inserir
+                AFTER INSERT ON pacientes
+                BEGIN
+                    {inserir};
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_busca_atualizar
+                AFTER UPDATE OF nome_gestante, unidade_saude ON pacientes
+                BEGIN
+                    {remover};
+                    {inserir};
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_busca_excluir
+                AFTER DELETE ON pacientes
+                BEGIN
+                    {remover};
+                END""",
+        ]
+
+    def _verificar_busca_pacientes(self) -> bool:
+        """True se pacientes_busca existe e o FTS5 deste SQLite consegue lê-la."""
         try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN removido_em TEXT")
-            self.conn.commit()
+            conn = self.conn
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pacientes_busca'").fetchone():
+                return False
+            conn.execute("SELECT rowid FROM pacientes_busca LIMIT 1").fetchall()
+            return True
         except sqlite3.OperationalError:
-            pass  # Coluna já existe
+            return False
+
+    @_escrita
+    def reconstruir_busca_pacientes(self) -> Dict:
+        """
+        Recria pacientes_busca a partir de pacientes. Necessário após VACUUM, que pode
+        renumerar o rowid de pacientes (chave primária TEXT) usado pelo índice.
+        """
+        if not self._busca_fts:
+            return {'success': False, 'message': 'FTS5 indisponível; busca por nome usa LIKE'}
         try:
-            self.conn.execute("ALTER TABLE pacientes ADD COLUMN removido_por TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_nome ON pacientes(nome_gestante)")
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_unidade ON pacientes(unidade_saude)")
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_status ON pacientes(status)")
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_pc_id ON pacientes(pc_id)")
-        
-        # Criar tabela de agendamentos
-        ddl_agendamentos = """
-        CREATE TABLE IF NOT EXISTS agendamentos (
-            id TEXT PRIMARY KEY,
-            paciente_id TEXT NOT NULL,
-            data_consulta TEXT NOT NULL,
-            hora_consulta TEXT NOT NULL,
-            tipo_consulta TEXT,
-            observacoes TEXT,
-            status TEXT DEFAULT 'agendado',
-            data_criacao TEXT,
-            data_atualizacao TEXT,
-            FOREIGN KEY (paciente_id) REFERENCES pacientes(id)
+            conn = self.conn
+            for sql in self._sql_triggers_busca_pacientes():
+                conn.execute(sql)
+            conn.execute("INSERT INTO pacientes_busca(pacientes_busca) VALUES ('rebuild')")
+            conn.commit()
+            return {'success': True, 'message': 'Índice de busca reconstruído'}
+        except Exception as e:
+            self.conn.rollback()
+            return {'success': False, 'message': f'Erro ao reconstruir índice de busca: {str(e)}'}
+
+    @staticmethod
+    def _consulta_fts_nome(texto: str) -> Optional[str]:
+        """
+        Expressão MATCH restrita a nome_gestante: cada palavra vira prefixo ("ana"* "sil"*),
+        todas obrigatórias. None se o texto não tiver nenhuma palavra indexável.
+        """
+        palavras = re.findall(r'[^\W_]+', texto)
+        if not palavras:
+            return None
+        return 'nome_gestante : (' + ' '.join(f'"{p}"*' for p in palavras) + ')'
+
+    def _migracao_indices_paginacao(self, conn: sqlite3.Connection) -> None:
+        """v5: índices da paginação por cursor de buscar_pacientes_pagina (chave de ordenação + id)."""
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_data_id ON pacientes(COALESCE(data_salvamento, ''), id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_nome_id ON pacientes(COALESCE(nome_gestante, ''), id)")
+
+    def _migracao_unidades(self, conn: sqlite3.Connection) -> None:
+        """
+        v6: dimensão unidades (id, nome de exibição, chave = LOWER(nome)) e coluna
+        pacientes.unidade_id indexada, preenchida aqui e mantida por triggers.
+        indicadores_diarios passa a guardar a chave normalizada em `unidade`.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS unidades (
+                id INTEGER PRIMARY KEY,
+                nome TEXT NOT NULL,
+                chave TEXT NOT NULL UNIQUE
+            )
+        """)
+        self._criar_ou_completar_tabela(conn, 'pacientes', self.COLUNAS_PACIENTES_V6)
+        # Nome de exibição = primeira grafia encontrada de cada unidade
+        conn.execute("""
+            INSERT INTO unidades (nome, chave)
+            SELECT nome, chave FROM (
+                SELECT unidade_saude AS nome, LOWER(unidade_saude) AS chave, MIN(rowid)
+                FROM pacientes
+                WHERE COALESCE(unidade_saude, '') != ''
+                GROUP BY LOWER(unidade_saude)
+            )
+            WHERE chave NOT IN (SELECT chave FROM unidades)
+        """)
+        conn.execute("""
+            UPDATE pacientes SET unidade_id = (
+                SELECT id FROM unidades WHERE chave = LOWER(pacientes.unidade_saude)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_unidade_id ON pacientes(unidade_id)")
+        for sql in self._sql_triggers_unidades():
+            conn.execute(sql)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_indicadores_diarios_unidade ON indicadores_diarios(unidade, indicador)")
+        for sql in self._sql_triggers_indicadores_diarios():
+            conn.execute(sql)
+        self._recalcular_indicadores_diarios(conn)
+
+    @staticmethod
+    def _sql_triggers_unidades() -> List[str]:
+        """
+        Triggers que mantêm pacientes.unidade_id: o BEFORE cadastra a unidade nova e o
+        AFTER grava o id. Sem INSERT OR IGNORE em unidades: dentro de um trigger disparado
+        por INSERT OR REPLACE o conflito viraria REPLACE e trocaria o id da unidade.
+        """
+        cadastrar = """
+                    INSERT INTO unidades (nome, chave)
+                    SELECT NEW.unidade_saude, LOWER(NEW.unidade_saude)
+                    WHERE COALESCE(NEW.unidade_saude, '') != ''
+                      AND NOT EXISTS (SELECT 1 FROM unidades WHERE chave = LOWER(NEW.unidade_saude));"""
+        vincular = """
+                    UPDATE pacientes
+                    SET unidade_id = (SELECT id FROM unidades WHERE chave = LOWER(NEW.unidade_saude))
+                    WHERE rowid = NEW.rowid;"""
+        return [
+            "DROP TRIGGER IF EXISTS trg_pacientes_unidade_cadastrar_inserir",
+            "DROP TRIGGER IF EXISTS trg_pacientes_unidade_vincular_inserir",
+            "DROP TRIGGER IF EXISTS trg_pacientes_unidade_cadastrar_atualizar",
+            "DROP TRIGGER IF EXISTS trg_pacientes_unidade_vincular_atualizar",
+            f"""CREATE TRIGGER trg_pacientes_unidade_cadastrar_inserir
+                BEFORE INSERT ON pacientes
+                BEGIN{cadastrar}
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_unidade_vincular_inserir
+                AFTER INSERT ON pacientes
+                BEGIN{vincular}
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_unidade_cadastrar_atualizar
+                BEFORE UPDATE OF unidade_saude ON pacientes
+                BEGIN{cadastrar}
+                END""",
+            f"""CREATE TRIGGER trg_pacientes_unidade_vincular_atualizar
+                AFTER UPDATE OF unidade_saude ON pacientes
+                BEGIN{vincular}
+                END""",
+        ]
+
+    def _migracao_indices_ativos(self, conn: sqlite3.Connection) -> None:
+        """v7: índices parciais só com registros ativos (_SQL_ATIVO), nas ordenações das listagens."""
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_pacientes_ativos_data
+            ON pacientes(COALESCE(data_salvamento, ''), id) WHERE {self._SQL_ATIVO}
+        """)
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_agendamentos_ativos_paciente
+            ON agendamentos(paciente_id, data_consulta, hora_consulta) WHERE {self._SQL_ATIVO}
+        """)
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_agendamentos_ativos_data
+            ON agendamentos(data_consulta, hora_consulta) WHERE {self._SQL_ATIVO}
+        """)
+
+    # Colunas mantidas pelos próprios triggers: alterá-las não é mudança de dado
+    COLUNAS_DERIVADAS = ('unidade_id', 'hash_conteudo')
+
+    @classmethod
+    def _sql_triggers_mudancas(cls, esquema: Optional[Tuple] = None) -> List[str]:
+        """
+        Triggers que alimentam o diário mudancas. O de INSERT é BEFORE para distinguir
+        o INSERT OR REPLACE de um id existente (registrado como 'atualizar'); se a
+        instrução falhar, o registro some junto. A lista de colunas do UPDATE OF vem de
+        `esquema` (padrão: ESQUEMA, o atual): migração que adicionar coluna recria estes
+        triggers, e as antigas passam o esquema congelado delas.
+        """
+        sqls = []
+        for tabela, colunas in esquema or cls.ESQUEMA:
+            alteraveis = ', '.join(nome for nome, _ in colunas if nome not in cls.COLUNAS_DERIVADAS)
+            registrar = ("INSERT INTO mudancas (tabela, registro_id, versao, pc_id, op) "
+                         f"VALUES ('{tabela}', {{0}}.id, {{0}}.versao, {{0}}.pc_id, {{1}})")
+            op_inserir = f"CASE WHEN EXISTS (SELECT 1 FROM {tabela} WHERE id = NEW.id) THEN 'atualizar' ELSE 'inserir' END"
+            sqls += [
+                f"DROP TRIGGER IF EXISTS trg_{tabela}_mudancas_inserir",
+                f"DROP TRIGGER IF EXISTS trg_{tabela}_mudancas_atualizar",
+                f"DROP TRIGGER IF EXISTS trg_{tabela}_mudancas_excluir",
+                f"""CREATE TRIGGER trg_{tabela}_mudancas_inserir
+                BEFORE INSERT ON {tabela}
+                BEGIN
+                    {registrar.format('NEW', op_inserir)};
+                END""",
+                f"""CREATE TRIGGER trg_{tabela}_mudancas_atualizar
+                AFTER UPDATE OF {alteraveis} ON {tabela}
+                BEGIN
+                    {registrar.format('NEW', "'atualizar'")};
+                END""",
+                f"""CREATE TRIGGER trg_{tabela}_mudancas_excluir
+                AFTER DELETE ON {tabela}
+                BEGIN
+                    {registrar.format('OLD', "'excluir'")};
+                END""",
+            ]
+        return sqls
+
+    def _migracao_mudancas(self, conn: sqlite3.Connection) -> None:
+        """
+        v8: diário de mudanças (change data capture) de pacientes e agendamentos.
+        seq é AUTOINCREMENT: nunca é reutilizado, nem depois da compactação. Os registros
+        existentes entram como 'inserir', então quem lê desde 0 recebe o banco inteiro.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mudancas (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tabela TEXT NOT NULL,
+                registro_id TEXT NOT NULL,
+                versao INTEGER,
+                pc_id TEXT,
+                op TEXT NOT NULL,
+                registrado_em TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'))
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_mudancas_registro ON mudancas(tabela, registro_id, seq)")
+        # Maior seq de exclusão já descartada pela compactação (ver mudancas_desde)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mudancas_horizonte (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                seq INTEGER NOT NULL
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO mudancas_horizonte (id, seq) VALUES (1, 0)")
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for tabela in ('pacientes', 'agendamentos'):
+            conn.execute(f"""
+                INSERT INTO mudancas (tabela, registro_id, versao, pc_id, op, registrado_em)
+                SELECT '{tabela}', id, versao, pc_id, 'inserir', COALESCE(ultima_modificacao, ?)
+                FROM {tabela} ORDER BY rowid
+            """, (agora,))
+        for sql in self._sql_triggers_mudancas(self.ESQUEMA_V8):
+            conn.execute(sql)
+
+    # Metadados de sincronização e de gravação local (o merge regrava data_salvamento,
+    # data_atualizacao e arquivo_origem em quem recebe): não entram no hash de conteúdo
+    COLUNAS_FORA_DO_HASH = (
+        'id', 'ultima_modificacao', 'versao', 'pc_id', 'arquivo_origem', 'data_salvamento', 'data_atualizacao',
+    )
+
+    @classmethod
+    def _colunas_hash(cls, tabela: str, esquema: Optional[Tuple] = None) -> Tuple[str, ...]:
+        colunas = dict(esquema or cls.ESQUEMA)[tabela]
+        return tuple(
+            nome for nome, _ in colunas
+            if nome not in cls.COLUNAS_FORA_DO_HASH and nome not in cls.COLUNAS_DERIVADAS
         )
+
+    @staticmethod
+    def calcular_hash_conteudo(valores: Iterable) -> str:
+        """Digest canônico (JSON compacto dos valores, na ordem de _colunas_hash)."""
+        bruto = json.dumps(list(valores), ensure_ascii=False, separators=(',', ':'), default=str)
+        return hashlib.blake2b(bruto.encode('utf-8'), digest_size=16).hexdigest()
+
+    @classmethod
+    def _sql_triggers_hash_conteudo(cls, esquema: Optional[Tuple] = None) -> List[str]:
         """
-        self.conn.execute(ddl_agendamentos)
-        # Adicionar novas colunas de sincronização para agendamentos se não existirem (migração)
-        try:
-            self.conn.execute("ALTER TABLE agendamentos ADD COLUMN pc_id TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE agendamentos ADD COLUMN ultima_modificacao TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE agendamentos ADD COLUMN versao INTEGER DEFAULT 1")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE agendamentos ADD COLUMN removido_em TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        try:
-            self.conn.execute("ALTER TABLE agendamentos ADD COLUMN removido_por TEXT")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # Coluna já existe
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamento_paciente ON agendamentos(paciente_id)")
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamento_data ON agendamentos(data_consulta)")
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_status ON agendamentos(status)")
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_pc_id ON agendamentos(pc_id)")
-        self.conn.commit()
+        Alterar um campo de conteúdo apaga o hash da linha (a menos que a própria instrução
+        grave outro); _preencher_hash_conteudo recalcula antes do COMMIT. INSERT OR REPLACE
+        já grava a linha nova com hash NULL. `esquema` como em _sql_triggers_mudancas.
+        """
+        sqls = []
+        for tabela in ('pacientes', 'agendamentos'):
+            sqls += [
+                f"DROP TRIGGER IF EXISTS trg_{tabela}_hash_invalidar",
+                f"""CREATE TRIGGER trg_{tabela}_hash_invalidar
+                AFTER UPDATE OF {', '.join(cls._colunas_hash(tabela, esquema))} ON {tabela}
+                WHEN OLD.hash_conteudo IS NOT NULL AND NEW.hash_conteudo IS OLD.hash_conteudo
+                BEGIN
+                    UPDATE {tabela} SET hash_conteudo = NULL WHERE rowid = NEW.rowid;
+                END""",
+            ]
+        return sqls
 
-    def _migrar_dados_existentes(self) -> None:
+    def _preencher_hash_conteudo(self, conn: sqlite3.Connection, ignorar_erros: bool = True,
+                                 esquema: Optional[Tuple] = None) -> int:
         """
-        Migra dados existentes preenchendo campos novos para registros antigos.
-        Mantém compatibilidade com dados que não possuem os novos campos.
+        Calcula hash_conteudo das linhas que estão sem (gravadas ou alteradas nesta
+        transação, ou por fora da aplicação). Roda antes de cada COMMIT da conexão de
+        escrita; sem pendências custa uma busca vazia no índice parcial de cada tabela.
         """
+        total = 0
         try:
-            # Migrar pacientes
-            cursor = self.conn.cursor()
-            
-            # Preencher pc_id, ultima_modificacao, versao, status para pacientes sem esses campos
-            cursor.execute("""
-                UPDATE pacientes 
-                SET 
-                    pc_id = ?,
-                    ultima_modificacao = COALESCE(ultima_modificacao, data_salvamento, ?),
-                    versao = COALESCE(versao, 1),
-                    status = COALESCE(status, 'ativo')
-                WHERE pc_id IS NULL OR ultima_modificacao IS NULL OR versao IS NULL OR status IS NULL
-            """, (self.pc_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            
-            # Migrar agendamentos
-            cursor.execute("""
-                UPDATE agendamentos 
-                SET 
-                    pc_id = ?,
-                    ultima_modificacao = COALESCE(ultima_modificacao, data_atualizacao, data_criacao, ?),
-                    versao = COALESCE(versao, 1)
-                WHERE pc_id IS NULL OR ultima_modificacao IS NULL OR versao IS NULL
-            """, (self.pc_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            
-            self.conn.commit()
-        except Exception:
-            # Se falhar a migração, continuar normalmente (compatibilidade)
-            pass
+            for tabela in ('pacientes', 'agendamentos'):
+                colunas = self._colunas_hash(tabela, esquema)
+                linhas = conn.execute(
+                    f"SELECT rowid, {', '.join(colunas)} FROM {tabela} WHERE hash_conteudo IS NULL"
+                ).fetchall()
+                if linhas:
+                    conn.executemany(
+                        f"UPDATE {tabela} SET hash_conteudo = ? WHERE rowid = ?",
+                        [(self.calcular_hash_conteudo(tuple(row)[1:]), row[0]) for row in linhas]
+                    )
+                    total += len(linhas)
+        except sqlite3.Error:
+            # Fica para o próximo COMMIT; quem lê trata hash ausente como "desconhecido"
+            if not ignorar_erros:
+                raise
+        return total
 
-    def close(self) -> None:
-        self.conn.close()
+    def _migracao_hash_conteudo(self, conn: sqlite3.Connection) -> None:
+        """
+        v9: hash_conteudo em pacientes e agendamentos (digest dos campos de conteúdo, sem
+        id/ultima_modificacao/versao/pc_id), para comparar registros no sync por uma string.
+        """
+        self._criar_ou_completar_tabela(conn, 'pacientes', self.COLUNAS_HASH_V9)
+        self._criar_ou_completar_tabela(conn, 'agendamentos', self.COLUNAS_HASH_V9)
+        # Índices parciais: só as linhas à espera do hash (normalmente nenhuma)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_hash_pendente ON pacientes(id) WHERE hash_conteudo IS NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_hash_pendente ON agendamentos(id) WHERE hash_conteudo IS NULL")
+        for sql in self._sql_triggers_hash_conteudo(self.ESQUEMA_V9) + self._sql_triggers_mudancas(self.ESQUEMA_V9):
+            conn.execute(sql)
+        self._preencher_hash_conteudo(conn, ignorar_erros=False, esquema=self.ESQUEMA_V9)
 
-    def testar_conexao(self) -> Dict:
-        """Testa a conexão com o banco de dados executando uma consulta simples"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT 1")
-            cursor.fetchone()
-            return {'status': 'ok', 'mensagem': 'Conexão estabelecida com sucesso'}
-        except Exception as e:
-            return {'status': 'erro', 'mensagem': f'Erro na conexão: {str(e)}'}
+    def _migracao_hash_sem_metadados_locais(self, conn: sqlite3.Connection) -> None:
+        """
+        v10: arquivo_origem, data_salvamento e data_atualizacao saem do hash (cada servidor
+        grava os seus, e os dois lados nunca convergiam na árvore de hashes do sync).
+        """
+        for sql in self._sql_triggers_hash_conteudo(self.ESQUEMA_V9):
+            conn.execute(sql)
+        conn.execute("UPDATE pacientes SET hash_conteudo = NULL")
+        conn.execute("UPDATE agendamentos SET hash_conteudo = NULL")
+        self._preencher_hash_conteudo(conn, ignorar_erros=False, esquema=self.ESQUEMA_V9)
 
-    def _row_to_dict(self, row: sqlite3.Row) -> Dict:
-        # sqlite3.Row não tem método .get(), então precisamos usar try/except ou verificar se a chave existe
-        estratificacao_problema = ''
-        try:
-            # Tentar acessar a coluna estratificacao_problema
-            estratificacao_problema = row['estratificacao_problema'] or ''
-        except (KeyError, IndexError):
-            # Coluna não existe ou não está disponível
-            estratificacao_problema = ''
-        
-        # Verificar se arquivo_origem existe na row
-        arquivo_origem = None
-        try:
-            # Verificar se a coluna existe usando keys()
-            if 'arquivo_origem' in row.keys():
-                arquivo_origem = row['arquivo_origem']
-        except (KeyError, IndexError):
-            # Coluna não existe
-            arquivo_origem = None
-        
-        # Verificar se inicio_pre_natal_semanas existe na row
-        inicio_pre_natal_semanas = None
-        try:
-            if 'inicio_pre_natal_semanas' in row.keys():
-                inicio_pre_natal_semanas = row['inicio_pre_natal_semanas']
-        except (KeyError, IndexError):
-            inicio_pre_natal_semanas = None
-        
-        # Verificar se inicio_pre_natal_observacao existe na row
-        inicio_pre_natal_observacao = ''
-        try:
-            if 'inicio_pre_natal_observacao' in row.keys():
-                inicio_pre_natal_observacao = row['inicio_pre_natal_observacao'] or ''
-        except (KeyError, IndexError):
-            inicio_pre_natal_observacao = ''
-        
-        # Verificar se proxima_avaliacao existe na row
-        proxima_avaliacao = None
-        try:
-            if 'proxima_avaliacao' in row.keys():
-                proxima_avaliacao = row['proxima_avaliacao']
-        except (KeyError, IndexError):
-            proxima_avaliacao = None
-        
-        # Verificar se proxima_avaliacao_hora existe na row
-        proxima_avaliacao_hora = None
-        try:
-            if 'proxima_avaliacao_hora' in row.keys():
-                proxima_avaliacao_hora = row['proxima_avaliacao_hora']
-        except (KeyError, IndexError):
-            proxima_avaliacao_hora = None
-        
-        # Verificar se dum existe na row
-        dum = None
-        try:
-            if 'dum' in row.keys():
-                dum = row['dum']
-        except (KeyError, IndexError):
-            dum = None
-        
-        # Verificar se dpp existe na row
-        dpp = None
-        try:
-            if 'dpp' in row.keys():
-                dpp = row['dpp']
-        except (KeyError, IndexError):
-            dpp = None
-        
-        # Verificar se ganhou_kit existe na row
-        ganhou_kit = None
+    def _migracao_sessoes_sync(self, conn: sqlite3.Connection) -> None:
+        """
+        v11: sessões de sincronização com cada peer (ver abrir_sessao_sync): cursor do sync
+        incremental gravado a cada página mesclada, contagens e tempo para a vazão.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessoes_sync (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                peer TEXT NOT NULL,
+                peer_pc_id TEXT,
+                estado TEXT NOT NULL,
+                cursor TEXT NOT NULL DEFAULT '',
+                paginas INTEGER NOT NULL DEFAULT 0,
+                registros INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                duracao_ms REAL NOT NULL DEFAULT 0,
+                retomadas INTEGER NOT NULL DEFAULT 0,
+                stats TEXT NOT NULL DEFAULT '{}',
+                erro TEXT,
+                iniciada_em TEXT NOT NULL,
+                atualizada_em TEXT NOT NULL,
+                concluida_em TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_sync_peer ON sessoes_sync(peer, id)")
+
+    def _migracao_indicadores_bolsa_covid(self, conn: sqlite3.Connection) -> None:
+        """
+        v12: bolsa família e covid com valor fora de 0/1/NULL deixam de contar como "não" no
+        rollup (como em _SQL_AGREGADOS_ESTATISTICAS). Recria os triggers e recalcula.
+        """
+        for sql in self._sql_triggers_indicadores_diarios():
+            conn.execute(sql)
+        self._recalcular_indicadores_diarios(conn)
+
+    def _migracao_indices_conflito(self, conn: sqlite3.Connection) -> None:
+        """
+        v13: índices parciais dos registros em conflito (listar_conflitos). Depois do ANALYZE
+        (otimizar_estatisticas), idx_*_status com quase tudo 'ativo' parece pouco seletivo e o
+        planejador passava a varrer pacientes inteira.
+        """
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_conflito ON pacientes(id) WHERE status = 'conflito'")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_conflito ON agendamentos(id) WHERE status = 'conflito'")
+
+    def mudancas_desde(self, seq: int = 0, limite: int = 1000, tabela: Optional[str] = None) -> Dict:
+        """
+        Mudanças com seq > `seq`, em ordem, no máximo `limite`. `ultimo_seq` é o cursor da
+        próxima chamada e `mais` indica que há outra página. `reiniciar`=True quando a
+        compactação já descartou exclusões posteriores a `seq`: o chamador precisa
+        recomeçar de uma cópia completa.
+        """
         try:
-            if 'ganhou_kit' in row.keys():
-                ganhou_kit = int_to_bool(row['ganhou_kit'])
-        except (KeyError, IndexError):
-            ganhou_kit = None
-        
-        # Verificar se kit_tipo existe na row
-        kit_tipo = None
+            seq = max(0, int(seq))
+            limite = max(1, min(int(limite), self.LIMITE_MAXIMO_PAGINA))
+        except (TypeError, ValueError):
+            return {'success': False, 'message': 'seq e limite devem ser números inteiros'}
+        if tabela is not None and tabela not in ('pacientes', 'agendamentos'):
+            return {'success': False, 'message': f'Tabela inválida: {tabela}'}
+        conn = self.conn
+        horizonte = conn.execute("SELECT seq FROM mudancas_horizonte WHERE id = 1").fetchone()
+        filtro, params = ("AND tabela = ? ", (tabela,)) if tabela else ("", ())
+        cursor = conn.execute(
+            "SELECT seq, tabela, registro_id, versao, pc_id, op, registrado_em FROM mudancas "
+            f"WHERE seq > ? {filtro}ORDER BY seq LIMIT ?",
+            (seq,) + params + (limite + 1,)
+        )
+        mudancas = [dict(row) for row in cursor.fetchall()]
+        mais = len(mudancas) > limite
+        del mudancas[limite:]
+        horizonte = horizonte[0] if horizonte else 0
+        return {
+            'success': True,
+            'mudancas': mudancas,
+            'ultimo_seq': mudancas[-1]['seq'] if mudancas else seq,
+            'mais': mais,
+            'reiniciar': seq < horizonte,
+            'horizonte': horizonte,
+        }
+
+    @_escrita
+    def compactar_mudancas(self, dias_exclusoes: int = 90) -> Dict:
+        """
+        Compacta o diário: mantém só a última mudança de cada registro (quem lê a partir de
+        qualquer seq continua vendo todos os registros alterados depois dele) e descarta
+        exclusões com mais de `dias_exclusoes` dias, avançando o horizonte de mudancas_desde.
+        """
         try:
-            if 'kit_tipo' in row.keys():
-                kit_tipo = row['kit_tipo']
-        except (KeyError, IndexError):
-            kit_tipo = None
-        
-        # Verificar novos campos de histórico reprodutivo
-        ja_ganhou_crianca = None
+            conn = self.conn
+            antes = conn.execute("SELECT COUNT(*) FROM mudancas").fetchone()[0]
+            conn.execute("""
+                DELETE FROM mudancas WHERE seq < (
+                    SELECT MAX(m.seq) FROM mudancas AS m
+                    WHERE m.tabela = mudancas.tabela AND m.registro_id = mudancas.registro_id
+                )
+            """)
+            limite = (datetime.now() - timedelta(days=max(0, int(dias_exclusoes)))).strftime('%Y-%m-%d %H:%M:%S')
+            horizonte = conn.execute(
+                "SELECT MAX(seq) FROM mudancas WHERE op = 'excluir' AND registrado_em < ?", (limite,)
+            ).fetchone()[0]
+            if horizonte is not None:
+                conn.execute("DELETE FROM mudancas WHERE op = 'excluir' AND seq <= ?", (horizonte,))
+                conn.execute("UPDATE mudancas_horizonte SET seq = MAX(seq, ?) WHERE id = 1", (horizonte,))
+            depois = conn.execute("SELECT COUNT(*) FROM mudancas").fetchone()[0]
+            conn.commit()
+            return {'success': True, 'message': f'{antes - depois} mudança(s) descartada(s)',
+                    'antes': antes, 'depois': depois}
+        except Exception as e:
+            self.conn.rollback()
+            return {'success': False, 'message': f'Erro ao compactar mudanças: {str(e)}'}
+
+    # Ids por consulta IN (...): abaixo do limite de 999 variáveis de SQLite antigos
+    TAMANHO_LOTE_IDS = 500
+
+    def _lotes_ids(self, ids: Iterable[str]) -> Iterable[List[str]]:
+        ids = list(dict.fromkeys(ids))
+        for i in range(0, len(ids), self.TAMANHO_LOTE_IDS):
+            yield ids[i:i + self.TAMANHO_LOTE_IDS]
+
+    def buscar_pacientes_por_ids(self, ids: Iterable[str], incluir_removidos: bool = True) -> List[Dict]:
+        """Pacientes com os ids pedidos (os inexistentes são ignorados), em lotes de IN (...)."""
+        pacientes: List[Dict] = []
+        filtro = "" if incluir_removidos else f" AND {self._SQL_ATIVO}"
+        for lote in self._lotes_ids(ids):
+            cursor = self.conn.execute(
+                f"SELECT * FROM pacientes WHERE id IN ({', '.join('?' * len(lote))}){filtro}", lote
+            )
+            pacientes.extend(self._linhas_para_dicts(cursor))
+        return pacientes
+
+    def buscar_agendamentos_por_ids(self, ids: Iterable[str], incluir_removidos: bool = False) -> List[Dict]:
+        """Agendamentos com os ids pedidos, no formato de listar_agendamentos, em lotes de IN (...)."""
+        agendamentos: List[Dict] = []
+        filtro = "" if incluir_removidos else " AND (a.status IS NULL OR a.status != 'removido')"
+        for lote in self._lotes_ids(ids):
+            cursor = self.conn.execute(f"""
+                SELECT a.*, p.nome_gestante, p.unidade_saude
+                FROM agendamentos a
+                LEFT JOIN pacientes p ON a.paciente_id = p.id
+                WHERE a.id IN ({', '.join('?' * len(lote))}){filtro}
+            """, lote)
+            agendamentos.extend(self._agendamento_para_dict(row) for row in cursor.fetchall())
+        return agendamentos
+
+    def dados_sincronizacao_desde(self, seq: int = 0, limite: int = 500, incluir_removidos: bool = False) -> Dict:
+        """
+        Página do sync incremental: os registros citados pelas próximas `limite` entradas do
+        diário (estado atual de cada um, com os mesmos filtros do sync completo). Diário e
+        registros são lidos no mesmo instantâneo. Exclusões de vez (op 'excluir') não vão na
+        página: como no sync completo, remoção só se propaga pelo status 'removido'.
+        """
+        with self.instantaneo():
+            pagina = self.mudancas_desde(seq, limite)
+            if not pagina['success']:
+                return pagina
+            ids: Dict[str, List[str]] = {'pacientes': [], 'agendamentos': []}
+            for mudanca in pagina['mudancas']:
+                ids[mudanca['tabela']].append(mudanca['registro_id'])
+            pacientes = self.buscar_pacientes_por_ids(ids['pacientes'], incluir_removidos)
+            agendamentos = self.buscar_agendamentos_por_ids(ids['agendamentos'])
+            # Contador do AUTOINCREMENT: não recua quando a compactação apaga as últimas linhas
+            seq_maximo = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'mudancas'"
+            ).fetchone()[0]
+        return {
+            'success': True,
+            'pacientes': pacientes,
+            'agendamentos': agendamentos,
+            'ultimo_seq': pagina['ultimo_seq'],
+            'seq_maximo': seq_maximo,
+            'mais': pagina['mais'],
+            'reiniciar': pagina['reiniciar'],
+            'horizonte': pagina['horizonte'],
+        }
+
+    def iterar_dados_sincronizacao(self, incluir_removidos: bool = False,
+                                   tamanho_lote: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Cópia completa do sync como gerador de (tabela, registro): pacientes e depois
+        agendamentos, com os filtros e a ordem de buscar_pacientes/listar_agendamentos.
+        Lê com fetchmany num instantâneo: só um lote de linhas fica em memória e a cópia
+        inteira vê o banco no mesmo ponto (reentrante: contagens feitas antes no mesmo
+        instantaneo() batem com o que é gerado).
+        """
+        tamanho_lote = max(1, int(tamanho_lote or self.TAMANHO_LOTE_MERGE))
+        filtro = "" if incluir_removidos else f" WHERE {self._SQL_ATIVO}"
+        with self.instantaneo():
+            cursor = self.conn.execute(f"SELECT * FROM pacientes{filtro} ORDER BY rowid")
+            decodificar = self._decodificador(tuple(d[0] for d in cursor.description))
+            for linhas in iter(lambda: cursor.fetchmany(tamanho_lote), []):
+                for row in linhas:
+                    yield 'pacientes', decodificar(row)
+            cursor = self.conn.execute("""
+                SELECT a.*, p.nome_gestante, p.unidade_saude
+                FROM agendamentos a
+                LEFT JOIN pacientes p ON a.paciente_id = p.id
+                WHERE (a.status IS NULL OR a.status != 'removido')
+                ORDER BY a.data_consulta ASC, a.hora_consulta ASC
+            """)
+            for linhas in iter(lambda: cursor.fetchmany(tamanho_lote), []):
+                for row in linhas:
+                    yield 'agendamentos', self._agendamento_para_dict(row)
+
+    def contar_dados_sincronizacao(self, incluir_removidos: bool = False) -> Dict[str, int]:
+        """Quantos registros iterar_dados_sincronizacao() vai gerar (para progresso)."""
+        filtro = "" if incluir_removidos else f" WHERE {self._SQL_ATIVO}"
+        return {
+            'pacientes': self.conn.execute(f"SELECT COUNT(*) FROM pacientes{filtro}").fetchone()[0],
+            'agendamentos': self.conn.execute(
+                f"SELECT COUNT(*) FROM agendamentos WHERE {self._SQL_ATIVO}"
+            ).fetchone()[0],
+        }
+
+    # Consultas quentes conferidas por verificar_planos_consulta(): cada entrada chama o
+    # método real com argumentos de exemplo e o SQL executado passa por EXPLAIN QUERY PLAN.
+    # (nome, chamada, listagem) — listagens podem percorrer um índice inteiro na ordem
+    # do ORDER BY ('SCAN t USING INDEX'); as demais precisam de SEARCH.
+    CONSULTAS_CRITICAS: Tuple[Tuple[str, Callable[['Database'], object], bool], ...] = (
+        ('buscar_paciente', lambda d: d.buscar_paciente('__verificacao__'), False),
+        ('buscar_pacientes por nome', lambda d: d.buscar_pacientes({'nome': 'maria'}), False),
+        ('pagina de pacientes', lambda d: d.buscar_pacientes_pagina(limite=50), True),
+        ('pagina de pacientes com cursor', lambda d: d.buscar_pacientes_pagina(
+            limite=50, cursor=d._codificar_cursor('data_salvamento', '2000-01-01', '')), False),
+        ('pagina por nome com cursor', lambda d: d.buscar_pacientes_pagina(
+            limite=50, ordenacao='-nome_gestante', cursor=d._codificar_cursor('-nome_gestante', 'M', '')), False),
+        ('estatisticas por unidade', lambda d: d.obter_estatisticas('__verificacao__'), False),
+        ('dados completos por unidade', lambda d: d.obter_contagem_dados_completos('__verificacao__'), False),
+        ('coluna por unidade', lambda d: d.obter_estatisticas_coluna('plano_parto', '__verificacao__'), False),
+        ('estatisticas temporais', lambda d: d.obter_estatisticas_temporais('plano_parto'), False),
+        ('agendamentos do paciente', lambda d: d.listar_agendamentos(paciente_id='__verificacao__'), False),
+        ('agendamentos por periodo', lambda d: d.listar_agendamentos(data_inicio='2000-01-01', data_fim='2000-01-31'), False),
+        ('agendamentos (lista)', lambda d: d.listar_agendamentos(), True),
+        ('obter_agendamento', lambda d: d.obter_agendamento('__verificacao__'), False),
+        ('conflitos', lambda d: d.listar_conflitos(), False),
+        ('mudancas desde', lambda d: d.mudancas_desde(0, 10), True),
+        ('mudancas desde por tabela', lambda d: d.mudancas_desde(0, 10, 'agendamentos'), True),
+    )
+
+    @staticmethod
+    def _varredura_completa(detalhe: str, listagem: bool) -> bool:
+        """
+        Linha de EXPLAIN QUERY PLAN que percorre a tabela inteira: 'SCAN t' sem índice,
+        ou 'SCAN t USING INDEX' fora das listagens. MATCH do FTS5 não conta.
+        """
+        if not detalhe.startswith('SCAN ') or 'VIRTUAL TABLE' in detalhe:
+            return False
+        return 'USING' not in detalhe or not listagem
+
+    def verificar_planos_consulta(self) -> Dict:
+        """
+        Roda CONSULTAS_CRITICAS e devolve o plano de cada SELECT executado. success=False
+        se algum plano virou varredura completa (índice faltando ou predicado que não bate
+        com o índice parcial).
+        """
+        conn = self.conn
+        executadas: List[str] = []
+        consultas = []
+        conn.set_trace_callback(executadas.append)
         try:
-            if 'ja_ganhou_crianca' in row.keys():
-                ja_ganhou_crianca = int_to_bool(row['ja_ganhou_crianca'])
-        except (KeyError, IndexError):
-            ja_ganhou_crianca = None
-        
-        data_ganhou_crianca = None
+            for nome, chamar, listagem in self.CONSULTAS_CRITICAS:
+                inicio = len(executadas)
+                chamar(self)
+                consultas.append((nome, listagem, executadas[inicio:]))
+        finally:
+            conn.set_trace_callback(None)
+
+        resultado = []
+        # Conexão nova: um EXPLAIN reaproveitado do cache de statements não é
+        # replanejado após mudança de schema (ex.: índice removido)
+        conn_plano = self._pool._abrir(somente_leitura=True)
         try:
-            if 'data_ganhou_crianca' in row.keys():
-                data_ganhou_crianca = row['data_ganhou_crianca']
-        except (KeyError, IndexError):
-            data_ganhou_crianca = None
-        
-        quantidade_filhos = None
+            for nome, listagem, sqls in consultas:
+                for sql in sqls:
+                    # Triggers aparecem como comentário; só interessam as leituras da aplicação
+                    # (o FTS5 também lê as próprias tabelas internas, pacientes_busca_*)
+                    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')) or 'pacientes_busca_' in sql:
+                        continue
+                    plano = [row[3] for row in conn_plano.execute('EXPLAIN QUERY PLAN ' + sql)]
+                    resultado.append({
+                        'consulta': nome,
+                        'sql': ' '.join(sql.split()),
+                        'plano': plano,
+                        'varreduras': [linha for linha in plano if self._varredura_completa(linha, listagem)],
+                    })
+        finally:
+            conn_plano.close()
+        falhas = [r for r in resultado if r['varreduras']]
+        return {
+            'success': not falhas,
+            'message': f'{len(falhas)} consulta(s) com varredura completa' if falhas else 'Todos os planos usam índice',
+            'consultas': resultado,
+        }
+
+    # Manutenção do arquivo (agendada por flask_app/manutencao.py)
+    MODOS_AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+    MODOS_CHECKPOINT = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+    def estado_armazenamento(self) -> Dict:
+        """Páginas do arquivo, páginas livres, modo de auto_vacuum e tamanho do -wal."""
+        conn = self.conn
+        paginas = conn.execute('PRAGMA page_count').fetchone()[0]
+        livres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        tamanho_pagina = conn.execute('PRAGMA page_size').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
         try:
-            if 'quantidade_filhos' in row.keys():
-                quantidade_filhos = row['quantidade_filhos']
-        except (KeyError, IndexError):
-            quantidade_filhos = None
-        
-        generos_filhos = None
+            wal_bytes = os.path.getsize(self.db_path + '-wal')
+        except OSError:
+            wal_bytes = 0
+        return {
+            'paginas': paginas,
+            'paginas_livres': livres,
+            'tamanho_pagina': tamanho_pagina,
+            'auto_vacuum': self.MODOS_AUTO_VACUUM.get(auto_vacuum, str(auto_vacuum)),
+            'wal_bytes': wal_bytes,
+        }
+
+    @_escrita
+    def checkpoint_wal(self, modo: str = 'PASSIVE') -> Dict:
+        """
+        PRAGMA wal_checkpoint. PASSIVE copia o que puder sem esperar leitores;
+        TRUNCATE espera, copia tudo e zera o arquivo -wal.
+        """
+        modo = (modo or '').upper()
+        if modo not in self.MODOS_CHECKPOINT:
+            return {'success': False, 'message': f'Modo de checkpoint inválido: {modo}'}
         try:
-            if 'generos_filhos' in row.keys():
-                generos_filhos = row['generos_filhos']
-        except (KeyError, IndexError):
-            generos_filhos = None
-        
-        metodo_preventivo = None
+            ocupado, paginas_log, paginas_copiadas = self.conn.execute(f'PRAGMA wal_checkpoint({modo})').fetchone()
+            return {
+                'success': not ocupado,
+                'message': 'Checkpoint concluído' if not ocupado else 'Checkpoint incompleto: banco ocupado',
+                'modo': modo,
+                'paginas_log': paginas_log,
+                'paginas_copiadas': paginas_copiadas,
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Erro no checkpoint: {str(e)}'}
+
+    @_escrita
+    def otimizar_estatisticas(self) -> Dict:
+        """
+        Atualiza as estatísticas do planejador. Sem sqlite_stat1 roda ANALYZE; depois,
+        PRAGMA optimize, que só reanalisa as tabelas que mudaram bastante. analysis_limit
+        amostra os índices para o custo não crescer com o banco.
+        """
         try:
-            if 'metodo_preventivo' in row.keys():
-                metodo_preventivo = row['metodo_preventivo']
-        except (KeyError, IndexError):
-            metodo_preventivo = None
-        
-        metodo_preventivo_outros = None
+            conn = self.conn
+            conn.execute('PRAGMA analysis_limit=1000')
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                # 0x10000: verifica todas as tabelas, não só as usadas por esta conexão
+                conn.execute('PRAGMA optimize=0x10002')
+                acao = 'optimize'
+            else:
+                conn.execute('ANALYZE')
+                acao = 'analyze'
+            conn.commit()
+            return {'success': True, 'message': 'Estatísticas atualizadas', 'acao': acao}
+        except Exception as e:
+            self.conn.rollback()
+            return {'success': False, 'message': f'Erro ao atualizar estatísticas: {str(e)}'}
+
+    @_escrita
+    def vacuum_incremental(self, paginas: int = 0, converter: bool = False) -> Dict:
+        """
+        Devolve ao sistema até `paginas` páginas livres (0 = todas) com PRAGMA
+        incremental_vacuum. Banco criado sem auto_vacuum=INCREMENTAL só é convertido com
+        `converter=True`: VACUUM completo (reescreve o arquivo e bloqueia as escritas),
+        seguido de reconstruir_busca_pacientes(). Sem ele, retorna success False.
+        """
+        conn = self.conn
+        if conn.in_transaction:
+            return {'success': False, 'message': 'VACUUM não pode rodar dentro de uma transação'}
         try:
-            if 'metodo_preventivo_outros' in row.keys():
-                metodo_preventivo_outros = row['metodo_preventivo_outros']
-        except (KeyError, IndexError):
-            metodo_preventivo_outros = None
-        
-        return {
-            'id': row['id'],
-            'data_salvamento': row['data_salvamento'],
-            'identificacao': {
-                'nome_gestante': row['nome_gestante'],
-                'unidade_saude': row['unidade_saude']
-            },
-            'avaliacao': {
-                'inicio_pre_natal_antes_12s': int_to_bool(row['inicio_pre_natal_antes_12s']),
-                'inicio_pre_natal_semanas': inicio_pre_natal_semanas,
-                'inicio_pre_natal_observacao': inicio_pre_natal_observacao,
-                'consultas_pre_natal': row['consultas_pre_natal'],
-                'vacinas_completas': row['vacinas_completas'] or '',
-                'plano_parto': int_to_bool(row['plano_parto']),
-                'participou_grupos': int_to_bool(row['participou_grupos']),
-                'avaliacao_odontologica': int_to_bool(row['avaliacao_odontologica']),
-                'estratificacao': int_to_bool(row['estratificacao']),
-                'estratificacao_problema': estratificacao_problema,
-                'cartao_pre_natal_completo': int_to_bool(row['cartao_pre_natal_completo']),
-                'possui_bolsa_familia': int_to_bool(row['possui_bolsa_familia']) if 'possui_bolsa_familia' in row.keys() else None,
-                'tem_vacina_covid': int_to_bool(row['tem_vacina_covid']) if 'tem_vacina_covid' in row.keys() else None,
-                'plano_parto_entregue_por_unidade': row['plano_parto_entregue_por_unidade'] if 'plano_parto_entregue_por_unidade' in row.keys() else None,
-                'dum': dum,
-                'dpp': dpp,
-                'ganhou_kit': ganhou_kit,
-                'kit_tipo': kit_tipo,
-                'proxima_avaliacao': proxima_avaliacao,
-                'proxima_avaliacao_hora': proxima_avaliacao_hora,
-                'ja_ganhou_crianca': ja_ganhou_crianca,
-                'data_ganhou_crianca': data_ganhou_crianca,
-                'quantidade_filhos': quantidade_filhos,
-                'generos_filhos': generos_filhos,
-                'metodo_preventivo': metodo_preventivo,
-                'metodo_preventivo_outros': metodo_preventivo_outros
-            },
-            'arquivo_origem': arquivo_origem
-        }
-        
-        # Adicionar campos de sincronização se existirem
+            modo = self.MODOS_AUTO_VACUUM.get(conn.execute('PRAGMA auto_vacuum').fetchone()[0])
+            if modo != 'incremental':
+                if not converter:
+                    return {
+                        'success': False,
+                        'message': f'auto_vacuum = {modo}: a conversão para incremental exige converter=True (VACUUM completo)',
+                        'convertido': False,
+                    }
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+                busca = self.reconstruir_busca_pacientes()
+                if self._busca_fts and not busca['success']:
+                    return busca
+                return {'success': True, 'message': 'Banco convertido para auto_vacuum incremental', 'convertido': True}
+            conn.execute(f'PRAGMA incremental_vacuum({max(0, int(paginas))})').fetchall()
+            conn.commit()
+            return {'success': True, 'message': 'Páginas livres devolvidas', 'convertido': False}
+        except Exception as e:
+            self.conn.rollback()
+            return {'success': False, 'message': f'Erro no VACUUM: {str(e)}'}
+
+    def close(self) -> None:
+        self._pool.fechar()
+
+    def testar_conexao(self) -> Dict:
+        """Testa a conexão com o banco de dados executando uma consulta simples"""
         try:
-            if 'pc_id' in row.keys():
-                result['pc_id'] = row['pc_id']
-            if 'ultima_modificacao' in row.keys():
-                result['ultima_modificacao'] = row['ultima_modificacao']
-            if 'versao' in row.keys():
-                result['versao'] = row['versao']
-            if 'status' in row.keys():
-                result['status'] = row['status']
-            if 'removido_em' in row.keys():
-                result['removido_em'] = row['removido_em']
-            if 'removido_por' in row.keys():
-                result['removido_por'] = row['removido_por']
-        except (KeyError, IndexError):
-            pass
-        
-        return result
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return {'status': 'ok', 'mensagem': 'Conexão estabelecida com sucesso'}
+        except Exception as e:
+            return {'status': 'erro', 'mensagem': f'Erro na conexão: {str(e)}'}
+
+    # Mapeamento coluna -> dict aninhado de paciente, na ordem das chaves da resposta.
+    # (coluna, destino, conversor, valor quando a coluna não está no SELECT)
+    CAMPOS_PACIENTE: Tuple[Tuple[str, str, Optional[Callable], object], ...] = (
+        ('id', 'raiz', None, None),
+        ('data_salvamento', 'raiz', None, None),
+        ('nome_gestante', 'identificacao', None, None),
+        ('unidade_saude', 'identificacao', None, None),
+        ('inicio_pre_natal_antes_12s', 'avaliacao', int_to_bool, None),
+        ('inicio_pre_natal_semanas', 'avaliacao', None, None),
+        ('inicio_pre_natal_observacao', 'avaliacao', _texto_ou_vazio, ''),
+        ('consultas_pre_natal', 'avaliacao', None, None),
+        ('vacinas_completas', 'avaliacao', _texto_ou_vazio, ''),
+        ('plano_parto', 'avaliacao', int_to_bool, None),
+        ('participou_grupos', 'avaliacao', int_to_bool, None),
+        ('avaliacao_odontologica', 'avaliacao', int_to_bool, None),
+        ('estratificacao', 'avaliacao', int_to_bool, None),
+        ('estratificacao_problema', 'avaliacao', _texto_ou_vazio, ''),
+        ('cartao_pre_natal_completo', 'avaliacao', int_to_bool, None),
+        ('possui_bolsa_familia', 'avaliacao', int_to_bool, None),
+        ('tem_vacina_covid', 'avaliacao', int_to_bool, None),
+        ('plano_parto_entregue_por_unidade', 'avaliacao', None, None),
+        ('dum', 'avaliacao', None, None),
+        ('dpp', 'avaliacao', None, None),
+        ('ganhou_kit', 'avaliacao', int_to_bool, None),
+        ('kit_tipo', 'avaliacao', None, None),
+        ('proxima_avaliacao', 'avaliacao', None, None),
+        ('proxima_avaliacao_hora', 'avaliacao', None, None),
+        ('ja_ganhou_crianca', 'avaliacao', int_to_bool, None),
+        ('data_ganhou_crianca', 'avaliacao', None, None),
+        ('quantidade_filhos', 'avaliacao', None, None),
+        ('generos_filhos', 'avaliacao', None, None),
+        ('metodo_preventivo', 'avaliacao', None, None),
+        ('metodo_preventivo_outros', 'avaliacao', None, None),
+        ('arquivo_origem', 'raiz', None, None),
+    )
+
+    # Campos de sincronização: só entram no dict se a coluna vier no SELECT
+    CAMPOS_SYNC_PACIENTE: Tuple[str, ...] = (
+        'pc_id', 'ultima_modificacao', 'versao', 'status', 'removido_em', 'removido_por', 'hash_conteudo',
+    )
+
+    def _decodificador(self, colunas: Tuple[str, ...], parcial: bool = False) -> Callable[[Tuple], Dict]:
+        """
+        Retorna (com cache por conjunto de colunas) uma função que converte uma linha
+        no dict aninhado de paciente. Os índices das colunas são resolvidos uma única
+        vez, então a conversão por linha não consulta row.keys().
+        Com parcial=True (projeção de campos), colunas fora do SELECT são omitidas
+        em vez de preenchidas com o valor padrão.
+        """
+        chave = (colunas, parcial)
+        decodificar = self._decodificadores.get(chave)
+        if decodificar is not None:
+            return decodificar
+
+        indices = {nome: i for i, nome in enumerate(colunas)}
+        planos: Dict[str, List[Tuple[str, Optional[int], Optional[Callable], object]]] = {
+            'raiz': [], 'identificacao': [], 'avaliacao': []
+        }
+        for coluna, destino, conversor, padrao in self.CAMPOS_PACIENTE:
+            if parcial and coluna not in indices:
+                continue
+            planos[destino].append((coluna, indices.get(coluna), conversor, padrao))
+        for coluna in self.CAMPOS_SYNC_PACIENTE:
+            if coluna in indices:
+                planos['raiz'].append((coluna, indices[coluna], None, None))
+        # Ordem da resposta: id, data_salvamento, identificacao, avaliacao, arquivo_origem, sync
+        raiz_antes = tuple(c for c in planos['raiz'] if c[0] in ('id', 'data_salvamento'))
+        raiz_depois = tuple(c for c in planos['raiz'] if c[0] not in ('id', 'data_salvamento'))
+        identificacao = tuple(planos['identificacao'])
+        avaliacao = tuple(planos['avaliacao'])
+
+        def montar(plano, row, destino):
+            for chave, i, conversor, padrao in plano:
+                if i is None:
+                    destino[chave] = padrao
+                elif conversor is None:
+                    destino[chave] = row[i]
+                else:
+                    destino[chave] = conversor(row[i])
+            return destino
+
+        def decodificar(row) -> Dict:
+            result = montar(raiz_antes, row, {})
+            result['identificacao'] = montar(identificacao, row, {})
+            result['avaliacao'] = montar(avaliacao, row, {})
+            return montar(raiz_depois, row, result)
+
+        self._decodificadores[chave] = decodificar
+        return decodificar
+
+    def _linhas_para_dicts(self, cursor: sqlite3.Cursor, parcial: bool = False) -> List[Dict]:
+        """Converte todas as linhas do cursor com um decodificador compilado para sua descrição."""
+        decodificar = self._decodificador(tuple(d[0] for d in cursor.description), parcial)
+        return [decodificar(row) for row in cursor.fetchall()]
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict:
+        return self._decodificador(tuple(row.keys()))(row)
 
     def gerar_id(self, nome: str, data_salvamento: Optional[str] = None) -> str:
         if not data_salvamento:
@@ -517,7 +1683,39 @@ class Database:
         nome_formatado = nome.strip().replace(' ', '_')
         return f"{nome_formatado}_{data_salvamento}"
 
-    def inserir_registro(
+    _SQL_INSERIR_PACIENTE = """
+        INSERT OR REPLACE INTO pacientes (
+            id, nome_gestante, unidade_saude, data_salvamento,
+            inicio_pre_natal_antes_12s, inicio_pre_natal_semanas, inicio_pre_natal_observacao,
+            consultas_pre_natal, vacinas_completas,
+            plano_parto, participou_grupos, avaliacao_odontologica,
+            estratificacao, estratificacao_problema, cartao_pre_natal_completo,
+            possui_bolsa_familia, tem_vacina_covid, plano_parto_entregue_por_unidade,
+            dum, dpp, ganhou_kit, kit_tipo, proxima_avaliacao, proxima_avaliacao_hora,
+            ja_ganhou_crianca, data_ganhou_crianca, quantidade_filhos, generos_filhos,
+            metodo_preventivo, metodo_preventivo_outros, arquivo_origem,
+            pc_id, ultima_modificacao, versao, status
+        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """
+
+    # Mesmas colunas e parâmetros de _SQL_INSERIR_PACIENTE, com o id no fim: atualiza a
+    # linha no lugar (mesmo rowid, sem o DELETE implícito do REPLACE)
+    _SQL_ATUALIZAR_PACIENTE = """
+        UPDATE pacientes SET
+            nome_gestante = ?, unidade_saude = ?, data_salvamento = ?,
+            inicio_pre_natal_antes_12s = ?, inicio_pre_natal_semanas = ?, inicio_pre_natal_observacao = ?,
+            consultas_pre_natal = ?, vacinas_completas = ?,
+            plano_parto = ?, participou_grupos = ?, avaliacao_odontologica = ?,
+            estratificacao = ?, estratificacao_problema = ?, cartao_pre_natal_completo = ?,
+            possui_bolsa_familia = ?, tem_vacina_covid = ?, plano_parto_entregue_por_unidade = ?,
+            dum = ?, dpp = ?, ganhou_kit = ?, kit_tipo = ?, proxima_avaliacao = ?, proxima_avaliacao_hora = ?,
+            ja_ganhou_crianca = ?, data_ganhou_crianca = ?, quantidade_filhos = ?, generos_filhos = ?,
+            metodo_preventivo = ?, metodo_preventivo_outros = ?, arquivo_origem = ?,
+            pc_id = ?, ultima_modificacao = ?, versao = ?, status = ?
+        WHERE id = ?
+    """
+
+    def _parametros_paciente(
         self,
         paciente_id: str,
         paciente_data: Dict,
@@ -527,7 +1725,8 @@ class Database:
         ultima_modificacao: Optional[str] = None,
         versao: Optional[int] = None,
         status: Optional[str] = None
-    ) -> Dict:
+    ) -> Tuple:
+        """Converte o payload aninhado (identificacao/avaliacao) nos parâmetros de _SQL_INSERIR_PACIENTE."""
         if not data_salvamento:
             data_salvamento = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         if not ultima_modificacao:
@@ -541,58 +1740,62 @@ class Database:
         
         identificacao = paciente_data.get('identificacao', {})
         avaliacao = paciente_data.get('avaliacao', {})
+        return (
+            paciente_id,
+            identificacao.get('nome_gestante', '').strip(),
+            identificacao.get('unidade_saude', '').strip(),
+            data_salvamento,
+            bool_to_int(avaliacao.get('inicio_pre_natal_antes_12s')),
+            avaliacao.get('inicio_pre_natal_semanas') if avaliacao.get('inicio_pre_natal_semanas') else None,
+            (avaliacao.get('inicio_pre_natal_observacao') or '').strip() or None,
+            avaliacao.get('consultas_pre_natal', 0),
+            avaliacao.get('vacinas_completas', '') or None,
+            bool_to_int(avaliacao.get('plano_parto')),
+            bool_to_int(avaliacao.get('participou_grupos')),
+            bool_to_int(avaliacao.get('avaliacao_odontologica')),
+            bool_to_int(avaliacao.get('estratificacao')),
+            (avaliacao.get('estratificacao_problema') or '').strip(),
+            bool_to_int(avaliacao.get('cartao_pre_natal_completo')),
+            bool_to_int(avaliacao.get('possui_bolsa_familia')),
+            bool_to_int(avaliacao.get('tem_vacina_covid')),
+            (avaliacao.get('plano_parto_entregue_por_unidade') or '').strip() or None,
+            (avaliacao.get('dum') or '').strip() or None,
+            (avaliacao.get('dpp') or '').strip() or None,
+            bool_to_int(avaliacao.get('ganhou_kit')),
+            (avaliacao.get('kit_tipo') or '').strip() or None,
+            (avaliacao.get('proxima_avaliacao') or '').strip() or None,
+            (avaliacao.get('proxima_avaliacao_hora') or '').strip() or None,
+            bool_to_int(avaliacao.get('ja_ganhou_crianca')),
+            (avaliacao.get('data_ganhou_crianca') or '').strip() or None,
+            avaliacao.get('quantidade_filhos') if avaliacao.get('quantidade_filhos') is not None else None,
+            (avaliacao.get('generos_filhos') or '').strip() or None,
+            (avaliacao.get('metodo_preventivo') or '').strip() or None,
+            (avaliacao.get('metodo_preventivo_outros') or '').strip() or None,
+            arquivo_origem,
+            pc_id,
+            ultima_modificacao,
+            versao,
+            status
+        )
+
+    @_escrita
+    def inserir_registro(
+        self,
+        paciente_id: str,
+        paciente_data: Dict,
+        arquivo_origem: Optional[str] = None,
+        data_salvamento: Optional[str] = None,
+        pc_id: Optional[str] = None,
+        ultima_modificacao: Optional[str] = None,
+        versao: Optional[int] = None,
+        status: Optional[str] = None
+    ) -> Dict:
         cursor = self.conn.cursor()
         cursor.execute(
-            """
-            INSERT OR REPLACE INTO pacientes (
-                id, nome_gestante, unidade_saude, data_salvamento,
-                inicio_pre_natal_antes_12s, inicio_pre_natal_semanas, inicio_pre_natal_observacao,
-                consultas_pre_natal, vacinas_completas,
-                plano_parto, participou_grupos, avaliacao_odontologica,
-                estratificacao,                 estratificacao_problema, cartao_pre_natal_completo,
-                possui_bolsa_familia, tem_vacina_covid, plano_parto_entregue_por_unidade,
-                dum, dpp, ganhou_kit, kit_tipo, proxima_avaliacao, proxima_avaliacao_hora,
-                ja_ganhou_crianca, data_ganhou_crianca, quantidade_filhos, generos_filhos,
-                metodo_preventivo, metodo_preventivo_outros, arquivo_origem,
+            self._SQL_INSERIR_PACIENTE,
+            self._parametros_paciente(
+                paciente_id, paciente_data, arquivo_origem, data_salvamento,
                 pc_id, ultima_modificacao, versao, status
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            """,
-            (
-                paciente_id,
-                identificacao.get('nome_gestante', '').strip(),
-                identificacao.get('unidade_saude', '').strip(),
-                data_salvamento,
-                bool_to_int(avaliacao.get('inicio_pre_natal_antes_12s')),
-                avaliacao.get('inicio_pre_natal_semanas') if avaliacao.get('inicio_pre_natal_semanas') else None,
-                (avaliacao.get('inicio_pre_natal_observacao') or '').strip() or None,
-                avaliacao.get('consultas_pre_natal', 0),
-                avaliacao.get('vacinas_completas', '') or None,
-                bool_to_int(avaliacao.get('plano_parto')),
-                bool_to_int(avaliacao.get('participou_grupos')),
-                bool_to_int(avaliacao.get('avaliacao_odontologica')),
-                bool_to_int(avaliacao.get('estratificacao')),
-                (avaliacao.get('estratificacao_problema') or '').strip(),
-                bool_to_int(avaliacao.get('cartao_pre_natal_completo')),
-                bool_to_int(avaliacao.get('possui_bolsa_familia')),
-                bool_to_int(avaliacao.get('tem_vacina_covid')),
-                (avaliacao.get('plano_parto_entregue_por_unidade') or '').strip() or None,
-                (avaliacao.get('dum') or '').strip() or None,
-                (avaliacao.get('dpp') or '').strip() or None,
-                bool_to_int(avaliacao.get('ganhou_kit')),
-                (avaliacao.get('kit_tipo') or '').strip() or None,
-                (avaliacao.get('proxima_avaliacao') or '').strip() or None,
-                (avaliacao.get('proxima_avaliacao_hora') or '').strip() or None,
-                bool_to_int(avaliacao.get('ja_ganhou_crianca')),
-                (avaliacao.get('data_ganhou_crianca') or '').strip() or None,
-                avaliacao.get('quantidade_filhos') if avaliacao.get('quantidade_filhos') is not None else None,
-                (avaliacao.get('generos_filhos') or '').strip() or None,
-                (avaliacao.get('metodo_preventivo') or '').strip() or None,
-                (avaliacao.get('metodo_preventivo_outros') or '').strip() or None,
-                arquivo_origem,
-                pc_id,
-                ultima_modificacao,
-                versao,
-                status
             )
         )
         self.conn.commit()
@@ -602,6 +1805,81 @@ class Database:
             'id': paciente_id
         }
 
+    @_escrita
+    def inserir_registros_em_lote(
+        self,
+        registros: Iterable[Dict],
+        arquivo_origem: Optional[str] = None,
+        tamanho_lote: int = 500
+    ) -> Dict:
+        """
+        Insere vários pacientes numa única transação, com executemany em blocos de tamanho_lote.
+
+        Cada registro é um payload no formato de backup/sync: identificacao, avaliacao e,
+        opcionalmente, id, data_salvamento, arquivo_origem, pc_id, ultima_modificacao,
+        versao e status. arquivo_origem (se informado) vale para registros que não trazem o seu.
+        Retorna o resultado por linha em 'resultados', na ordem de entrada.
+        """
+        tamanho_lote = max(1, int(tamanho_lote or 1))
+        resultados: List[Dict] = []
+        conn = self.conn
+        pendentes: List[Tuple[int, Tuple]] = []
+
+        def gravar_pendentes():
+            erros = self._executar_em_lote(self._SQL_INSERIR_PACIENTE, [params for _, params in pendentes])
+            for (indice, params), erro in zip(pendentes, erros):
+                if erro is not None:
+                    resultados[indice] = {'id': params[0], 'success': False, 'message': erro}
+            pendentes.clear()
+
+        try:
+            for registro in registros:
+                try:
+                    nome = (registro.get('identificacao') or {}).get('nome_gestante', '').strip()
+                    if not nome:
+                        raise ValueError('Nome da gestante é obrigatório')
+                    paciente_id = registro.get('id') or self.gerar_id(nome, registro.get('data_salvamento'))
+                    params = self._parametros_paciente(
+                        paciente_id,
+                        registro,
+                        arquivo_origem=registro.get('arquivo_origem') or arquivo_origem,
+                        data_salvamento=registro.get('data_salvamento'),
+                        pc_id=registro.get('pc_id'),
+                        ultima_modificacao=registro.get('ultima_modificacao'),
+                        versao=registro.get('versao'),
+                        status=registro.get('status')
+                    )
+                except Exception as e:
+                    id_registro = registro.get('id') if isinstance(registro, dict) else None
+                    resultados.append({'id': id_registro, 'success': False, 'message': str(e)})
+                    continue
+                pendentes.append((len(resultados), params))
+                resultados.append({'id': paciente_id, 'success': True})
+                if len(pendentes) >= tamanho_lote:
+                    gravar_pendentes()
+            if pendentes:
+                gravar_pendentes()
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao inserir lote: {str(e)}',
+                'inseridos': 0,
+                'falhas': len(resultados),
+                'resultados': resultados
+            }
+
+        inseridos = sum(1 for r in resultados if r['success'])
+        return {
+            'success': True,
+            'message': f'{inseridos} paciente(s) registrado(s)',
+            'inseridos': inseridos,
+            'falhas': len(resultados) - inseridos,
+            'resultados': resultados
+        }
+
+    @_transacional
     def adicionar_paciente(self, paciente_data: Dict) -> Dict:
         nome = paciente_data.get('identificacao', {}).get('nome_gestante', '').strip()
         data_salvamento = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -633,7 +1911,6 @@ class Database:
 
                 if not ja_existe:
                     # Criar agendamento
-                    import uuid
                     agendamento_id = str(uuid.uuid4())
 
                     agendamento_resultado = self.criar_agendamento(
@@ -657,32 +1934,140 @@ class Database:
         row = cursor.fetchone()
         return self._row_to_dict(row) if row else None
 
-    def buscar_pacientes(self, filtro: Optional[Dict] = None, incluir_removidos: bool = False) -> List[Dict]:
-        query = "SELECT * FROM pacientes"
-        params: Tuple[str, ...] = ()
+    # Registro ativo (não removido). Os índices parciais da migração v7 usam este mesmo
+    # predicado, e o SQLite só os escolhe quando ele aparece igual no WHERE da consulta.
+    _SQL_ATIVO = "(status IS NULL OR status != 'removido')"
+
+    def _clausulas_busca_pacientes(self, filtro: Optional[Dict], incluir_removidos: bool) -> Tuple[List[str], Tuple]:
+        params: Tuple = ()
         clauses = []
         
         # Filtrar removidos por padrão
         if not incluir_removidos:
-            clauses.append("(status IS NULL OR status != 'removido')")
+            clauses.append(self._SQL_ATIVO)
         
         if filtro:
             if 'nome' in filtro:
-                clauses.append("LOWER(nome_gestante) LIKE ?")
-                params += (f"%{filtro['nome'].lower()}%",)
+                # Com FTS5: prefixo de palavra, sem acento/caixa; sem FTS5: substring via LIKE
+                consulta = self._consulta_fts_nome(filtro['nome']) if self._busca_fts else None
+                if consulta:
+                    clauses.append("rowid IN (SELECT rowid FROM pacientes_busca WHERE pacientes_busca MATCH ?)")
+                    params += (consulta,)
+                else:
+                    clauses.append("LOWER(nome_gestante) LIKE ?")
+                    params += (f"%{filtro['nome'].lower()}%",)
             if 'unidade_saude' in filtro:
                 clauses.append("LOWER(unidade_saude) LIKE ?")
                 params += (f"%{filtro['unidade_saude'].lower()}%",)
             if 'status' in filtro:
                 clauses.append("status = ?")
                 params += (filtro['status'],)
-        
+        return clauses, params
+
+    def buscar_pacientes(self, filtro: Optional[Dict] = None, incluir_removidos: bool = False) -> List[Dict]:
+        clauses, params = self._clausulas_busca_pacientes(filtro, incluir_removidos)
+        query = "SELECT * FROM pacientes"
         if clauses:
             query += " WHERE " + " AND ".join(clauses)
+        # Ordem de inserção, explícita: sem ORDER BY o planejador pode percorrer um índice
+        # parcial (ex.: idx_pacientes_ativos_data) e mudar a ordem da lista
+        query += " ORDER BY rowid"
         cursor = self.conn.cursor()
         cursor.execute(query, params)
-        return [self._row_to_dict(row) for row in cursor.fetchall()]
+        return self._linhas_para_dicts(cursor)
+
+    # Ordenações aceitas por buscar_pacientes_pagina ('-' na frente = decrescente);
+    # id desempata e torna a chave do cursor única
+    ORDENACOES_PACIENTES: Tuple[str, ...] = (
+        'data_salvamento', 'nome_gestante', 'unidade_saude', 'ultima_modificacao', 'id',
+    )
+    LIMITE_MAXIMO_PAGINA = 1000
+
+    @staticmethod
+    def _codificar_cursor(ordenacao: str, valor, paciente_id: str) -> str:
+        bruto = json.dumps([ordenacao, valor, paciente_id], ensure_ascii=False).encode('utf-8')
+        return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _decodificar_cursor(cursor: str, ordenacao: str) -> Tuple[object, str]:
+        try:
+            bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            ordem_cursor, valor, paciente_id = json.loads(bruto.decode('utf-8'))
+        except (ValueError, TypeError):
+            raise ValueError('Cursor inválido')
+        if ordem_cursor != ordenacao:
+            raise ValueError('Cursor gerado com outra ordenação')
+        return valor, paciente_id
+
+    def buscar_pacientes_pagina(self, filtro: Optional[Dict] = None, incluir_removidos: bool = False,
+                                limite: Optional[int] = None, cursor: Optional[str] = None,
+                                ordenacao: Optional[str] = None,
+                                campos: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Variante paginada de buscar_pacientes. Ordenação, cursor (keyset na chave de
+        ordenação + id), limite e projeção de colunas vão para o SQL, então uma página
+        custa o mesmo em qualquer tamanho de tabela. next_cursor é None na última página.
+        """
+        ordenacao = ordenacao or 'data_salvamento'
+        decrescente = ordenacao.startswith('-')
+        coluna_ordem = ordenacao.lstrip('-')
+        if coluna_ordem not in self.ORDENACOES_PACIENTES:
+            return {'success': False, 'message': f'Ordenação inválida: {ordenacao}'}
+        if limite is not None and not 0 < limite <= self.LIMITE_MAXIMO_PAGINA:
+            return {'success': False, 'message': f'limit deve estar entre 1 e {self.LIMITE_MAXIMO_PAGINA}'}
+
+        if campos:
+            validos = {c[0] for c in self.CAMPOS_PACIENTE} | set(self.CAMPOS_SYNC_PACIENTE)
+            invalidos = [c for c in campos if c not in validos]
+            if invalidos:
+                return {'success': False, 'message': f'Campos inválidos: {", ".join(invalidos)}'}
+            # id e a coluna de ordenação sempre vêm: são a chave do cursor
+            selecionadas = list(dict.fromkeys(['id', coluna_ordem, *campos]))
+            colunas_sql = ', '.join(selecionadas)
+        else:
+            colunas_sql = '*'
+
+        chave = 'id' if coluna_ordem == 'id' else f"COALESCE({coluna_ordem}, '')"
+        direcao = 'DESC' if decrescente else 'ASC'
+        clauses, params = self._clausulas_busca_pacientes(filtro, incluir_removidos)
+        if cursor:
+            try:
+                valor, ultimo_id = self._decodificar_cursor(cursor, ordenacao)
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}
+            comparador = '<' if decrescente else '>'
+            if coluna_ordem == 'id':
+                clauses.append(f"id {comparador} ?")
+                params += (ultimo_id,)
+            else:
+                # Equivale a (chave, id) > (?, ?), mas na forma que o SQLite usa como
+                # faixa no índice de expressão (a comparação de row value vira SCAN)
+                clauses.append(f"{chave} {comparador}= ? AND ({chave} {comparador} ? OR id {comparador} ?)")
+                params += (valor, valor, ultimo_id)
+
+        query = f"SELECT {colunas_sql} FROM pacientes"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += f" ORDER BY {chave} {direcao}" + ("" if coluna_ordem == 'id' else f", id {direcao}")
+        if limite is not None:
+            # Uma linha a mais indica se existe próxima página
+            query += " LIMIT ?"
+            params += (limite + 1,)
+
+        cur = self.conn.cursor()
+        cur.execute(query, params)
+        pacientes = self._linhas_para_dicts(cur, parcial=bool(campos))
+        next_cursor = None
+        if limite is not None and len(pacientes) > limite:
+            pacientes = pacientes[:limite]
+            ultimo = pacientes[-1]
+            valor = ultimo.get(coluna_ordem)
+            if valor is None:
+                valor = (ultimo.get('identificacao') or {}).get(coluna_ordem)
+            next_cursor = self._codificar_cursor(ordenacao, valor if valor is not None else '', ultimo['id'])
+        return {'success': True, 'pacientes': pacientes, 'next_cursor': next_cursor}
 
+    @_transacional
     def atualizar_paciente(self, paciente_id: str, paciente_data: Dict) -> Dict:
         paciente_existente = self.buscar_paciente(paciente_id)
         if not paciente_existente:
@@ -715,6 +2100,7 @@ class Database:
 
         return resultado
 
+    @_escrita
     def _gerenciar_agendamento_proxima_avaliacao(self, paciente_id: str, paciente_data: Dict, paciente_antigo: Dict = None):
         """Gerencia agendamento automático da próxima avaliação"""
         proxima_avaliacao = paciente_data.get('avaliacao', {}).get('proxima_avaliacao')
@@ -757,7 +2143,6 @@ class Database:
                 )
             else:
                 # Criar novo agendamento
-                import uuid
                 agendamento_id = str(uuid.uuid4())
 
                 agendamento_resultado = self.criar_agendamento(
@@ -781,58 +2166,107 @@ class Database:
     def obter_todos_pacientes(self) -> List[Dict]:
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM pacientes ORDER BY data_salvamento DESC")
-        return [self._row_to_dict(row) for row in cursor.fetchall()]
+        return self._linhas_para_dicts(cursor)
 
     def obter_unidades_saude_unicas(self) -> List[str]:
-        """Retorna lista de unidades de saúde únicas"""
+        """Retorna lista de unidades de saúde únicas (uma por unidade, com pacientes cadastrados)"""
         cursor = self.conn.cursor()
-        cursor.execute("SELECT DISTINCT unidade_saude FROM pacientes WHERE unidade_saude IS NOT NULL AND unidade_saude != '' ORDER BY unidade_saude")
-        rows = cursor.fetchall()
-        return [row['unidade_saude'] for row in rows if row['unidade_saude']]
+        cursor.execute("""
+            SELECT nome FROM unidades u
+            WHERE EXISTS (SELECT 1 FROM pacientes p WHERE p.unidade_id = u.id)
+            ORDER BY nome
+        """)
+        return [row['nome'] for row in cursor.fetchall()]
 
-    def obter_estatisticas(self, unidade_saude: Optional[str] = None) -> Dict:
-        cursor = self.conn.cursor()
+    # Filtro por unidade: busca indexada em unidade_id (mesma igualdade de LOWER(unidade_saude) = LOWER(?))
+    _SQL_FILTRO_UNIDADE = "unidade_id = (SELECT id FROM unidades WHERE chave = LOWER(?))"
+
+    # Agregados de obter_estatisticas, calculados no SQLite (mesmos baldes da contagem em Python:
+    # vacinas por substring 'completa' antes de 'incompleta'; NULL conta como "não" em bolsa família e covid)
+    _SQL_AGREGADOS_ESTATISTICAS = """
+        COUNT(*) AS total_pacientes,
+        COALESCE(SUM(CASE WHEN inicio_pre_natal_antes_12s = 1 THEN 1 ELSE 0 END), 0) AS inicio_sim,
+        COALESCE(SUM(CASE WHEN inicio_pre_natal_antes_12s = 0 THEN 1 ELSE 0 END), 0) AS inicio_nao,
+        COALESCE(SUM(CASE WHEN COALESCE(consultas_pre_natal, 0) >= 6 THEN 1 ELSE 0 END), 0) AS consultas_mais_6,
+        COALESCE(SUM(CASE WHEN COALESCE(consultas_pre_natal, 0) < 6 THEN 1 ELSE 0 END), 0) AS consultas_ate_6,
+        COALESCE(SUM(CASE WHEN INSTR(LOWER(COALESCE(vacinas_completas, '')), 'completa') > 0 THEN 1 ELSE 0 END), 0) AS vacinas_completa,
+        COALESCE(SUM(CASE WHEN INSTR(LOWER(COALESCE(vacinas_completas, '')), 'completa') = 0
+                           AND INSTR(LOWER(COALESCE(vacinas_completas, '')), 'incompleta') > 0 THEN 1 ELSE 0 END), 0) AS vacinas_incompleta,
+        COALESCE(SUM(CASE WHEN INSTR(LOWER(COALESCE(vacinas_completas, '')), 'completa') = 0
+                           AND INSTR(LOWER(COALESCE(vacinas_completas, '')), 'incompleta') = 0 THEN 1 ELSE 0 END), 0) AS vacinas_nao_avaliado,
+        COALESCE(SUM(CASE WHEN plano_parto = 1 THEN 1 ELSE 0 END), 0) AS plano_parto_sim,
+        COALESCE(SUM(CASE WHEN plano_parto = 0 THEN 1 ELSE 0 END), 0) AS plano_parto_nao,
+        COALESCE(SUM(CASE WHEN participou_grupos = 1 THEN 1 ELSE 0 END), 0) AS grupos_sim,
+        COALESCE(SUM(CASE WHEN participou_grupos = 0 THEN 1 ELSE 0 END), 0) AS grupos_nao,
+        COALESCE(SUM(CASE WHEN possui_bolsa_familia = 1 THEN 1 ELSE 0 END), 0) AS bolsa_sim,
+        COALESCE(SUM(CASE WHEN possui_bolsa_familia = 0 OR possui_bolsa_familia IS NULL THEN 1 ELSE 0 END), 0) AS bolsa_nao,
+        COALESCE(SUM(CASE WHEN tem_vacina_covid = 1 THEN 1 ELSE 0 END), 0) AS covid_sim,
+        COALESCE(SUM(CASE WHEN tem_vacina_covid = 0 OR tem_vacina_covid IS NULL THEN 1 ELSE 0 END), 0) AS covid_nao
+    """
+
+    @staticmethod
+    def _estatisticas_da_linha(row) -> Dict:
+        """Monta o dict de obter_estatisticas a partir de uma linha de _SQL_AGREGADOS_ESTATISTICAS."""
+        return {
+            'total_pacientes': row['total_pacientes'],
+            'ultima_atualizacao': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'inicio_pre_natal_antes_12s': {'sim': row['inicio_sim'], 'nao': row['inicio_nao']},
+            'consultas_pre_natal': {'ate_6': row['consultas_ate_6'], 'mais_6': row['consultas_mais_6']},
+            'vacinas_completas': {
+                'completa': row['vacinas_completa'],
+                'incompleta': row['vacinas_incompleta'],
+                'nao_avaliado': row['vacinas_nao_avaliado']
+            },
+            'plano_parto': {'sim': row['plano_parto_sim'], 'nao': row['plano_parto_nao']},
+            'participou_grupos': {'sim': row['grupos_sim'], 'nao': row['grupos_nao']},
+            'possui_bolsa_familia': {'sim': row['bolsa_sim'], 'nao': row['bolsa_nao']},
+            'tem_vacina_covid': {'sim': row['covid_sim'], 'nao': row['covid_nao']}
+        }
+
+    def _somar_indicadores_diarios(self, unidade_saude: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """{indicador: {balde: total}} somando todas as datas de indicadores_diarios."""
+        sql = "SELECT indicador, balde, SUM(total) AS total FROM indicadores_diarios"
+        params: Tuple = ()
         if unidade_saude:
-            cursor.execute("SELECT * FROM pacientes WHERE LOWER(unidade_saude) = LOWER(?)", (unidade_saude,))
-        else:
-            cursor.execute("SELECT * FROM pacientes")
-        rows = cursor.fetchall()
-        stats = {
-            'total_pacientes': len(rows),
+            sql += " WHERE unidade = LOWER(?)"
+            params = (unidade_saude,)
+        cursor = self.conn.cursor()
+        cursor.execute(sql + " GROUP BY indicador, balde", params)
+        somas: Dict[str, Dict[str, int]] = {}
+        for row in cursor.fetchall():
+            somas.setdefault(row['indicador'], {})[row['balde']] = row['total']
+        return somas
+
+    def obter_estatisticas(self, unidade_saude: Optional[str] = None) -> Dict:
+        # Lê só a tabela indicadores_diarios (mantida por triggers), não pacientes
+        somas = self._somar_indicadores_diarios(unidade_saude)
+
+        def baldes(indicador: str, *nomes: str) -> Dict[str, int]:
+            valores = somas.get(indicador, {})
+            return {nome: valores.get(nome, 0) for nome in nomes}
+
+        return {
+            'total_pacientes': somas.get('total', {}).get('total', 0),
             'ultima_atualizacao': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'inicio_pre_natal_antes_12s': {'sim': 0, 'nao': 0},
-            'consultas_pre_natal': {'ate_6': 0, 'mais_6': 0},
-            'vacinas_completas': {'completa': 0, 'incompleta': 0, 'nao_avaliado': 0},
-            'plano_parto': {'sim': 0, 'nao': 0},
-            'participou_grupos': {'sim': 0, 'nao': 0},
-            'possui_bolsa_familia': {'sim': 0, 'nao': 0},
-            'tem_vacina_covid': {'sim': 0, 'nao': 0}
+            'inicio_pre_natal_antes_12s': baldes('inicio_pre_natal_antes_12s', 'sim', 'nao'),
+            'consultas_pre_natal': baldes('consultas_pre_natal', 'ate_6', 'mais_6'),
+            'vacinas_completas': baldes('vacinas_completas', 'completa', 'incompleta', 'nao_avaliado'),
+            'plano_parto': baldes('plano_parto', 'sim', 'nao'),
+            'participou_grupos': baldes('participou_grupos', 'sim', 'nao'),
+            'possui_bolsa_familia': baldes('possui_bolsa_familia', 'sim', 'nao'),
+            'tem_vacina_covid': baldes('tem_vacina_covid', 'sim', 'nao')
         }
-        for row in rows:
-            inicio = row['inicio_pre_natal_antes_12s']
-            stats['inicio_pre_natal_antes_12s']['sim'] += 1 if inicio == 1 else 0
-            stats['inicio_pre_natal_antes_12s']['nao'] += 1 if inicio == 0 else 0
-            num_consultas = row['consultas_pre_natal'] or 0
-            stats['consultas_pre_natal']['mais_6'] += 1 if num_consultas >= 6 else 0
-            stats['consultas_pre_natal']['ate_6'] += 1 if num_consultas < 6 else 0
-            vacinas = (row['vacinas_completas'] or '').lower()
-            if 'completa' in vacinas:
-                stats['vacinas_completas']['completa'] += 1
-            elif 'incompleta' in vacinas:
-                stats['vacinas_completas']['incompleta'] += 1
-            else:
-                stats['vacinas_completas']['nao_avaliado'] += 1
-            stats['plano_parto']['sim'] += 1 if row['plano_parto'] == 1 else 0
-            stats['plano_parto']['nao'] += 1 if row['plano_parto'] == 0 else 0
-            stats['participou_grupos']['sim'] += 1 if row['participou_grupos'] == 1 else 0
-            stats['participou_grupos']['nao'] += 1 if row['participou_grupos'] == 0 else 0
-            bf = row['possui_bolsa_familia'] if 'possui_bolsa_familia' in row.keys() else None
-            stats['possui_bolsa_familia']['sim'] += 1 if bf == 1 else 0
-            stats['possui_bolsa_familia']['nao'] += 1 if bf == 0 or bf is None else 0
-            vc = row['tem_vacina_covid'] if 'tem_vacina_covid' in row.keys() else None
-            stats['tem_vacina_covid']['sim'] += 1 if vc == 1 else 0
-            stats['tem_vacina_covid']['nao'] += 1 if vc == 0 or vc is None else 0
-        return stats
+
+    # Completo = todos os 7 critérios do ranking com valor válido (sim/nao ou equivalente)
+    _SQL_DADOS_COMPLETOS = """
+        inicio_pre_natal_antes_12s IN (0, 1)
+        AND consultas_pre_natal IS NOT NULL
+        AND vacinas_completas IS NOT NULL AND TRIM(COALESCE(vacinas_completas, '')) != ''
+        AND plano_parto IN (0, 1)
+        AND participou_grupos IN (0, 1)
+        AND possui_bolsa_familia IS NOT NULL AND possui_bolsa_familia IN (0, 1)
+        AND tem_vacina_covid IS NOT NULL AND tem_vacina_covid IN (0, 1)
+    """
 
     def obter_contagem_dados_completos(
         self, unidade_saude: Optional[str] = None
@@ -841,20 +2275,12 @@ class Database:
         Completo = todos os 7 critérios do ranking com valor válido (sim/nao ou equivalente)."""
         cursor = self.conn.cursor()
         base = "FROM pacientes"
-        where = "WHERE LOWER(unidade_saude) = LOWER(?)" if unidade_saude else ""
+        where = f"WHERE {self._SQL_FILTRO_UNIDADE}" if unidade_saude else ""
         params: Tuple = (unidade_saude,) if unidade_saude else ()
         sql = f"""
         SELECT
             COUNT(*) AS total,
-            SUM(CASE WHEN
-                inicio_pre_natal_antes_12s IN (0, 1)
-                AND consultas_pre_natal IS NOT NULL
-                AND vacinas_completas IS NOT NULL AND TRIM(COALESCE(vacinas_completas, '')) != ''
-                AND plano_parto IN (0, 1)
-                AND participou_grupos IN (0, 1)
-                AND possui_bolsa_familia IS NOT NULL AND possui_bolsa_familia IN (0, 1)
-                AND tem_vacina_covid IS NOT NULL AND tem_vacina_covid IN (0, 1)
-            THEN 1 ELSE 0 END) AS completos
+            SUM(CASE WHEN {self._SQL_DADOS_COMPLETOS} THEN 1 ELSE 0 END) AS completos
         """ + base + (" " + where if where else "")
         cursor.execute(sql, params)
         row = cursor.fetchone()
@@ -862,60 +2288,80 @@ class Database:
         completos = int(row["completos"] or 0)
         return (total, completos)
 
+    def obter_estatisticas_por_unidade(self) -> Dict[str, Dict]:
+        """
+        Estatísticas e contagem de dados completos de todas as unidades numa única
+        consulta agrupada por unidade_id. Retorna {unidade: {'estatisticas', 'total', 'completos'}}
+        para as mesmas unidades (e na mesma ordem) de obter_unidades_saude_unicas();
+        cada entrada equivale a obter_estatisticas(u) + obter_contagem_dados_completos(u).
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT u.nome AS unidade, c.*
+            FROM (
+                SELECT unidade_id, {self._SQL_AGREGADOS_ESTATISTICAS},
+                    COALESCE(SUM(CASE WHEN {self._SQL_DADOS_COMPLETOS} THEN 1 ELSE 0 END), 0) AS completos
+                FROM pacientes
+                WHERE unidade_id IS NOT NULL
+                GROUP BY unidade_id
+            ) AS c
+            JOIN unidades u ON u.id = c.unidade_id
+            ORDER BY u.nome
+        """)
+        resultado = {}
+        for row in cursor.fetchall():
+            resultado[row['unidade']] = {
+                'estatisticas': self._estatisticas_da_linha(row),
+                'total': row['total_pacientes'],
+                'completos': row['completos']
+            }
+        return resultado
+
+    def _info_coluna_pacientes(self, nome_coluna: str) -> Optional[str]:
+        """Tipo (em maiúsculas) de uma coluna de pacientes, ou None se não existir."""
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA table_info(pacientes)")
+        coluna_info = next((col for col in cursor.fetchall() if col['name'] == nome_coluna), None)
+        if coluna_info is None:
+            return None
+        return coluna_info['type'].upper()
+
+    @staticmethod
+    def _classificador_coluna(tipo_coluna: str) -> Callable[[object], bool]:
+        """Regra sim/não de obter_estatisticas_coluna conforme o tipo da coluna."""
+        if 'INTEGER' in tipo_coluna:
+            # Para campos INTEGER (booleanos): 1 = sim, 0/null = não
+            return lambda valor: (valor if valor is not None else 0) == 1
+        if 'TEXT' in tipo_coluna:
+            # Para campos TEXT: não nulo/vazio = sim, nulo/vazio = não
+            return lambda valor: bool(valor and str(valor).strip())
+        # Para outros tipos: não nulo = sim
+        return lambda valor: valor is not None
+
     def obter_estatisticas_coluna(self, nome_coluna: str, unidade_saude: Optional[str] = None) -> Dict:
         """Obtém estatísticas genéricas de uma coluna específica do BD"""
         try:
             # Verificar se a coluna existe
-            cursor = self.conn.cursor()
-            cursor.execute("PRAGMA table_info(pacientes)")
-            colunas_info = cursor.fetchall()
-            colunas_existentes = {col['name'] for col in colunas_info}
-            
-            if nome_coluna not in colunas_existentes:
+            tipo_coluna = self._info_coluna_pacientes(nome_coluna)
+            if tipo_coluna is None:
                 return {
                     'success': False,
                     'message': f'Coluna {nome_coluna} não encontrada',
                     'data': {'sim': 0, 'nao': 0}
                 }
             
-            # Obter tipo da coluna
-            coluna_info = next((col for col in colunas_info if col['name'] == nome_coluna), None)
-            tipo_coluna = coluna_info['type'].upper() if coluna_info else 'TEXT'
-            
             # Buscar dados
+            cursor = self.conn.cursor()
             if unidade_saude:
-                cursor.execute("SELECT {} FROM pacientes WHERE LOWER(unidade_saude) = LOWER(?)".format(nome_coluna), (unidade_saude,))
+                cursor.execute("SELECT {} FROM pacientes WHERE {}".format(nome_coluna, self._SQL_FILTRO_UNIDADE), (unidade_saude,))
             else:
                 cursor.execute("SELECT {} FROM pacientes".format(nome_coluna))
-            rows = cursor.fetchall()
             
             # Processar dados baseado no tipo
+            e_sim = self._classificador_coluna(tipo_coluna)
             stats = {'sim': 0, 'nao': 0}
-            
-            if 'INTEGER' in tipo_coluna:
-                # Para campos INTEGER (booleanos): 1 = sim, 0/null = não
-                for row in rows:
-                    valor = row[nome_coluna] if row[nome_coluna] is not None else 0
-                    if valor == 1:
-                        stats['sim'] += 1
-                    else:
-                        stats['nao'] += 1
-            elif 'TEXT' in tipo_coluna:
-                # Para campos TEXT: não nulo/vazio = sim, nulo/vazio = não
-                for row in rows:
-                    valor = row[nome_coluna]
-                    if valor and str(valor).strip():
-                        stats['sim'] += 1
-                    else:
-                        stats['nao'] += 1
-            else:
-                # Para outros tipos, usar mesma lógica de TEXT
-                for row in rows:
-                    valor = row[nome_coluna]
-                    if valor is not None:
-                        stats['sim'] += 1
-                    else:
-                        stats['nao'] += 1
+            for row in cursor.fetchall():
+                stats['sim' if e_sim(row[0]) else 'nao'] += 1
             
             return {
                 'success': True,
@@ -928,6 +2374,30 @@ class Database:
                 'data': {'sim': 0, 'nao': 0}
             }
 
+    def obter_estatisticas_coluna_por_unidade(self, nome_coluna: str) -> Dict:
+        """
+        obter_estatisticas_coluna para todas as unidades numa única leitura da tabela.
+        Retorna {'success', 'data': {unidade: {'sim', 'nao'}}}.
+        """
+        try:
+            tipo_coluna = self._info_coluna_pacientes(nome_coluna)
+            if tipo_coluna is None:
+                return {'success': False, 'message': f'Coluna {nome_coluna} não encontrada', 'data': {}}
+            e_sim = self._classificador_coluna(tipo_coluna)
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT u.nome, p.{} FROM pacientes p JOIN unidades u ON u.id = p.unidade_id "
+                "ORDER BY u.nome".format(nome_coluna)
+            )
+            contagens: Dict[str, Dict[str, int]] = {}
+            for unidade, valor in cursor.fetchall():
+                stats = contagens.setdefault(unidade, {'sim': 0, 'nao': 0})
+                stats['sim' if e_sim(valor) else 'nao'] += 1
+            return {'success': True, 'data': contagens}
+        except Exception as e:
+            return {'success': False, 'message': str(e), 'data': {}}
+
+    @_escrita
     def limpar_todos_dados(self) -> None:
         # Excluir agendamentos primeiro (devido à foreign key)
         self.conn.execute("DELETE FROM agendamentos")
@@ -936,6 +2406,7 @@ class Database:
         self.conn.commit()
         return {'success': True, 'message': 'Todos os dados foram excluídos com sucesso'}
 
+    @_escrita
     def deletar_paciente(self, paciente_id: str) -> Dict:
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM pacientes WHERE id = ?", (paciente_id,))
@@ -952,127 +2423,83 @@ class Database:
             'data_backup': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
-    def obter_estatisticas_temporais(self, filtro: str) -> Dict:
+    # Rótulos do gráfico temporal por indicador: (balde, rótulo)
+    ROTULOS_TEMPORAIS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+        'inicio_pre_natal_antes_12s': (('sim', 'Sim'), ('nao', 'Não')),
+        'consultas_pre_natal': (('mais_6', '≥ 6 consultas'), ('ate_6', '< 6 consultas')),
+        'vacinas_completas': (('completa', 'Completo'), ('incompleta', 'Incompleto'), ('nao_avaliado', 'Não avaliado')),
+        'plano_parto': (('sim', 'Sim'), ('nao', 'Não')),
+        'participou_grupos': (('sim', 'Participou'), ('nao', 'Não participou')),
+        'possui_bolsa_familia': (('sim', 'Sim'), ('nao', 'Não')),
+        'tem_vacina_covid': (('sim', 'Sim'), ('nao', 'Não')),
+    }
+
+    def obter_estatisticas_temporais(self, filtro: str, unidade_saude: Optional[str] = None) -> Dict:
         """Retorna estatísticas temporais agrupadas por data para um indicador específico"""
+        # Lê só indicadores_diarios; o custo depende do nº de dias/unidades, não de pacientes
+        filtro_unidade = " AND unidade = LOWER(?)" if unidade_saude else ""
+        params: Tuple = (unidade_saude,) if unidade_saude else ()
         cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM pacientes ORDER BY data_salvamento ASC")
-        rows = cursor.fetchall()
-        
-        # Agrupar por data
-        dados_por_data = {}
-        
-        for row in rows:
-            data_salvamento = row['data_salvamento']
-            if not data_salvamento:
-                continue
-            
-            # Extrair apenas a data (sem hora)
-            data = data_salvamento.split(' ')[0] if ' ' in data_salvamento else data_salvamento
-            
-            if data not in dados_por_data:
-                dados_por_data[data] = {
-                    'inicio_pre_natal_antes_12s': {'sim': 0, 'nao': 0},
-                    'consultas_pre_natal': {'ate_6': 0, 'mais_6': 0},
-                    'vacinas_completas': {'completa': 0, 'incompleta': 0, 'nao_avaliado': 0},
-                    'plano_parto': {'sim': 0, 'nao': 0},
-                    'participou_grupos': {'sim': 0, 'nao': 0},
-                    'possui_bolsa_familia': {'sim': 0, 'nao': 0},
-                    'tem_vacina_covid': {'sim': 0, 'nao': 0}
-                }
-            
-            stats = dados_por_data[data]
-            
-            # Processar cada indicador
-            inicio = row['inicio_pre_natal_antes_12s']
-            stats['inicio_pre_natal_antes_12s']['sim'] += 1 if inicio == 1 else 0
-            stats['inicio_pre_natal_antes_12s']['nao'] += 1 if inicio == 0 else 0
-            
-            num_consultas = row['consultas_pre_natal'] or 0
-            stats['consultas_pre_natal']['mais_6'] += 1 if num_consultas >= 6 else 0
-            stats['consultas_pre_natal']['ate_6'] += 1 if num_consultas < 6 else 0
-            
-            vacinas = (row['vacinas_completas'] or '').lower()
-            if 'completa' in vacinas:
-                stats['vacinas_completas']['completa'] += 1
-            elif 'incompleta' in vacinas:
-                stats['vacinas_completas']['incompleta'] += 1
-            else:
-                stats['vacinas_completas']['nao_avaliado'] += 1
-            
-            stats['plano_parto']['sim'] += 1 if row['plano_parto'] == 1 else 0
-            stats['plano_parto']['nao'] += 1 if row['plano_parto'] == 0 else 0
-            stats['participou_grupos']['sim'] += 1 if row['participou_grupos'] == 1 else 0
-            stats['participou_grupos']['nao'] += 1 if row['participou_grupos'] == 0 else 0
-            bf = row['possui_bolsa_familia'] if 'possui_bolsa_familia' in row.keys() else None
-            stats['possui_bolsa_familia']['sim'] += 1 if bf == 1 else 0
-            stats['possui_bolsa_familia']['nao'] += 1 if bf == 0 or bf is None else 0
-            vc = row['tem_vacina_covid'] if 'tem_vacina_covid' in row.keys() else None
-            stats['tem_vacina_covid']['sim'] += 1 if vc == 1 else 0
-            stats['tem_vacina_covid']['nao'] += 1 if vc == 0 or vc is None else 0
-        
+        cursor.execute(
+            "SELECT data, indicador, balde, SUM(total) AS total FROM indicadores_diarios "
+            "WHERE data > '' AND indicador IN ('total', ?)" + filtro_unidade +
+            " GROUP BY data, indicador, balde HAVING SUM(total) > 0 ORDER BY data",
+            (filtro,) + params
+        )
+        dados_por_data: Dict[str, Dict[str, int]] = {}
+        for row in cursor.fetchall():
+            baldes = dados_por_data.setdefault(row['data'], {})
+            if row['indicador'] == filtro:
+                baldes[row['balde']] = row['total']
+
         # Preparar resposta no formato esperado
         datas = sorted(dados_por_data.keys())
-        valores = {}
-        
-        for data in datas:
-            stats = dados_por_data[data]
-            valores[data] = {}
-            
-            if filtro == 'inicio_pre_natal_antes_12s':
-                valores[data]['Sim'] = stats['inicio_pre_natal_antes_12s']['sim']
-                valores[data]['Não'] = stats['inicio_pre_natal_antes_12s']['nao']
-            elif filtro == 'consultas_pre_natal':
-                valores[data]['≥ 6 consultas'] = stats['consultas_pre_natal']['mais_6']
-                valores[data]['< 6 consultas'] = stats['consultas_pre_natal']['ate_6']
-            elif filtro == 'vacinas_completas':
-                valores[data]['Completo'] = stats['vacinas_completas']['completa']
-                valores[data]['Incompleto'] = stats['vacinas_completas']['incompleta']
-                valores[data]['Não avaliado'] = stats['vacinas_completas']['nao_avaliado']
-            elif filtro == 'plano_parto':
-                valores[data]['Sim'] = stats['plano_parto']['sim']
-                valores[data]['Não'] = stats['plano_parto']['nao']
-            elif filtro == 'participou_grupos':
-                valores[data]['Participou'] = stats['participou_grupos']['sim']
-                valores[data]['Não participou'] = stats['participou_grupos']['nao']
-            elif filtro == 'possui_bolsa_familia':
-                valores[data]['Sim'] = stats['possui_bolsa_familia']['sim']
-                valores[data]['Não'] = stats['possui_bolsa_familia']['nao']
-            elif filtro == 'tem_vacina_covid':
-                valores[data]['Sim'] = stats['tem_vacina_covid']['sim']
-                valores[data]['Não'] = stats['tem_vacina_covid']['nao']
-        
+        rotulos = self.ROTULOS_TEMPORAIS.get(filtro, ())
+        valores = {
+            data: {rotulo: dados_por_data[data].get(balde, 0) for balde, rotulo in rotulos}
+            for data in datas
+        }
         return {
             'datas': datas,
             'valores': valores
         }
 
+    @_escrita
     def restaurar_backup(self, backup_data: List[Dict]) -> Dict:
         if not isinstance(backup_data, list):
             return {'success': False, 'message': 'Estrutura do backup inválida'}
+        # DELETE e inserções na mesma transação: o backup entra inteiro ou nada muda
         self.conn.execute("DELETE FROM pacientes")
-        self.conn.commit()
-        inseridos = 0
-        for registro in backup_data:
-            nome = registro.get('identificacao', {}).get('nome_gestante', '').strip()
-            if not nome:
-                continue
-            paciente_id = registro.get('id') or self.gerar_id(nome)
-            data_salvamento = registro.get('data_salvamento', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            resultado = self.inserir_registro(
-                paciente_id,
-                registro,
-                arquivo_origem=registro.get('arquivo_origem'),
-                data_salvamento=data_salvamento
-            )
-            if resultado['success']:
-                inseridos += 1
-            return {
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        registros = (
+            {
+                **registro,
+                'data_salvamento': registro.get('data_salvamento', agora),
+                # Backup não preserva metadados de sincronização (mesmo comportamento de inserir_registro)
+                'pc_id': None, 'ultima_modificacao': None, 'versao': None, 'status': None,
+            }
+            for registro in backup_data
+            if (registro.get('identificacao', {}).get('nome_gestante') or '').strip()
+        )
+        resultado = self.inserir_registros_em_lote(registros)
+        if not resultado['success']:
+            return {'success': False, 'message': resultado['message']}
+        inseridos = resultado['inseridos']
+        return {
             'success': True,
             'message': f'Backup restaurado com sucesso ({inseridos} registros)',
             'total_pacientes': inseridos
         }
 
     # Métodos para agendamentos
+    _SQL_INSERIR_AGENDAMENTO = """
+        INSERT INTO agendamentos
+        (id, paciente_id, data_consulta, hora_consulta, tipo_consulta, observacoes, status, data_criacao, data_atualizacao,
+         pc_id, ultima_modificacao, versao)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    @_escrita
     def criar_agendamento(self, agendamento_id: str, paciente_id: str, data_consulta: str, 
                           hora_consulta: str, tipo_consulta: str = None, observacoes: str = None, 
                           status: str = 'agendado', data_criacao: str = None, data_atualizacao: str = None,
@@ -1090,18 +2517,36 @@ class Database:
             if versao is None:
                 versao = 1
             
-            self.conn.execute("""
-                INSERT INTO agendamentos 
-                (id, paciente_id, data_consulta, hora_consulta, tipo_consulta, observacoes, status, data_criacao, data_atualizacao,
-                 pc_id, ultima_modificacao, versao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (agendamento_id, paciente_id, data_consulta, hora_consulta, tipo_consulta, observacoes, status, data_criacao, data_atualizacao,
+            self.conn.execute(self._SQL_INSERIR_AGENDAMENTO, (agendamento_id, paciente_id, data_consulta, hora_consulta, tipo_consulta, observacoes, status, data_criacao, data_atualizacao,
                   pc_id, ultima_modificacao, versao))
             self.conn.commit()
             return {'success': True, 'message': 'Agendamento criado com sucesso'}
         except Exception as e:
             return {'success': False, 'message': f'Erro ao criar agendamento: {str(e)}'}
 
+    @staticmethod
+    def _agendamento_para_dict(row: sqlite3.Row) -> Dict:
+        """Linha de agendamentos (com nome_gestante/unidade_saude do JOIN) no formato da API."""
+        agendamento = {
+            'id': row['id'],
+            'paciente_id': row['paciente_id'],
+            'nome_gestante': row['nome_gestante'],
+            'unidade_saude': row['unidade_saude'],
+            'data_consulta': row['data_consulta'],
+            'hora_consulta': row['hora_consulta'],
+            'tipo_consulta': row['tipo_consulta'],
+            'observacoes': row['observacoes'],
+            'status': row['status'],
+            'data_criacao': row['data_criacao'],
+            'data_atualizacao': row['data_atualizacao']
+        }
+        # Adicionar campos de sincronização se existirem
+        chaves = row.keys()
+        for campo in ('pc_id', 'ultima_modificacao', 'versao', 'removido_em', 'removido_por', 'hash_conteudo'):
+            if campo in chaves:
+                agendamento[campo] = row[campo]
+        return agendamento
+
     def listar_agendamentos(self, paciente_id: str = None, data_inicio: str = None, 
                            data_fim: str = None, status: str = None) -> List[Dict]:
         """Lista agendamentos com filtros opcionais"""
@@ -1139,38 +2584,7 @@ class Database:
             cursor = self.conn.execute(query, params)
             rows = cursor.fetchall()
             
-            agendamentos = []
-            for row in rows:
-                agendamento = {
-                    'id': row['id'],
-                    'paciente_id': row['paciente_id'],
-                    'nome_gestante': row['nome_gestante'],
-                    'unidade_saude': row['unidade_saude'],
-                    'data_consulta': row['data_consulta'],
-                    'hora_consulta': row['hora_consulta'],
-                    'tipo_consulta': row['tipo_consulta'],
-                    'observacoes': row['observacoes'],
-                    'status': row['status'],
-                    'data_criacao': row['data_criacao'],
-                    'data_atualizacao': row['data_atualizacao']
-                }
-                # Adicionar campos de sincronização se existirem
-                try:
-                    if 'pc_id' in row.keys():
-                        agendamento['pc_id'] = row['pc_id']
-                    if 'ultima_modificacao' in row.keys():
-                        agendamento['ultima_modificacao'] = row['ultima_modificacao']
-                    if 'versao' in row.keys():
-                        agendamento['versao'] = row['versao']
-                    if 'removido_em' in row.keys():
-                        agendamento['removido_em'] = row['removido_em']
-                    if 'removido_por' in row.keys():
-                        agendamento['removido_por'] = row['removido_por']
-                except (KeyError, IndexError):
-                    pass
-                agendamentos.append(agendamento)
-            
-            return agendamentos
+            return [self._agendamento_para_dict(row) for row in rows]
         except Exception as e:
             return []
 
@@ -1186,38 +2600,12 @@ class Database:
             row = cursor.fetchone()
             
             if row:
-                agendamento = {
-                    'id': row['id'],
-                    'paciente_id': row['paciente_id'],
-                    'nome_gestante': row['nome_gestante'],
-                    'unidade_saude': row['unidade_saude'],
-                    'data_consulta': row['data_consulta'],
-                    'hora_consulta': row['hora_consulta'],
-                    'tipo_consulta': row['tipo_consulta'],
-                    'observacoes': row['observacoes'],
-                    'status': row['status'],
-                    'data_criacao': row['data_criacao'],
-                    'data_atualizacao': row['data_atualizacao']
-                }
-                # Adicionar campos de sincronização se existirem
-                try:
-                    if 'pc_id' in row.keys():
-                        agendamento['pc_id'] = row['pc_id']
-                    if 'ultima_modificacao' in row.keys():
-                        agendamento['ultima_modificacao'] = row['ultima_modificacao']
-                    if 'versao' in row.keys():
-                        agendamento['versao'] = row['versao']
-                    if 'removido_em' in row.keys():
-                        agendamento['removido_em'] = row['removido_em']
-                    if 'removido_por' in row.keys():
-                        agendamento['removido_por'] = row['removido_por']
-                except (KeyError, IndexError):
-                    pass
-                return agendamento
+                return self._agendamento_para_dict(row)
             return None
         except Exception as e:
             return None
 
+    @_escrita
     def atualizar_agendamento(self, agendamento_id: str, paciente_id: str = None, data_consulta: str = None,
                               hora_consulta: str = None, tipo_consulta: str = None,
                               observacoes: str = None, status: str = None, data_atualizacao: str = None,
@@ -1298,6 +2686,7 @@ class Database:
         except Exception as e:
             return {'success': False, 'message': f'Erro ao atualizar agendamento: {str(e)}'}
 
+    @_escrita
     def excluir_agendamento(self, agendamento_id: str) -> Dict:
         """Exclui um agendamento (hard delete - mantido para compatibilidade)"""
         try:
@@ -1307,6 +2696,7 @@ class Database:
         except Exception as e:
             return {'success': False, 'message': f'Erro ao excluir agendamento: {str(e)}'}
     
+    @_escrita
     def remover_paciente_soft(self, paciente_id: str) -> Dict:
         """Remove um paciente usando soft delete (marca como removido)"""
         try:
@@ -1328,6 +2718,7 @@ class Database:
         except Exception as e:
             return {'success': False, 'message': f'Erro ao remover paciente: {str(e)}'}
     
+    @_escrita
     def remover_agendamento_soft(self, agendamento_id: str) -> Dict:
         """Remove um agendamento usando soft delete (marca como removido)"""
         try:
@@ -1356,27 +2747,16 @@ class Database:
             
             # Buscar pacientes em conflito
             cursor.execute("SELECT * FROM pacientes WHERE status = 'conflito'")
-            pacientes_conflito = [self._row_to_dict(row) for row in cursor.fetchall()]
+            pacientes_conflito = self._linhas_para_dicts(cursor)
             
-            # Buscar agendamentos em conflito
-            cursor.execute("SELECT * FROM agendamentos WHERE status = 'conflito'")
-            agendamentos_conflito = []
-            for row in cursor.fetchall():
-                agendamento = {
-                    'id': row['id'],
-                    'paciente_id': row['paciente_id'],
-                    'data_consulta': row['data_consulta'],
-                    'hora_consulta': row['hora_consulta'],
-                    'tipo_consulta': row['tipo_consulta'],
-                    'observacoes': row['observacoes'],
-                    'status': row['status'],
-                    'data_criacao': row['data_criacao'],
-                    'data_atualizacao': row['data_atualizacao'],
-                    'pc_id': row.get('pc_id'),
-                    'ultima_modificacao': row.get('ultima_modificacao'),
-                    'versao': row.get('versao')
-                }
-                agendamentos_conflito.append(agendamento)
+            # Buscar agendamentos em conflito (com o paciente, no formato de listar_agendamentos)
+            cursor.execute("""
+                SELECT a.*, p.nome_gestante, p.unidade_saude
+                FROM agendamentos a
+                LEFT JOIN pacientes p ON a.paciente_id = p.id
+                WHERE a.status = 'conflito'
+            """)
+            agendamentos_conflito = [self._agendamento_para_dict(row) for row in cursor.fetchall()]
             
             return {
                 'success': True,
@@ -1393,6 +2773,7 @@ class Database:
                 'total': 0
             }
     
+    @_transacional
     def resolver_conflito(self, registro_id: str, tipo: str, acao: str, dados_remotos: Optional[Dict] = None) -> Dict:
         """
         Resolve um conflito escolhendo qual versão manter.
@@ -1473,43 +2854,542 @@ class Database:
         except Exception as e:
             return {'success': False, 'message': f'Erro ao resolver conflito: {str(e)}'}
     
+    # Merge de sincronização em blocos: cada bloco busca só os ids recebidos (IN (...)),
+    # classifica em memória e grava com executemany numa transação própria
+    TAMANHO_LOTE_MERGE = 500
+
+    _SQL_CONFLITO_PACIENTE = """
+        UPDATE pacientes SET status = 'conflito', ultima_modificacao = ?, versao = versao + 1
+        WHERE id = ? AND status IS NOT 'conflito'
+    """
+    _SQL_CONFLITO_AGENDAMENTO = """
+        UPDATE agendamentos SET status = 'conflito', ultima_modificacao = ?, versao = versao + 1
+        WHERE id = ? AND status IS NOT 'conflito'
+    """
+    # Mesmo efeito de atualizar_agendamento(): None mantém o valor atual e 'conflito' não é sobrescrito
+    _SQL_ATUALIZAR_AGENDAMENTO_SYNC = """
+        UPDATE agendamentos SET
+            paciente_id = COALESCE(?, paciente_id), data_consulta = COALESCE(?, data_consulta),
+            hora_consulta = COALESCE(?, hora_consulta), tipo_consulta = COALESCE(?, tipo_consulta),
+            observacoes = COALESCE(?, observacoes),
+            status = CASE WHEN status = 'conflito' THEN status ELSE COALESCE(?, status, 'agendado') END,
+            data_atualizacao = ?, pc_id = ?, ultima_modificacao = ?,
+            versao = COALESCE(NULLIF(versao, 0), 1) + 1
+        WHERE id = ?
+    """
+
+    @staticmethod
+    def _registros_identicos(reg1: Dict, reg2: Dict, campos_ignorados: Optional[set] = None) -> bool:
+        if campos_ignorados is None:
+            campos_ignorados = {'ultima_modificacao', 'versao', 'pc_id'}
+        campos_ignorados = campos_ignorados | {'id', 'hash_conteudo'}
+        for campo in set(reg1.keys()) | set(reg2.keys()):
+            if campo in campos_ignorados:
+                continue
+            if reg1.get(campo) != reg2.get(campo):
+                return False
+        return True
+
+    def _executar_em_lote(self, sql: str, parametros: List[Tuple]) -> List[Optional[str]]:
+        """
+        executemany num savepoint; se alguma linha falhar, desfaz o bloco e refaz linha a
+        linha para isolar o erro. Devolve, por linha, None (gravada) ou a mensagem de erro.
+        """
+        conn = self.conn
+        conn.execute('SAVEPOINT lote')
+        try:
+            conn.executemany(sql, parametros)
+            conn.execute('RELEASE lote')
+            return [None] * len(parametros)
+        except sqlite3.Error:
+            conn.execute('ROLLBACK TO lote')
+            conn.execute('RELEASE lote')
+        erros: List[Optional[str]] = []
+        for params in parametros:
+            conn.execute('SAVEPOINT lote_linha')
+            try:
+                conn.execute(sql, params)
+                erros.append(None)
+            except sqlite3.Error as e:
+                conn.execute('ROLLBACK TO lote_linha')
+                erros.append(str(e))
+            conn.execute('RELEASE lote_linha')
+        return erros
+
+    def mesclar_sincronizacao(self, pacientes_remotos: List[Dict], agendamentos_remotos: List[Dict],
+                              pc_id_remoto: Optional[str] = None, tamanho_lote: Optional[int] = None) -> Dict:
+        """
+        Merge dos registros recebidos de outro servidor, com as regras de sempre: novos
+        são inseridos, o mais recente (ultima_modificacao) vence, mesmo horário com
+        conteúdo diferente ou removido de um lado só vira conflito. Processa em blocos de
+        `tamanho_lote`, um COMMIT por bloco. Devolve as contagens do merge.
+        """
+        tamanho_lote = max(1, int(tamanho_lote or self.TAMANHO_LOTE_MERGE))
+        stats = dict.fromkeys((
+            'pacientes_adicionados', 'pacientes_atualizados', 'pacientes_conflito',
+            'agendamentos_adicionados', 'agendamentos_atualizados', 'agendamentos_conflito',
+        ), 0)
+        # Ordenados por id, cada bloco cai numa faixa contígua dos índices: menos páginas
+        # tocadas por COMMIT (sort estável: repetições mantêm a ordem recebida)
+        pacientes_remotos = sorted((p for p in pacientes_remotos if isinstance(p, dict) and p.get('id')),
+                                   key=lambda p: str(p['id']))
+        agendamentos_remotos = sorted((a for a in agendamentos_remotos if isinstance(a, dict) and a.get('id')),
+                                      key=lambda a: str(a['id']))
+        # Pacientes antes dos agendamentos que os referenciam
+        for i in range(0, len(pacientes_remotos), tamanho_lote):
+            with self.transacao():
+                self._mesclar_bloco_pacientes(pacientes_remotos[i:i + tamanho_lote], pc_id_remoto, stats)
+        for i in range(0, len(agendamentos_remotos), tamanho_lote):
+            with self.transacao():
+                self._mesclar_bloco_agendamentos(agendamentos_remotos[i:i + tamanho_lote], pc_id_remoto, stats)
+        return stats
+
+    def mesclar_sincronizacao_em_fluxo(self, registros: Iterable[Tuple[str, Dict]],
+                                       pc_id_remoto: Optional[str] = None,
+                                       tamanho_lote: Optional[int] = None) -> Dict:
+        """
+        mesclar_sincronizacao() para uma sequência de (tabela, registro) lida aos poucos
+        (ex.: corpo NDJSON): junta até `tamanho_lote` registros e mescla o bloco, então a
+        memória não cresce com o tamanho da cópia. Num bloco, os pacientes vão antes dos
+        agendamentos. Se a sequência falhar no meio, os blocos anteriores já ficaram
+        gravados (o merge é idempotente: reenviar tudo é seguro).
+        """
+        tamanho_lote = max(1, int(tamanho_lote or self.TAMANHO_LOTE_MERGE))
+        stats: Dict[str, int] = {}
+        pendentes: Dict[str, List[Dict]] = {'pacientes': [], 'agendamentos': []}
+
+        def mesclar_pendentes():
+            parcial = self.mesclar_sincronizacao(
+                pendentes['pacientes'], pendentes['agendamentos'], pc_id_remoto, tamanho_lote
+            )
+            for campo, valor in parcial.items():
+                stats[campo] = stats.get(campo, 0) + valor
+            pendentes['pacientes'], pendentes['agendamentos'] = [], []
+
+        for tabela, registro in registros:
+            if tabela not in pendentes:
+                raise ValueError(f'Tabela inválida: {tabela}')
+            pendentes[tabela].append(registro)
+            if len(pendentes['pacientes']) + len(pendentes['agendamentos']) >= tamanho_lote:
+                mesclar_pendentes()
+        mesclar_pendentes()
+        return stats
+
+    # Sessões de sincronização com um peer ('ip:porta'). O cursor do sync incremental é
+    # gravado na mesma transação do merge de cada página: se a conexão cair (ou o processo
+    # morrer) no meio, a próxima execução retoma depois da última página confirmada.
+    MAX_SESSOES_SYNC_POR_PEER = 100
+
+    def _sessao_sync(self, sessao_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM sessoes_sync WHERE id = ?", (sessao_id,)).fetchone()
+        return self._sessao_sync_para_dict(row) if row is not None else None
+
+    @staticmethod
+    def _sessao_sync_para_dict(row: sqlite3.Row) -> Dict:
+        sessao = dict(row)
+        sessao['stats'] = json.loads(sessao['stats'] or '{}')
+        segundos = sessao['duracao_ms'] / 1000
+        sessao['registros_por_seg'] = round(sessao['registros'] / segundos, 1) if segundos > 0 else None
+        sessao['kb_por_seg'] = round(sessao['bytes'] / 1024 / segundos, 1) if segundos > 0 else None
+        return sessao
+
+    @_escrita
+    def abrir_sessao_sync(self, peer: str) -> Dict:
+        """
+        Sessão para sincronizar com `peer`: a última, se ficou em andamento ou interrompida
+        (retomada do cursor salvo), senão uma nova a partir do cursor da última concluída.
+        """
+        conn = self.conn
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ultima = conn.execute(
+            "SELECT id, estado, cursor, peer_pc_id FROM sessoes_sync WHERE peer = ? ORDER BY id DESC LIMIT 1", (peer,)
+        ).fetchone()
+        if ultima is not None and ultima['estado'] != 'concluida':
+            conn.execute("""
+                UPDATE sessoes_sync SET estado = 'em_andamento', retomadas = retomadas + 1, erro = NULL,
+                    atualizada_em = ?
+                WHERE id = ?
+            """, (agora, ultima['id']))
+            sessao_id, retomada = ultima['id'], True
+        else:
+            sessao_id = conn.execute("""
+                INSERT INTO sessoes_sync (peer, peer_pc_id, estado, cursor, iniciada_em, atualizada_em)
+                VALUES (?, ?, 'em_andamento', ?, ?, ?)
+            """, (peer, ultima['peer_pc_id'] if ultima else None, ultima['cursor'] if ultima else '', agora, agora)
+            ).lastrowid
+            retomada = False
+        conn.commit()
+        return {**self._sessao_sync(sessao_id), 'retomada': retomada}
+
+    @_escrita
+    def registrar_pagina_sessao_sync(self, sessao_id: int, cursor: Optional[str], stats: Dict,
+                                     registros: int = 0, bytes_recebidos: int = 0, duracao_ms: float = 0.0,
+                                     peer_pc_id: Optional[str] = None) -> None:
+        """
+        Checkpoint de uma página aplicada. Chamar dentro da mesma transacao() do merge da
+        página: cursor e registros mesclados ficam gravados juntos, ou nenhum dos dois.
+        `cursor` None (servidor sem sync incremental) mantém o anterior.
+        """
+        conn = self.conn
+        atual = conn.execute("SELECT stats FROM sessoes_sync WHERE id = ?", (sessao_id,)).fetchone()
+        if atual is None:
+            raise ValueError(f'Sessão de sincronização inexistente: {sessao_id}')
+        somados = json.loads(atual['stats'] or '{}')
+        for campo, valor in (stats or {}).items():
+            somados[campo] = somados.get(campo, 0) + valor
+        conn.execute("""
+            UPDATE sessoes_sync SET
+                cursor = COALESCE(?, cursor), peer_pc_id = COALESCE(?, peer_pc_id),
+                paginas = paginas + 1, registros = registros + ?, bytes = bytes + ?,
+                duracao_ms = duracao_ms + ?, stats = ?, atualizada_em = ?
+            WHERE id = ?
+        """, (cursor, peer_pc_id, int(registros), int(bytes_recebidos), float(duracao_ms),
+              json.dumps(somados, sort_keys=True), datetime.now().strftime('%Y-%m-%d %H:%M:%S'), sessao_id))
+        conn.commit()
+
+    @_escrita
+    def concluir_sessao_sync(self, sessao_id: int) -> None:
+        """
+        Marca a sessão como concluída e poda o histórico do peer: sessões concluídas sem
+        nenhum registro (a verificação periódica) saem, exceto a atual, que guarda o cursor;
+        das demais ficam as MAX_SESSOES_SYNC_POR_PEER mais recentes.
+        """
+        conn = self.conn
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        row = conn.execute("SELECT peer FROM sessoes_sync WHERE id = ?", (sessao_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute("""
+            UPDATE sessoes_sync SET estado = 'concluida', erro = NULL, concluida_em = ?, atualizada_em = ?
+            WHERE id = ?
+        """, (agora, agora, sessao_id))
+        conn.execute("""
+            DELETE FROM sessoes_sync
+            WHERE peer = ? AND id != ? AND estado = 'concluida' AND registros = 0 AND retomadas = 0
+        """, (row['peer'], sessao_id))
+        conn.execute("""
+            DELETE FROM sessoes_sync WHERE peer = ? AND id NOT IN (
+                SELECT id FROM sessoes_sync WHERE peer = ? ORDER BY id DESC LIMIT ?
+            )
+        """, (row['peer'], row['peer'], self.MAX_SESSOES_SYNC_POR_PEER))
+        conn.commit()
+
+    @_escrita
+    def interromper_sessao_sync(self, sessao_id: int, erro: str) -> None:
+        """Sessão que caiu no meio: fica com o cursor da última página confirmada, para retomar."""
+        self.conn.execute("""
+            UPDATE sessoes_sync SET estado = 'interrompida', erro = ?, atualizada_em = ?
+            WHERE id = ?
+        """, (erro, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), sessao_id))
+        self.conn.commit()
+
+    def listar_sessoes_sync(self, peer: Optional[str] = None, limite: int = 50) -> Dict:
+        """Sessões mais recentes primeiro, com vazão (registros/s e KB/s no tempo ativo das páginas)."""
+        try:
+            limite = max(1, min(int(limite), self.LIMITE_MAXIMO_PAGINA))
+        except (TypeError, ValueError):
+            return {'success': False, 'message': 'limite deve ser um número inteiro'}
+        filtro, params = ("WHERE peer = ? ", (peer,)) if peer else ("", ())
+        cursor = self.conn.execute(f"SELECT * FROM sessoes_sync {filtro}ORDER BY id DESC LIMIT ?", params + (limite,))
+        return {'success': True, 'sessoes': [self._sessao_sync_para_dict(row) for row in cursor.fetchall()]}
+
+    def _estado_local(self, tabela: str, ids: Iterable[str], filtro: str = '') -> Dict[str, sqlite3.Row]:
+        """id -> (id, status, hash_conteudo) dos registros locais, sem decodificar as linhas."""
+        estado: Dict[str, sqlite3.Row] = {}
+        for lote in self._lotes_ids(ids):
+            for row in self.conn.execute(
+                f"SELECT id, status, hash_conteudo FROM {tabela} WHERE id IN ({', '.join('?' * len(lote))}){filtro}", lote
+            ):
+                estado[row['id']] = row
+        return estado
+
+    @staticmethod
+    def _mesmo_hash(remoto: Dict, local: sqlite3.Row) -> bool:
+        # Hash ausente (servidor antigo, linha gravada por fora) = desconhecido
+        return bool(remoto.get('hash_conteudo')) and remoto.get('hash_conteudo') == local['hash_conteudo']
+
+    def _mesclar_bloco_pacientes(self, remotos: List[Dict], pc_id_remoto: Optional[str], stats: Dict) -> None:
+        estado = self._estado_local('pacientes', [p['id'] for p in remotos])
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        novos: List[Dict] = []
+        conflitos: List[str] = []
+        comparar: List[Dict] = []
+        atualizacoes: List[Tuple[Dict, Dict]] = []
+        for pr in remotos:
+            local = estado.get(pr['id'])
+            if local is None:
+                novos.append({
+                    **pr,
+                    'arquivo_origem': 'sync',
+                    'pc_id': pr.get('pc_id', pc_id_remoto),
+                    'versao': pr.get('versao', 1),
+                    'status': pr.get('status', 'ativo'),
+                })
+                continue
+            sl, sr = local['status'], pr.get('status', 'ativo')
+            if (sl == 'removido') != (sr == 'removido'):
+                conflitos.append(pr['id'])
+                continue
+            if sl != 'removido' and not self._mesmo_hash(pr, local):
+                comparar.append(pr)
+        # Só os que podem ter mudado são lidos por inteiro
+        locais = {p['id']: p for p in self.buscar_pacientes_por_ids([pr['id'] for pr in comparar])}
+        for pr in comparar:
+            pl = locais[pr['id']]
+            if self._registros_identicos(pl, pr):
+                continue
+            uml = pl.get('ultima_modificacao') or pl.get('data_salvamento', '')
+            umr = pr.get('ultima_modificacao') or pr.get('data_salvamento', '')
+            if umr > uml:
+                atualizacoes.append((pr, pl))
+            elif umr == uml:
+                conflitos.append(pr['id'])
+
+        if novos:
+            stats['pacientes_adicionados'] += self.inserir_registros_em_lote(novos)['inseridos']
+        if conflitos:
+            self.conn.executemany(self._SQL_CONFLITO_PACIENTE, [(agora, pid) for pid in conflitos])
+            stats['pacientes_conflito'] += len(conflitos)
+        if atualizacoes:
+            # Como atualizar_paciente(): versão local + 1 e status 'conflito' preservado
+            parametros = []
+            for pr, pl in atualizacoes:
+                params = self._parametros_paciente(
+                    pr['id'], pr,
+                    pc_id=pr.get('pc_id', pc_id_remoto) or self.pc_id,
+                    ultima_modificacao=agora,
+                    versao=(pl.get('versao') or 1) + 1,
+                    status='conflito' if pl.get('status') == 'conflito' else 'ativo',
+                )
+                parametros.append(params[1:] + params[:1])
+            erros = self._executar_em_lote(self._SQL_ATUALIZAR_PACIENTE, parametros)
+            gravadas = [item for item, erro in zip(atualizacoes, erros) if erro is None]
+            stats['pacientes_atualizados'] += len(gravadas)
+            self._agendar_proximas_avaliacoes(gravadas, agora)
+
+    def _agendar_proximas_avaliacoes(self, atualizacoes: List[Tuple[Dict, Dict]], agora: str) -> None:
+        """_gerenciar_agendamento_proxima_avaliacao() em lote para pares (novo, antigo) já gravados."""
+        pendentes = []
+        for novo, antigo in atualizacoes:
+            avaliacao, anterior = novo.get('avaliacao', {}), antigo.get('avaliacao', {})
+            data, hora = avaliacao.get('proxima_avaliacao'), avaliacao.get('proxima_avaliacao_hora')
+            if data and (data != anterior.get('proxima_avaliacao') or hora != anterior.get('proxima_avaliacao_hora')):
+                pendentes.append((novo['id'], data, hora))
+        if not pendentes:
+            return
+        existentes: Dict[str, List[sqlite3.Row]] = {}
+        for lote in self._lotes_ids(pid for pid, _, _ in pendentes):
+            for row in self.conn.execute(f"""
+                SELECT id, paciente_id, data_consulta, hora_consulta FROM agendamentos
+                WHERE paciente_id IN ({', '.join('?' * len(lote))})
+                  AND (status IS NULL OR status != 'removido')
+                ORDER BY data_consulta ASC, hora_consulta ASC
+            """, lote):
+                existentes.setdefault(row['paciente_id'], []).append(row)
+        atualizar, criar = [], []
+        for pid, data, hora in pendentes:
+            na_data = [a for a in existentes.get(pid, ()) if a['data_consulta'] == data]
+            if hora:
+                na_data = [a for a in na_data if a['hora_consulta'] == hora]
+            if na_data:
+                atualizar.append((None, data, hora, 'consulta_pre_natal',
+                                  'Agendamento automático da próxima avaliação (atualizado)', 'agendado',
+                                  agora, self.pc_id, agora, na_data[0]['id']))
+            else:
+                criar.append((str(uuid.uuid4()), pid, data, hora or '08:00', 'consulta_pre_natal',
+                              'Agendamento automático da próxima avaliação', 'agendado',
+                              agora, agora, self.pc_id, agora, 1))
+        if atualizar:
+            self._executar_em_lote(self._SQL_ATUALIZAR_AGENDAMENTO_SYNC, atualizar)
+        if criar:
+            self._executar_em_lote(self._SQL_INSERIR_AGENDAMENTO, criar)
+
+    def _mesclar_bloco_agendamentos(self, remotos: List[Dict], pc_id_remoto: Optional[str], stats: Dict) -> None:
+        # Como no merge completo: removidos locais ficam de fora (o INSERT do remoto falha)
+        estado = self._estado_local('agendamentos', [a['id'] for a in remotos],
+                                    " AND (status IS NULL OR status != 'removido')")
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        novos, conflitos, comparar, atualizacoes = [], [], [], []
+        for ar in remotos:
+            aid = ar['id']
+            local = estado.get(aid)
+            if local is None:
+                if 'paciente_id' not in ar or 'data_consulta' not in ar or 'hora_consulta' not in ar:
+                    continue
+                data_criacao = ar.get('data_criacao') or agora
+                novos.append((
+                    aid, ar['paciente_id'], ar['data_consulta'], ar['hora_consulta'],
+                    ar.get('tipo_consulta'), ar.get('observacoes'), ar.get('status', 'agendado'),
+                    data_criacao, ar.get('data_atualizacao') or data_criacao,
+                    ar.get('pc_id', pc_id_remoto) or self.pc_id, ar.get('ultima_modificacao') or agora,
+                    ar.get('versao', 1) if ar.get('versao') is not None else 1,
+                ))
+                continue
+            sr = ar.get('status', 'agendado')
+            if sr == 'removido':
+                conflitos.append(aid)
+                continue
+            if not self._mesmo_hash(ar, local):
+                comparar.append(ar)
+        locais = {a['id']: a for a in self.buscar_agendamentos_por_ids([ar['id'] for ar in comparar])}
+        for ar in comparar:
+            aid = ar['id']
+            al = locais[aid]
+            if self._registros_identicos(al, ar, {'nome_gestante', 'unidade_saude', 'ultima_modificacao', 'versao', 'pc_id'}):
+                continue
+            uml = al.get('ultima_modificacao') or al.get('data_atualizacao', '')
+            umr = ar.get('ultima_modificacao') or ar.get('data_atualizacao', '')
+            if umr > uml:
+                if 'paciente_id' not in ar or 'data_consulta' not in ar or 'hora_consulta' not in ar:
+                    continue
+                atualizacoes.append((
+                    ar['paciente_id'], ar['data_consulta'], ar['hora_consulta'],
+                    ar.get('tipo_consulta'), ar.get('observacoes'), ar.get('status', 'agendado'),
+                    agora, ar.get('pc_id', pc_id_remoto) or self.pc_id, ar.get('ultima_modificacao') or agora, aid,
+                ))
+            elif umr == uml:
+                conflitos.append(aid)
+
+        if novos:
+            erros = self._executar_em_lote(self._SQL_INSERIR_AGENDAMENTO, novos)
+            stats['agendamentos_adicionados'] += erros.count(None)
+        if conflitos:
+            self.conn.executemany(self._SQL_CONFLITO_AGENDAMENTO, [(agora, aid) for aid in conflitos])
+            stats['agendamentos_conflito'] += len(conflitos)
+        if atualizacoes:
+            erros = self._executar_em_lote(self._SQL_ATUALIZAR_AGENDAMENTO_SYNC, atualizacoes)
+            stats['agendamentos_atualizados'] += erros.count(None)
+
+    def hashes_conteudo(self, incluir_removidos: bool = False) -> Dict[str, List[Dict]]:
+        """Só id e hash_conteudo de pacientes e agendamentos, com os filtros do sync completo."""
+        filtro = "" if incluir_removidos else f" WHERE {self._SQL_ATIVO}"
+        return {
+            'pacientes': [dict(row) for row in self.conn.execute(f"SELECT id, hash_conteudo FROM pacientes{filtro}")],
+            'agendamentos': [dict(row) for row in self.conn.execute(
+                f"SELECT id, hash_conteudo FROM agendamentos WHERE {self._SQL_ATIVO}"
+            )],
+        }
+
+    # Árvore de hashes do sync: nós com até tantos registros vêm como folha (pares id/hash)
+    LIMITE_FOLHA_ARVORE = 16
+    NIVEL_MAXIMO_ARVORE = 4
+
+    @staticmethod
+    def _fim_prefixo(prefixo: str) -> Optional[str]:
+        """Menor string maior que todas as que começam com `prefixo` (None = sem limite)."""
+        while prefixo and ord(prefixo[-1]) == 0x10FFFF:
+            prefixo = prefixo[:-1]
+        return prefixo[:-1] + chr(ord(prefixo[-1]) + 1) if prefixo else None
+
+    def arvore_sincronizacao(self, tabela: str = 'pacientes', prefixo: str = '', nivel: int = 1,
+                             folha: bool = False, incluir_removidos: bool = False) -> Dict:
+        """
+        Nó da árvore de hashes (anti-entropia) de `tabela`, com os filtros do sync incremental:
+        os registros cujo id começa com `prefixo`, agrupados em baldes pelos `nivel`
+        caracteres seguintes. Cada balde traz [quantidade, hash] e o hash é o mesmo do nó
+        prefixo + chave; dois servidores descem só pelos baldes com hash diferente.
+
+        Nós com até LIMITE_FOLHA_ARVORE registros (ou com `folha`) são folhas: trazem
+        `registros` {id: hash_conteudo} em vez de baldes. Ids que terminam antes da chave do
+        balde também vão em `registros`.
+        """
+        if tabela not in ('pacientes', 'agendamentos'):
+            return {'success': False, 'message': f'Tabela inválida: {tabela}'}
+        if not 1 <= nivel <= self.NIVEL_MAXIMO_ARVORE:
+            return {'success': False, 'message': f'nivel deve estar entre 1 e {self.NIVEL_MAXIMO_ARVORE}'}
+        condicoes, params = [], []
+        if prefixo:
+            condicoes.append("id >= ?")
+            params.append(prefixo)
+            fim = self._fim_prefixo(prefixo)
+            if fim is not None:
+                condicoes.append("id < ?")
+                params.append(fim)
+        if tabela == 'agendamentos' or not incluir_removidos:
+            condicoes.append(self._SQL_ATIVO)
+        where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        # Intervalo no índice do id: o custo cai com a profundidade do nó
+        linhas = self.conn.execute(f"SELECT id, hash_conteudo FROM {tabela}{where} ORDER BY id", params).fetchall()
+
+        folha = folha or len(linhas) <= self.LIMITE_FOLHA_ARVORE
+        inicio, fim_chave = len(prefixo), len(prefixo) + nivel
+        hash_no = hashlib.blake2b(digest_size=8)
+        registros: Dict[str, Optional[str]] = {}
+        baldes: Dict[str, list] = {}
+        for rid, hash_conteudo in linhas:
+            # Hash ausente entra como vazio: o registro diverge e vai para a comparação completa
+            item = f"{rid}\x1f{hash_conteudo or ''}\x1e".encode('utf-8')
+            hash_no.update(item)
+            if folha or len(rid) < fim_chave:
+                registros[rid] = hash_conteudo
+                continue
+            balde = baldes.get(rid[inicio:fim_chave])
+            if balde is None:
+                balde = baldes[rid[inicio:fim_chave]] = [0, hashlib.blake2b(digest_size=8)]
+            balde[0] += 1
+            balde[1].update(item)
+
+        no = {
+            'success': True,
+            'tabela': tabela,
+            'prefixo': prefixo,
+            'nivel': nivel,
+            'quantidade': len(linhas),
+            'hash': hash_no.hexdigest(),
+        }
+        if not folha:
+            no['baldes'] = {chave: [qtd, h.hexdigest()] for chave, (qtd, h) in baldes.items()}
+        if registros or folha:
+            no['registros'] = registros
+        return no
+
     def comparar_com_banco_remoto(self, pacientes_remotos: List[Dict]) -> Dict:
         """
         Compara o banco local com um banco remoto e detecta:
         - Pacientes que existem localmente mas não no remoto (removidos no remoto)
         - Pacientes que existem no remoto mas não localmente (novos no remoto)
-        - Pacientes que existem em ambos (para atualização)
+        - Pacientes que existem em ambos (para atualização), separando os alterados
+
+        Usa só id e hash_conteudo dos dois lados: o remoto pode mandar apenas
+        {"id", "hash_conteudo"} e só os removidos no remoto são lidos por inteiro.
+        Sem hash de um dos lados, o registro conta como alterado.
         """
-        pacientes_locais = self.obter_todos_pacientes()
-        pacientes_locais_ids = {p['id'] for p in pacientes_locais}
+        hashes_locais = {row[0]: row[1] for row in self.conn.execute("SELECT id, hash_conteudo FROM pacientes")}
         pacientes_remotos_ids = {p['id'] for p in pacientes_remotos}
-        
+
         # Pacientes que existem localmente mas não no remoto (removidos no remoto)
-        pacientes_removidos_no_remoto = [
-            p for p in pacientes_locais 
-            if p['id'] not in pacientes_remotos_ids
-        ]
-        
+        pacientes_removidos_no_remoto = sorted(
+            self.buscar_pacientes_por_ids(i for i in hashes_locais if i not in pacientes_remotos_ids),
+            key=lambda p: p.get('data_salvamento') or '', reverse=True
+        )
+
         # Pacientes que existem no remoto mas não localmente (novos)
         pacientes_novos = [
             p for p in pacientes_remotos 
-            if p['id'] not in pacientes_locais_ids
+            if p['id'] not in hashes_locais
         ]
         
         # Pacientes que existem em ambos (podem precisar atualização)
         pacientes_em_ambos = [
             p for p in pacientes_remotos 
-            if p['id'] in pacientes_locais_ids
+            if p['id'] in hashes_locais
+        ]
+        pacientes_alterados = [
+            p for p in pacientes_em_ambos
+            if not p.get('hash_conteudo') or p.get('hash_conteudo') != hashes_locais[p['id']]
         ]
         
         return {
             'pacientes_removidos_no_remoto': pacientes_removidos_no_remoto,
             'pacientes_novos': pacientes_novos,
             'pacientes_em_ambos': pacientes_em_ambos,
-            'total_local': len(pacientes_locais),
+            'pacientes_alterados': pacientes_alterados,
+            'total_identicos': len(pacientes_em_ambos) - len(pacientes_alterados),
+            'total_local': len(hashes_locais),
             'total_remoto': len(pacientes_remotos)
         }
 
+    @_escrita
     def remover_pacientes(self, paciente_ids: List[str]) -> Dict:
         """Remove múltiplos pacientes por seus IDs"""
         try:
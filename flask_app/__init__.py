@@ -1,7 +1,7 @@
 """
 Aplicação Flask - Sistema de Gestão de Pacientes.
 Módulos: db, paginas, api_version, discovery, pacientes, agendamentos,
-sync, backup, indicadores, tema, exportar, ajuda.
+sync, sincronizador, backup, indicadores, tema, exportar, ajuda, manutencao, cache, compressao.
 """
 import atexit
 import os
@@ -18,12 +18,18 @@ from .agendamentos import bp as agendamentos_bp
 from .ajuda import bp as ajuda_bp
 from .api_version import bp as api_version_bp
 from .backup import bp as backup_bp
+from .cache import bp as cache_bp
+from .compressao import CompressaoHTTP
 from .db import _get_db_for_port, atualizar_discovery_peers, db, get_db
 from .discovery import bp as discovery_bp
 from .exportar import bp as exportar_bp
 from .indicadores import bp as indicadores_bp
+from .manutencao import bp as manutencao_bp
+from .manutencao import iniciar_manutencao, parar_manutencao
 from .paginas import bp as paginas_bp
 from .pacientes import bp as pacientes_bp
+from .sincronizador import bp as sincronizador_bp
+from .sincronizador import iniciar_sincronizador, parar_sincronizador
 from .sync import create_sync_blueprint
 from .tema import bp as tema_bp
 
@@ -43,17 +49,32 @@ def _inject_version():
     return {"version": VERSION, "build_date": BUILD_DATE}
 
 
+@_app.teardown_request
+def _liberar_conexao_db(_exc=None):
+    """Devolve ao pool a conexão de leitura usada pelo request."""
+    try:
+        get_db().liberar_conexao()
+    except Exception:
+        pass
+
+
 _app.register_blueprint(paginas_bp)
 _app.register_blueprint(api_version_bp)
 _app.register_blueprint(discovery_bp)
 _app.register_blueprint(pacientes_bp)
 _app.register_blueprint(agendamentos_bp)
 _app.register_blueprint(create_sync_blueprint())
+_app.register_blueprint(sincronizador_bp)
 _app.register_blueprint(backup_bp)
 _app.register_blueprint(indicadores_bp)
 _app.register_blueprint(tema_bp)
 _app.register_blueprint(exportar_bp)
 _app.register_blueprint(ajuda_bp)
+_app.register_blueprint(manutencao_bp)
+_app.register_blueprint(cache_bp)
+
+# gzip/zstd conforme o Accept-Encoding (respostas) e Content-Encoding (corpos recebidos)
+_app.wsgi_app = CompressaoHTTP.do_ambiente(_app.wsgi_app)
 
 # Compatibilidade: nome usado externamente
 app = _app
@@ -95,6 +116,10 @@ def run_flask(debug=False, use_reloader=False, silent=False, port=None):
             start_zeroconf(port)
     except Exception:
         pass
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # Com o reloader, só o processo filho (o que serve) roda a manutenção e o sync com os peers
+        iniciar_manutencao(db_instance)
+        iniciar_sincronizador(db_instance, port)
     if use_reloader:
         _app.run(host=host, port=port, debug=debug, use_reloader=use_reloader)
     else:
@@ -135,6 +160,8 @@ def run_flask(debug=False, use_reloader=False, silent=False, port=None):
 
 def cleanup_flask():
     global _flask_server, _flask_servers
+    parar_manutencao()
+    parar_sincronizador()
     for port, server in list(_flask_servers.items()):
         try:
             print(f"Encerrando servidor Flask na porta {port}...")
@@ -7,12 +7,13 @@ from datetime import datetime
 
 from flask import Blueprint, jsonify, make_response, request, send_file
 
-from .db import db
+from .db import db, leitura_instantanea
 
 bp = Blueprint("api_backup", __name__, url_prefix="/api/backup")
 
 
 @bp.route("/criar", methods=["GET"])
+@leitura_instantanea
 def criar_backup():
     try:
         return jsonify(db.criar_backup())
@@ -21,6 +22,7 @@ def criar_backup():
 
 
 @bp.route("/download", methods=["GET"])
+@leitura_instantanea
 def download_backup():
     try:
         resultado = db.criar_backup()
@@ -0,0 +1,119 @@
+"""
+Cache em memória das respostas de leitura (indicadores, rankings, unidades, campos) e
+API de acompanhamento: /api/cache.
+
+Chave: banco + rota + argumentos. Cada entrada guarda o token Database.versao_dados()
+lido antes de calcular a resposta; qualquer COMMIT no arquivo (de outra thread ou de
+outro processo) muda o token e a entrada deixa de valer.
+"""
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Blueprint, jsonify, make_response, request
+
+from .db import get_db
+
+bp = Blueprint("api_cache", __name__, url_prefix="/api/cache")
+
+
+class CacheRespostas:
+    """LRU limitado pelo tamanho dos corpos guardados (bytes), com contadores de acerto/erro."""
+
+    # Custo fixo estimado por entrada (chave, tupla, cabeçalhos)
+    CUSTO_ENTRADA = 256
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.acertos = 0
+        self.erros = 0
+        self.invalidados = 0
+        self.despejados = 0
+
+    def obter(self, chave, versao):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada[0] == versao:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada
+            if entrada is not None:
+                self._remover(chave)
+                self.invalidados += 1
+            self.erros += 1
+            return None
+
+    def guardar(self, chave, versao, corpo, mimetype):
+        tamanho = len(corpo) + self.CUSTO_ENTRADA
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = (versao, corpo, mimetype, tamanho)
+            self.bytes += tamanho
+            while self.bytes > self.max_bytes:
+                self._remover(next(iter(self._entradas)))
+                self.despejados += 1
+
+    def _remover(self, chave):
+        self.bytes -= self._entradas.pop(chave)[3]
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.erros
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "acertos": self.acertos,
+                "erros": self.erros,
+                "taxa_acerto": round(self.acertos / consultas, 3) if consultas else 0,
+                "invalidados": self.invalidados,
+                "despejados": self.despejados,
+            }
+
+
+cache_respostas = CacheRespostas(int(float(os.getenv("CACHE_RESPOSTAS_MB", "32")) * 1024 * 1024))
+
+
+def resposta_em_cache(view):
+    """Guarda respostas 200 da view; devolve a guardada enquanto o banco não mudar."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        database = get_db()
+        chave = (database.db_path, request.path, tuple(sorted(request.args.items(multi=True))))
+        # Token lido antes do cálculo: um COMMIT no meio deixa a entrada já vencida
+        versao = database.versao_dados()
+        entrada = cache_respostas.obter(chave, versao)
+        if entrada is not None:
+            resposta = make_response(entrada[1])
+            resposta.mimetype = entrada[2]
+            return resposta
+        resposta = make_response(view(*args, **kwargs))
+        if resposta.status_code == 200 and not resposta.direct_passthrough:
+            cache_respostas.guardar(chave, versao, resposta.get_data(), resposta.mimetype)
+        return resposta
+
+    return wrapper
+
+
+@bp.route("", methods=["GET"])
+def status_cache():
+    return jsonify({"success": True, **cache_respostas.estatisticas()})
+
+
+@bp.route("/limpar", methods=["POST"])
+def limpar_cache():
+    cache_respostas.limpar()
+    return jsonify({"success": True, "message": "Cache limpo"})
@@ -0,0 +1,305 @@
+"""
+Compressão HTTP: middleware WSGI (instalado em __init__.py) que comprime as respostas
+em zstd ou gzip conforme o Accept-Encoding e descomprime corpos de requisição enviados
+com Content-Encoding (ex.: POST /api/sync/merge de outro servidor).
+
+- Só tipos de texto (JSON, NDJSON, HTML, CSS, JS...), e só corpos a partir de
+  COMPRESSAO_MINIMO_BYTES: abaixo disso o cabeçalho gzip não compensa.
+- Resposta com Content-Length é comprimida de uma vez. Resposta em fluxo (gerador, sem
+  Content-Length, ex.: cópia NDJSON do sync) é comprimida pedaço a pedaço, com flush a
+  cada pedaço: o cliente continua recebendo linhas inteiras enquanto a cópia é gerada.
+- Corpo de requisição descomprimido limitado a COMPRESSAO_MAX_CORPO_MB (padrão 256):
+  passou disso, a leitura levanta CorpoMuitoGrande e o merge responde 413.
+- zstd só com o pacote zstandard instalado (opcional); senão só gzip.
+"""
+import io
+import json
+import os
+import zlib
+
+from werkzeug.wsgi import get_input_stream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TIPOS_COMPRIMIVEIS = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+)
+TAMANHO_LEITURA_CORPO = 64 * 1024
+_ERROS_DESCOMPRESSAO = (zlib.error, ValueError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def codificacoes_suportadas():
+    """Codificações do servidor, na ordem de preferência."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def escolher_codificacao(accept_encoding, suportadas):
+    """
+    Primeira codificação de `suportadas` aceita pelo cliente (q > 0) no Accept-Encoding;
+    None = sem compressão. Um q=0 explícito vence o curinga "*".
+    """
+    aceitas = {}
+    for parte in (accept_encoding or "").split(","):
+        nome, _, parametros = parte.partition(";")
+        nome = nome.strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        for parametro in parametros.split(";"):
+            chave, _, valor = parametro.partition("=")
+            if chave.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        aceitas[nome] = q
+    if "x-gzip" in aceitas:
+        aceitas.setdefault("gzip", aceitas["x-gzip"])
+    for codificacao in suportadas:
+        if aceitas.get(codificacao, aceitas.get("*", 0.0)) > 0:
+            return codificacao
+    return None
+
+
+class Compressor:
+    """Compressor incremental de uma resposta (gzip com cabeçalho, ou frame zstd)."""
+
+    def __init__(self, codificacao, nivel_gzip=6, nivel_zstd=3):
+        if codificacao == "zstd":
+            self._zstd = zstandard.ZstdCompressor(level=nivel_zstd)
+            self._obj = self._zstd.compressobj()
+            self._flush_parcial = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._zstd = None
+            self._obj = zlib.compressobj(nivel_gzip, zlib.DEFLATED, 31)
+            self._flush_parcial = zlib.Z_SYNC_FLUSH
+
+    def comprimir(self, dados, flush=False):
+        saida = self._obj.compress(dados)
+        return saida + self._obj.flush(self._flush_parcial) if flush else saida
+
+    def finalizar(self):
+        return self._obj.flush()
+
+    def comprimir_tudo(self, dados):
+        """Corpo inteiro de uma vez (no zstd, o frame leva o tamanho original no cabeçalho)."""
+        if self._zstd is not None:
+            return self._zstd.compress(dados)
+        return self.comprimir(dados) + self.finalizar()
+
+
+class CorpoMuitoGrande(ValueError):
+    """Corpo descomprimido passou do limite (a rota responde 413)."""
+
+
+class CorpoDescomprimido(io.RawIOBase):
+    """
+    Corpo da requisição descomprimido sob demanda (vira wsgi.input, dentro de um
+    BufferedReader). Cada leitura devolve no máximo TAMANHO_LEITURA_CORPO bytes
+    descomprimidos, e passar de `limite_bytes` no total levanta CorpoMuitoGrande: um corpo
+    pequeno e muito repetitivo não se expande sem limite na memória.
+    """
+
+    def __init__(self, origem, codificacao, limite_bytes=None):
+        self._origem = origem
+        self._codificacao = codificacao
+        self._limite = limite_bytes
+        self._total = 0
+        if codificacao == "zstd":
+            self._leitor = zstandard.ZstdDecompressor().stream_reader(origem, read_size=TAMANHO_LEITURA_CORPO)
+        else:
+            self._obj = zlib.decompressobj(31)
+        self._pendente = memoryview(b"")
+        self._fim = False
+
+    def readable(self):
+        return True
+
+    def _proximo_pedaco(self):
+        """Até TAMANHO_LEITURA_CORPO bytes descomprimidos; b"" no fim do corpo."""
+        if self._codificacao == "zstd":
+            return self._leitor.read(TAMANHO_LEITURA_CORPO)
+        while True:
+            bruto = self._obj.unconsumed_tail or self._origem.read(TAMANHO_LEITURA_CORPO)
+            if not bruto:
+                if not self._obj.eof:
+                    raise ValueError("corpo truncado")
+                return b""
+            dados = self._obj.decompress(bruto, TAMANHO_LEITURA_CORPO)
+            if dados or self._obj.eof:
+                return dados
+
+    def readinto(self, destino):
+        while not self._pendente and not self._fim:
+            try:
+                dados = self._proximo_pedaco()
+            except _ERROS_DESCOMPRESSAO as e:
+                raise ValueError(f"Corpo {self._codificacao} inválido: {e}")
+            if not dados:
+                self._fim = True
+                break
+            self._total += len(dados)
+            if self._limite is not None and self._total > self._limite:
+                raise CorpoMuitoGrande(
+                    f"Corpo {self._codificacao} passa de {self._limite // (1024 * 1024)} MB descomprimido"
+                )
+            self._pendente = memoryview(dados)
+        n = min(len(destino), len(self._pendente))
+        destino[:n] = self._pendente[:n]
+        self._pendente = self._pendente[n:]
+        return n
+
+
+class CompressaoHTTP:
+    """Middleware WSGI: envolve app.wsgi_app."""
+
+    def __init__(self, app, minimo_bytes=1024, nivel_gzip=6, nivel_zstd=3, ativo=True,
+                 max_corpo_bytes=256 * 1024 * 1024):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+        # Limite do corpo de requisição depois de descomprimido (None = sem limite)
+        self.max_corpo_bytes = max_corpo_bytes
+        self.nivel_gzip = nivel_gzip
+        self.nivel_zstd = nivel_zstd
+        # Desativado só deixa de comprimir respostas; corpos comprimidos continuam aceitos
+        self.ativo = ativo
+        self.suportadas = codificacoes_suportadas()
+
+    @classmethod
+    def do_ambiente(cls, app):
+        return cls(
+            app,
+            minimo_bytes=int(os.getenv("COMPRESSAO_MINIMO_BYTES", "1024")),
+            nivel_gzip=int(os.getenv("COMPRESSAO_NIVEL_GZIP", "6")),
+            nivel_zstd=int(os.getenv("COMPRESSAO_NIVEL_ZSTD", "3")),
+            ativo=os.getenv("COMPRESSAO", "1").strip().lower() not in ("0", "false", "off"),
+            max_corpo_bytes=int(float(os.getenv("COMPRESSAO_MAX_CORPO_MB", "256")) * 1024 * 1024) or None,
+        )
+
+    def __call__(self, environ, start_response):
+        codificacao_corpo = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if codificacao_corpo and codificacao_corpo != "identity":
+            if codificacao_corpo == "x-gzip":
+                codificacao_corpo = "gzip"
+            if codificacao_corpo not in self.suportadas:
+                return self._recusar_corpo(codificacao_corpo, start_response)
+            corpo = CorpoDescomprimido(get_input_stream(environ), codificacao_corpo, self.max_corpo_bytes)
+            environ["wsgi.input"] = io.BufferedReader(corpo, TAMANHO_LEITURA_CORPO)
+            # Tamanho descomprimido desconhecido: lido até o fim do stream
+            environ["wsgi.input_terminated"] = True
+            environ.pop("CONTENT_LENGTH", None)
+            del environ["HTTP_CONTENT_ENCODING"]
+
+        # Accept-Encoding na resposta: codificações aceitas nos corpos de requisição (RFC 9110,
+        # 12.5.3); é por ele que outro servidor sabe que pode mandar o merge comprimido
+        aceitas = ("Accept-Encoding", ", ".join(self.suportadas))
+        codificacao = None
+        if self.ativo and environ.get("REQUEST_METHOD") != "HEAD":
+            codificacao = escolher_codificacao(environ.get("HTTP_ACCEPT_ENCODING"), self.suportadas)
+        if codificacao is None:
+            return self.app(environ, lambda status, headers, exc_info=None: start_response(
+                status, headers + [aceitas], exc_info))
+
+        resposta = {}
+
+        def capturar(status, headers, exc_info=None):
+            resposta.update(status=status, headers=headers + [aceitas], exc_info=exc_info)
+            # O write() legado do WSGI não é usado pelo Flask
+            return lambda dados: None
+
+        app_iter = self.app(environ, capturar)
+        status, headers = resposta["status"], resposta["headers"]
+        tamanho = self._tamanho_se_comprimivel(status, headers)
+        if tamanho is False:
+            start_response(status, headers, resposta["exc_info"])
+            return app_iter
+
+        compressor = Compressor(codificacao, self.nivel_gzip, self.nivel_zstd)
+        headers = self._cabecalhos_comprimidos(headers, codificacao)
+        if tamanho is None:
+            start_response(status, headers, resposta["exc_info"])
+            return self._em_fluxo(app_iter, compressor)
+
+        try:
+            original = b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+        comprimido = compressor.comprimir_tudo(original)
+        if len(comprimido) >= len(original):
+            start_response(status, resposta["headers"], resposta["exc_info"])
+            return [original]
+        headers.append(("Content-Length", str(len(comprimido))))
+        start_response(status, headers, resposta["exc_info"])
+        return [comprimido]
+
+    def _tamanho_se_comprimivel(self, status, headers):
+        """False = não comprimir; None = fluxo (sem Content-Length); senão o tamanho."""
+        try:
+            codigo = int(status.split(None, 1)[0])
+        except (ValueError, IndexError):
+            return False
+        if codigo < 200 or codigo >= 300 or codigo in (204, 206):
+            return False
+        cabecalhos = {nome.lower(): valor for nome, valor in headers}
+        if "content-encoding" in cabecalhos or "no-transform" in cabecalhos.get("cache-control", ""):
+            return False
+        if not cabecalhos.get("content-type", "").startswith(TIPOS_COMPRIMIVEIS):
+            return False
+        if "content-length" not in cabecalhos:
+            return None
+        try:
+            tamanho = int(cabecalhos["content-length"])
+        except ValueError:
+            return False
+        return tamanho if tamanho >= self.minimo_bytes else False
+
+    @staticmethod
+    def _cabecalhos_comprimidos(headers, codificacao):
+        novos = []
+        vary = []
+        for nome, valor in headers:
+            minusculo = nome.lower()
+            if minusculo == "content-length":
+                continue
+            if minusculo == "vary":
+                vary.append(valor)
+                continue
+            if minusculo == "etag" and not valor.startswith("W/"):
+                # Outra representação do mesmo conteúdo: o ETag forte deixa de valer byte a byte
+                valor = "W/" + valor
+            novos.append((nome, valor))
+        if not any(v.strip() == "*" or "accept-encoding" in v.lower() for v in vary):
+            vary.append("Accept-Encoding")
+        novos.append(("Vary", ", ".join(vary)))
+        novos.append(("Content-Encoding", codificacao))
+        return novos
+
+    @staticmethod
+    def _em_fluxo(app_iter, compressor):
+        try:
+            for pedaco in app_iter:
+                if pedaco:
+                    saida = compressor.comprimir(pedaco, flush=True)
+                    if saida:
+                        yield saida
+            yield compressor.finalizar()
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    def _recusar_corpo(self, codificacao, start_response):
+        corpo = json.dumps({
+            "success": False,
+            "message": f"Content-Encoding não suportado: {codificacao} (aceitos: {', '.join(self.suportadas)})",
+        }, ensure_ascii=False).encode("utf-8")
+        start_response("415 Unsupported Media Type", [
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(corpo))),
+            ("Accept-Encoding", ", ".join(self.suportadas)),
+        ])
+        return [corpo]
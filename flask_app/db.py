@@ -1,12 +1,12 @@
 """
 Banco de dados e proxy por porta/thread. Estado de discovery (scan).
 """
+import functools
 import os
 import threading
-from database import Database
+from database import Database, db as _db_default
 
-# Instância global padrão
-_db_default = Database()
+# Instância global padrão: a mesma de database.db (schema verificado uma vez por processo)
 _db_instances = {}
 _thread_local = threading.local()
 
@@ -49,6 +49,17 @@ def get_db():
     return _db_default
 
 
+def leitura_instantanea(view):
+    """Roda a view dentro de get_db().instantaneo(): leituras num snapshot somente leitura."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with get_db().instantaneo():
+            return view(*args, **kwargs)
+
+    return wrapper
+
+
 def _get_local_ip():
     import socket
 
@@ -94,7 +105,7 @@ def _get_db_for_port(port):
             _db_instances[port] = Database(db_path=db_path)
             print(f"Banco configurado para porta {port}: {db_path}")
         else:
-            _db_instances[port] = Database()
+            _db_instances[port] = _db_default
     return _db_instances[port]
 
 
@@ -6,7 +6,7 @@ from datetime import datetime
 
 from flask import Blueprint, jsonify, make_response, request, send_file
 
-from .db import db
+from .db import db, leitura_instantanea
 from .exportar_helpers import (
     aplicar_filtros_exportacao,
     obter_colunas_config,
@@ -111,6 +111,7 @@ def _exportar_txt(pacientes, colunas_personalizadas=None):
 
 
 @bp.route("/exportar/<formato>", methods=["GET"])
+@leitura_instantanea
 def exportar_pacientes(formato):
     try:
         pacientes = db.obter_todos_pacientes()
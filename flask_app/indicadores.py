@@ -3,7 +3,8 @@ API: Indicadores, unidades de saúde, ranking, campos disponíveis, temporais.
 """
 from flask import Blueprint, jsonify, request
 
-from .db import db
+from .cache import resposta_em_cache
+from .db import db, leitura_instantanea
 
 bp = Blueprint("api_indicadores", __name__, url_prefix="/api")
 
@@ -58,6 +59,7 @@ FILTROS_TEMPORAIS = [
 
 
 @bp.route("/indicadores", methods=["GET"])
+@resposta_em_cache
 def indicadores():
     try:
         unidade_saude = request.args.get("unidade_saude")
@@ -86,6 +88,7 @@ def indicadores():
 
 
 @bp.route("/unidades_saude", methods=["GET"])
+@resposta_em_cache
 def listar_unidades_saude():
     try:
         unidades = db.obter_unidades_saude_unicas()
@@ -95,6 +98,8 @@ def listar_unidades_saude():
 
 
 @bp.route("/ranking_unidades", methods=["GET"])
+@resposta_em_cache
+@leitura_instantanea
 def ranking_unidades():
     try:
         criterio = request.args.get("criterio", "inicio_pre_natal_antes_12s")
@@ -117,7 +122,12 @@ def ranking_unidades():
                 }), 400
             label = criterio
 
-        unidades = db.obter_unidades_saude_unicas()
+        # Uma consulta agrupada para todas as unidades (custo não cresce com o nº de unidades)
+        if criterio_hardcoded:
+            por_unidade = db.obter_estatisticas_por_unidade()
+        else:
+            por_unidade = db.obter_estatisticas_coluna_por_unidade(criterio).get("data", {})
+        unidades = list(por_unidade.keys())
         if unidades_param:
             req_list = [x.strip() for x in unidades_param.split(",") if x.strip()]
             req_set = set((x or "").lower() for x in req_list)
@@ -125,7 +135,7 @@ def ranking_unidades():
         ranking = []
         for u in unidades:
             if criterio_hardcoded:
-                s = db.obter_estatisticas(unidade_saude=u)
+                s = por_unidade[u]["estatisticas"]
                 total = s["total_pacientes"]
                 if criterio == "vacinas_completas":
                     d = s["vacinas_completas"]
@@ -143,9 +153,9 @@ def ranking_unidades():
                     den = pos + sum(d.get(k, 0) for k in neg_keys)
                     pct = (pos / den * 100) if den else 0
             else:
-                stats = db.obter_estatisticas_coluna(criterio, unidade_saude=u)
-                pos = stats["data"].get("sim", 0)
-                den = pos + stats["data"].get("nao", 0)
+                stats = por_unidade[u]
+                pos = stats.get("sim", 0)
+                den = pos + stats.get("nao", 0)
                 total = den
                 pct = (pos / den * 100) if den else 0
             ranking.append({"unidade": u, "total": total, "percentual": round(pct, 1), "criterio_label": label})
@@ -169,9 +179,10 @@ def obter_indicador_coluna(nome_coluna):
 
 
 @bp.route("/campos_disponiveis", methods=["GET"])
+@resposta_em_cache
 def listar_campos_disponiveis():
     try:
-        excluidos = {"id", "nome_gestante", "unidade_saude", "data_salvamento", "arquivo_origem"}
+        excluidos = {"id", "nome_gestante", "unidade_saude", "unidade_id", "data_salvamento", "arquivo_origem"}
         cursor = db.conn.cursor()
         cursor.execute("PRAGMA table_info(pacientes)")
         colunas = cursor.fetchall()
@@ -200,11 +211,24 @@ def indicadores_temporais(filtro):
     try:
         if filtro not in FILTROS_TEMPORAIS:
             return jsonify({"error": "Filtro inválido"}), 400
-        return jsonify(db.obter_estatisticas_temporais(filtro))
+        unidade_saude = request.args.get("unidade_saude")
+        return jsonify(db.obter_estatisticas_temporais(filtro, unidade_saude))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route("/indicadores/reconstruir", methods=["POST"])
+def reconstruir_indicadores():
+    """Recalcula a tabela indicadores_diarios a partir de pacientes (ex.: após edição manual do .db)."""
+    try:
+        resultado = db.reconstruir_indicadores_diarios()
+        if resultado["success"]:
+            return jsonify(resultado)
+        return jsonify(resultado), 500
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 # Critérios usados no ranking geral (score = média dos % positivos, ou média ponderada com travas)
 CRITERIOS_RANKING_GERAL = [
     "inicio_pre_natal_antes_12s",
@@ -320,22 +344,24 @@ def _aplicar_penalidade_ausencia(s, total: int) -> float:
 
 
 @bp.route("/ranking_unidades_geral", methods=["GET"])
+@resposta_em_cache
+@leitura_instantanea
 def ranking_unidades_geral():
     """Ranking geral. Com ?trava=1 (padrão): travas ativas. Com ?trava=0: ranking simples (média, sem filtros)."""
     try:
         trava = request.args.get("trava", "1").strip().lower() in ("1", "true", "sim", "on", "yes")
-        unidades = db.obter_unidades_saude_unicas()
+        # Estatísticas + dados completos de todas as unidades numa única consulta agrupada
+        por_unidade = db.obter_estatisticas_por_unidade()
         ranking = []
 
-        for u in unidades:
-            s = db.obter_estatisticas(unidade_saude=u)
+        for u, dados in por_unidade.items():
+            s = dados["estatisticas"]
             total = s["total_pacientes"]
             if total == 0:
                 continue
 
             if trava:
-                total_db, completos = db.obter_contagem_dados_completos(unidade_saude=u)
-                if not _unidade_atende_trava1(total_db, completos):
+                if not _unidade_atende_trava1(dados["total"], dados["completos"]):
                     continue
 
             pcts = {c: _percentual_positivo(s, c) for c in CRITERIOS_RANKING_GERAL}
@@ -0,0 +1,246 @@
+"""
+Manutenção do SQLite em segundo plano (checkpoint do WAL, estatísticas, VACUUM incremental)
+e API de administração: /api/manutencao.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+
+from .db import db, get_db
+
+bp = Blueprint("api_manutencao", __name__, url_prefix="/api/manutencao")
+
+# Um agendador por arquivo de banco (run_flask pode subir mais de uma porta)
+_agendadores = {}
+_agendadores_lock = threading.Lock()
+
+
+class AgendadorManutencao:
+    """
+    Thread que, a cada `intervalo` segundos:
+    - checkpoint do WAL quando o -wal passa de `wal_limite_bytes` (PASSIVE com escritas
+      recentes; TRUNCATE com o banco ocioso, o que também zera o arquivo);
+    - otimizar_estatisticas() depois de `escritas_otimizar` blocos de escrita da aplicação;
+    - vacuum_incremental() com o banco ocioso e ao menos `paginas_livres_min` páginas livres
+      (só com auto_vacuum incremental: a conversão, um VACUUM completo, fica para
+      POST /api/manutencao/executar com "converter": true);
+    - compactar_mudancas() com o banco ocioso, no máximo a cada `compactar_seg` segundos.
+    Ocioso = nenhuma escrita da aplicação há `ocioso_seg` segundos (as da própria
+    manutenção não contam).
+    """
+
+    def __init__(self, database, intervalo=60.0, wal_limite_bytes=16 * 1024 * 1024,
+                 escritas_otimizar=1000, ocioso_seg=300.0, paginas_livres_min=256, paginas_vacuum=2048,
+                 compactar_seg=6 * 3600.0, dias_exclusoes=90):
+        self.db = database
+        self.intervalo = intervalo
+        self.wal_limite_bytes = wal_limite_bytes
+        self.escritas_otimizar = escritas_otimizar
+        self.ocioso_seg = ocioso_seg
+        self.paginas_livres_min = paginas_livres_min
+        self.paginas_vacuum = paginas_vacuum
+        self.compactar_seg = compactar_seg
+        self.dias_exclusoes = dias_exclusoes
+        self._ultima_compactacao = None
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._escritas_proprias = 0
+        self._escritas_vistas = 0
+        self._escritas_ultima_otimizacao = 0
+        self._ocioso_desde = time.monotonic()
+        self.ultimas = {}
+        self.erros_ciclo = 0
+
+    @classmethod
+    def do_ambiente(cls, database):
+        return cls(
+            database,
+            intervalo=float(os.getenv("MANUTENCAO_INTERVALO", "60")),
+            wal_limite_bytes=int(float(os.getenv("MANUTENCAO_WAL_MB", "16")) * 1024 * 1024),
+            escritas_otimizar=int(os.getenv("MANUTENCAO_ESCRITAS_OTIMIZAR", "1000")),
+            ocioso_seg=float(os.getenv("MANUTENCAO_OCIOSO_SEG", "300")),
+            paginas_livres_min=int(os.getenv("MANUTENCAO_PAGINAS_LIVRES_MIN", "256")),
+            paginas_vacuum=int(os.getenv("MANUTENCAO_PAGINAS_VACUUM", "2048")),
+            compactar_seg=float(os.getenv("MANUTENCAO_COMPACTAR_HORAS", "6")) * 3600,
+            dias_exclusoes=int(os.getenv("MANUTENCAO_DIAS_EXCLUSOES", "90")),
+        )
+
+    def _escritas_aplicacao(self):
+        return self.db._pool.escritas - self._escritas_proprias
+
+    def executar(self, tarefa, **kwargs):
+        """Roda uma tarefa (checkpoint, otimizar, vacuum, compactar) e registra duração e páginas antes/depois."""
+        metodos = {
+            "checkpoint": self.db.checkpoint_wal,
+            "otimizar": self.db.otimizar_estatisticas,
+            "vacuum": self.db.vacuum_incremental,
+            "compactar": self.db.compactar_mudancas,
+        }
+        if tarefa not in metodos:
+            return {"success": False, "message": f"Tarefa inválida: {tarefa}"}
+        with self._lock:
+            antes = self.db.estado_armazenamento()
+            escritas = self.db._pool.escritas
+            inicio = time.perf_counter()
+            resultado = metodos[tarefa](**kwargs)
+            duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            self._escritas_proprias += self.db._pool.escritas - escritas
+            if tarefa == "otimizar" and resultado.get("success"):
+                self._escritas_ultima_otimizacao = self._escritas_aplicacao()
+            if tarefa == "compactar":
+                self._ultima_compactacao = time.monotonic()
+            self.ultimas[tarefa] = {
+                **resultado,
+                "executado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "duracao_ms": duracao_ms,
+                "antes": antes,
+                "depois": self.db.estado_armazenamento(),
+            }
+            return self.ultimas[tarefa]
+
+    def ciclo(self):
+        """Um passo do agendador: decide e roda as tarefas devidas."""
+        agora = time.monotonic()
+        escritas = self._escritas_aplicacao()
+        if escritas != self._escritas_vistas:
+            self._escritas_vistas = escritas
+            self._ocioso_desde = agora
+        ocioso = agora - self._ocioso_desde >= self.ocioso_seg
+
+        if escritas - self._escritas_ultima_otimizacao >= self.escritas_otimizar:
+            self.executar("otimizar")
+        if ocioso and (self._ultima_compactacao is None or agora - self._ultima_compactacao >= self.compactar_seg):
+            # Antes do VACUUM, que devolve as páginas liberadas aqui
+            self.executar("compactar", dias_exclusoes=self.dias_exclusoes)
+        estado = self.db.estado_armazenamento()
+        if ocioso and estado["paginas_livres"] >= self.paginas_livres_min:
+            if estado["auto_vacuum"] == "incremental":
+                self.executar("vacuum", paginas=self.paginas_vacuum)
+            else:
+                self.ultimas["vacuum"] = {
+                    "success": False,
+                    "ignorado": True,
+                    "message": f"VACUUM incremental ignorado: auto_vacuum = {estado['auto_vacuum']}. "
+                               "Converta com POST /api/manutencao/executar "
+                               "{\"tarefa\": \"vacuum\", \"converter\": true}",
+                    "executado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "antes": estado,
+                }
+        # Por último: o VACUUM também passa pelo WAL
+        if self.db.estado_armazenamento()["wal_bytes"] >= self.wal_limite_bytes:
+            self.executar("checkpoint", modo="TRUNCATE" if ocioso else "PASSIVE")
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.ciclo()
+            except Exception as e:
+                # Fica no status (GET /api/manutencao) em vez de sumir com a thread em segundo plano
+                self.erros_ciclo += 1
+                self.ultimas["erro_ciclo"] = {
+                    "success": False,
+                    "message": f"{type(e).__name__}: {e}",
+                    "executado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="manutencao-sqlite", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+
+    def status(self):
+        return {
+            "ativo": self._thread is not None and self._thread.is_alive(),
+            "intervalo": self.intervalo,
+            "wal_limite_bytes": self.wal_limite_bytes,
+            "escritas_otimizar": self.escritas_otimizar,
+            "ocioso_seg": self.ocioso_seg,
+            "paginas_livres_min": self.paginas_livres_min,
+            "escritas_desde_otimizacao": self._escritas_aplicacao() - self._escritas_ultima_otimizacao,
+            "erros_ciclo": self.erros_ciclo,
+            "ultimas": self.ultimas,
+        }
+
+
+def agendador_para(database):
+    """Agendador do banco (criado, sem iniciar, na primeira chamada)."""
+    with _agendadores_lock:
+        ag = _agendadores.get(database.db_path)
+        if ag is None:
+            ag = _agendadores[database.db_path] = AgendadorManutencao.do_ambiente(database)
+        return ag
+
+
+def iniciar_manutencao(database):
+    """Inicia a thread de manutenção do banco (MANUTENCAO=0 desativa). Retorna o agendador ou None."""
+    if os.getenv("MANUTENCAO", "1").strip().lower() in ("0", "false", "off"):
+        return None
+    return agendador_para(database).iniciar()
+
+
+def parar_manutencao():
+    with _agendadores_lock:
+        for ag in _agendadores.values():
+            ag.parar()
+
+
+@bp.route("", methods=["GET"])
+def status_manutencao():
+    try:
+        return jsonify({
+            "success": True,
+            "armazenamento": db.estado_armazenamento(),
+            **agendador_para(get_db()).status(),
+        })
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro ao obter status da manutenção: {str(e)}"}), 500
+
+
+@bp.route("/executar", methods=["POST"])
+def executar_manutencao():
+    """
+    Força uma tarefa: {"tarefa": "checkpoint"|"otimizar"|"vacuum"|"compactar", "modo": ...,
+    "paginas": ..., "converter": ..., "dias_exclusoes": ...}. "converter": true permite ao
+    vacuum converter o banco para auto_vacuum incremental (VACUUM completo).
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        tarefa = data.get("tarefa")
+        kwargs = {}
+        if tarefa == "checkpoint":
+            kwargs["modo"] = data.get("modo", "PASSIVE")
+        elif tarefa == "vacuum":
+            try:
+                kwargs["paginas"] = int(data.get("paginas", 0))
+            except (TypeError, ValueError):
+                return jsonify({"success": False, "message": "paginas deve ser um número inteiro"}), 400
+            kwargs["converter"] = data.get("converter") is True
+        elif tarefa == "compactar":
+            try:
+                kwargs["dias_exclusoes"] = int(data.get("dias_exclusoes", 90))
+            except (TypeError, ValueError):
+                return jsonify({"success": False, "message": "dias_exclusoes deve ser um número inteiro"}), 400
+        resultado = agendador_para(get_db()).executar(tarefa, **kwargs)
+        if resultado["success"]:
+            return jsonify(resultado)
+        return jsonify(resultado), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro na manutenção: {str(e)}"}), 500
+
+
+@bp.route("/planos", methods=["GET"])
+def verificar_planos():
+    try:
+        resultado = db.verificar_planos_consulta()
+        return jsonify(resultado), 200 if resultado["success"] else 409
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro ao verificar planos: {str(e)}"}), 500
@@ -31,8 +31,31 @@ def listar_pacientes():
             filtro["nome"] = request.args.get("nome")
         if request.args.get("unidade_saude"):
             filtro["unidade_saude"] = request.args.get("unidade_saude")
-        pacientes = db.buscar_pacientes(filtro if filtro else None)
-        return jsonify({"success": True, "total": len(pacientes), "pacientes": pacientes})
+        # Sem limit/cursor/sort/campos: lista completa, como antes
+        paginacao = {k: request.args.get(k) for k in ("limit", "cursor", "sort", "campos") if request.args.get(k)}
+        if not paginacao:
+            pacientes = db.buscar_pacientes(filtro if filtro else None)
+            return jsonify({"success": True, "total": len(pacientes), "pacientes": pacientes})
+        try:
+            limite = int(paginacao["limit"]) if "limit" in paginacao else None
+        except ValueError:
+            return jsonify({"success": False, "message": "limit deve ser um número inteiro"}), 400
+        campos = [c.strip() for c in paginacao.get("campos", "").split(",") if c.strip()]
+        resultado = db.buscar_pacientes_pagina(
+            filtro if filtro else None,
+            limite=limite,
+            cursor=paginacao.get("cursor"),
+            ordenacao=paginacao.get("sort"),
+            campos=campos or None,
+        )
+        if not resultado["success"]:
+            return jsonify(resultado), 400
+        return jsonify({
+            "success": True,
+            "total": len(resultado["pacientes"]),
+            "pacientes": resultado["pacientes"],
+            "next_cursor": resultado["next_cursor"],
+        })
     except Exception as e:
         import traceback
 
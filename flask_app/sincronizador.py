@@ -0,0 +1,466 @@
+"""
+Sincronização servidor a servidor em segundo plano e API: /api/sync/servidor.
+
+Cada peer (descoberto por zeroconf/scan ou pedido pelo navegador) é puxado pelo sync
+incremental numa conexão keep-alive própria, e as páginas são mescladas direto no banco
+local: os dados cruzam a rede uma vez e não passam pelo navegador, que só dispara e
+acompanha pelo status. Cada execução é uma sessão gravada no banco (Database.abrir_sessao_sync),
+com o cursor confirmado junto com cada página: uma sessão que caiu no meio, mesmo com o
+servidor reiniciado, é retomada da última página mesclada.
+
+Os peers devidos são sincronizados em rodadas: em paralelo num pool limitado
+(SYNC_AUTO_PARALELO), cada um na sua conexão, com as escritas serializadas pela conexão de
+escrita do banco (uma transação por página). A ordem é sorteada a cada rodada e, com
+SYNC_AUTO_FANOUT (padrão 3), só alguns peers entram em cada uma (gossip): como cada
+servidor também repassa o que puxou dos outros, uma alteração chega a todos em O(log N)
+rodadas sem que cada rodada fale com a rede inteira. Com 0, cada servidor puxa de todos
+em toda rodada: N² requisições por rodada na rede.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+
+from .db import get_db, get_discovery_state
+
+bp = Blueprint("api_sincronizador", __name__, url_prefix="/api/sync/servidor")
+
+# Um sincronizador por arquivo de banco (run_flask pode subir mais de uma porta)
+_sincronizadores = {}
+_sincronizadores_lock = threading.Lock()
+
+
+class PeerSync:
+    """Estado de um peer: conexão, sessão atual, falhas e resultado das execuções (cursor no banco)."""
+
+    def __init__(self, ip, port, hostname=None, descoberto=True):
+        self.ip = ip
+        self.port = int(port)
+        self.hostname = hostname or ip
+        self.descoberto = descoberto
+        # Pedido pelo navegador: entra na próxima rodada mesmo fora do fanout
+        self.solicitado = False
+        self.cursor = ""
+        self.sessao = None
+        self.conexao = None
+        self.estado = "aguardando"
+        self.falhas = 0
+        self.proxima = 0.0  # time.monotonic() da próxima execução
+        self.execucoes = 0
+        self.ultimo_sucesso = None
+        self.ultimo_erro = None
+        self.ultima_execucao = {}
+        self.progresso = {}
+
+    @property
+    def chave(self):
+        return f"{self.ip}:{self.port}"
+
+    def status(self, agora):
+        return {
+            "ip": self.ip,
+            "port": self.port,
+            "hostname": self.hostname,
+            "descoberto": self.descoberto,
+            "estado": self.estado,
+            "execucoes": self.execucoes,
+            "sessao": self.sessao,
+            "falhas": self.falhas,
+            "proxima_em_seg": max(0, round(self.proxima - agora)),
+            "ultimo_sucesso": self.ultimo_sucesso,
+            "ultimo_erro": self.ultimo_erro,
+            "ultima_execucao": self.ultima_execucao,
+            "progresso": self.progresso,
+            "conexao": self.conexao.estatisticas() if self.conexao is not None else None,
+        }
+
+
+class SincronizadorServidores:
+    """
+    Thread que puxa dos peers, cada um no seu horário:
+    - com sucesso, de novo depois de `intervalo` segundos;
+    - com falha, espera `backoff_inicial` * 2^(falhas - 1), até `backoff_max`, com ±20%
+      de variação para os PCs não voltarem todos juntos.
+    Peers pedidos pelo navegador (solicitar) entram na hora, sem esperar o backoff.
+    Os devidos de uma vez formam uma rodada (ciclo): até `paralelo` peers ao mesmo tempo,
+    em ordem sorteada; com `fanout` > 0, só `fanout` deles (mais os pedidos) e o resto fica
+    para a rodada seguinte.
+    """
+
+    def __init__(self, database, porta=None, intervalo=300.0, backoff_inicial=30.0, backoff_max=3600.0,
+                 limite=500, timeout=30.0, automatico=True, paralelo=4, fanout=3):
+        self.db = database
+        self.porta = porta
+        self.intervalo = intervalo
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+        self.limite = limite
+        self.timeout = timeout
+        # Sem automático só roda o que o navegador pedir
+        self.automatico = automatico
+        self.paralelo = max(1, paralelo)
+        # 0 = todos os devidos em cada rodada
+        self.fanout = max(0, fanout)
+        self.peers = {}
+        self.rodadas = 0
+        self.rodada = {}
+        # Exceção que escapou de um ciclo da thread (os erros de cada peer ficam no peer)
+        self.erros_ciclo = 0
+        self.ultimo_erro_ciclo = None
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def do_ambiente(cls, database, porta=None):
+        return cls(
+            database,
+            porta=porta,
+            intervalo=float(os.getenv("SYNC_AUTO_INTERVALO", "300")),
+            backoff_inicial=float(os.getenv("SYNC_AUTO_BACKOFF_INICIAL", "30")),
+            backoff_max=float(os.getenv("SYNC_AUTO_BACKOFF_MAX", "3600")),
+            limite=int(os.getenv("SYNC_AUTO_LIMITE", "500")),
+            timeout=float(os.getenv("SYNC_AUTO_TIMEOUT", "30")),
+            automatico=os.getenv("SYNC_AUTO", "1").strip().lower() not in ("0", "false", "off"),
+            paralelo=int(os.getenv("SYNC_AUTO_PARALELO", "4")),
+            fanout=int(os.getenv("SYNC_AUTO_FANOUT", "3")),
+        )
+
+    def _eh_local(self, ip, port):
+        from inicio.rede.leader import get_local_ip
+
+        return int(port) == self.porta and str(ip) in ("127.0.0.1", "localhost", get_local_ip())
+
+    def _descobertos(self):
+        """Peers do discovery (zeroconf ou scan), sem este servidor."""
+        discovery = (os.getenv("DISCOVERY") or "zeroconf").strip().lower()
+        try:
+            if discovery == "scan":
+                peers, _registrados, lock = get_discovery_state()
+                with lock:
+                    encontrados = list(peers)
+            else:
+                from inicio.rede.zeroconf_discovery import get_discovered_servers
+
+                encontrados = get_discovered_servers()
+        except Exception:
+            return []
+        return [p for p in encontrados if p.get("ip") and p.get("port") and not self._eh_local(p["ip"], p["port"])]
+
+    def _atualizar_peers(self, forcar=False):
+        if not self.automatico and not forcar:
+            return
+        for p in self._descobertos():
+            with self._lock:
+                chave = f"{p['ip']}:{int(p['port'])}"
+                if chave not in self.peers:
+                    self.peers[chave] = PeerSync(p["ip"], p["port"], p.get("hostname"))
+
+    def solicitar(self, ip, port, hostname=None):
+        """Agenda o peer para já (ignora o backoff). Retorna o número da execução a esperar."""
+        chave = f"{ip}:{int(port)}"
+        with self._lock:
+            peer = self.peers.get(chave)
+            if peer is None:
+                peer = self.peers[chave] = PeerSync(ip, port, hostname, descoberto=False)
+            peer.proxima = 0.0
+            peer.solicitado = True
+            esperada = peer.execucoes if peer.estado == "sincronizando" else peer.execucoes + 1
+        self._acordar.set()
+        return peer, esperada
+
+    def solicitar_todos(self):
+        """Agenda todos os peers conhecidos e descobertos para já. Retorna [(peer, execução)]."""
+        self._atualizar_peers(forcar=True)
+        with self._lock:
+            conhecidos = [(p.ip, p.port, p.hostname) for p in self.peers.values()]
+        return [self.solicitar(ip, port, hostname) for ip, port, hostname in conhecidos]
+
+    def sincronizar_peer(self, peer, inicio_rodada=None):
+        """
+        Uma execução: páginas do sync incremental desde o cursor da sessão do peer. Cada
+        página é mesclada e tem o cursor gravado numa única transação. Com `inicio_rodada`
+        (time.monotonic()), a próxima execução conta do início da rodada e não do fim desta,
+        para os peers da rodada continuarem vencendo juntos.
+        """
+        from inicio.rede.sync import ConexaoPeer, puxar_alteracoes
+
+        with self._lock:
+            peer.estado = "sincronizando"
+            peer.solicitado = False
+            peer.execucoes += 1
+            peer.progresso = {}
+        if peer.conexao is None:
+            peer.conexao = ConexaoPeer(peer.ip, peer.port, self.timeout)
+        inicio = time.perf_counter()
+        requisicoes, recebidos = peer.conexao.requisicoes, peer.conexao.bytes_recebidos
+        paginas = []
+        sessao = None
+        # Tempo e bytes desde a página anterior: a vazão da sessão conta só o tempo ativo
+        marca = {"tempo": inicio, "bytes": recebidos}
+
+        def aplicar(pagina):
+            paginas.append(pagina.get("seq"))
+            pacientes, agendamentos = pagina.get("pacientes", []), pagina.get("agendamentos", [])
+            with self.db.transacao():
+                stats = self.db.mesclar_sincronizacao(pacientes, agendamentos, pc_id_remoto=pagina.get("pc_id"))
+                agora = time.perf_counter()
+                self.db.registrar_pagina_sessao_sync(
+                    sessao["id"],
+                    pagina.get("next_cursor"),
+                    stats,
+                    registros=len(pacientes) + len(agendamentos),
+                    bytes_recebidos=peer.conexao.bytes_recebidos - marca["bytes"],
+                    duracao_ms=(agora - marca["tempo"]) * 1000,
+                    peer_pc_id=pagina.get("pc_id"),
+                )
+            marca.update(tempo=agora, bytes=peer.conexao.bytes_recebidos)
+            return stats
+
+        def progresso(pagina, cursor):
+            peer.cursor = cursor
+            peer.progresso = {"seq": pagina.get("seq"), "seq_maximo": pagina.get("seq_maximo")}
+
+        try:
+            sessao = self.db.abrir_sessao_sync(peer.chave)
+            peer.sessao, peer.cursor = sessao["id"], sessao["cursor"]
+            stats, peer.cursor = puxar_alteracoes(peer.conexao, aplicar, peer.cursor, self.limite, progresso)
+            self.db.concluir_sessao_sync(sessao["id"])
+        except Exception as e:
+            peer.conexao.fechar()
+            if sessao is not None:
+                try:
+                    self.db.interromper_sessao_sync(sessao["id"], str(e))
+                except Exception:
+                    pass
+            with self._lock:
+                peer.falhas += 1
+                espera = min(self.backoff_max, self.backoff_inicial * 2 ** (peer.falhas - 1))
+                peer.proxima = time.monotonic() + espera * random.uniform(0.8, 1.2)
+                peer.estado = "erro"
+                peer.ultimo_erro = {
+                    "mensagem": str(e),
+                    "em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            return False
+        finally:
+            self.db.liberar_conexao()
+        with self._lock:
+            peer.falhas = 0
+            peer.proxima = (time.monotonic() if inicio_rodada is None else inicio_rodada) + self.intervalo
+            peer.estado = "ok"
+            peer.ultimo_sucesso = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            peer.ultima_execucao = {
+                "stats": stats,
+                "sessao": sessao["id"],
+                "retomada": sessao["retomada"],
+                "paginas": len(paginas),
+                "requisicoes": peer.conexao.requisicoes - requisicoes,
+                "bytes_recebidos": peer.conexao.bytes_recebidos - recebidos,
+                "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            }
+        return True
+
+    def _selecionar(self, devidos, agora):
+        """Peers da rodada, em ordem sorteada; os que ficaram fora do fanout vão para a próxima."""
+        random.shuffle(devidos)
+        if not self.fanout or len(devidos) <= self.fanout:
+            return devidos
+        pedidos = [p for p in devidos if p.solicitado]
+        outros = [p for p in devidos if not p.solicitado]
+        vagas = max(0, self.fanout - len(pedidos))
+        for peer in outros[vagas:]:
+            peer.proxima = agora + self.intervalo
+        return pedidos + outros[:vagas]
+
+    def _sincronizar_na_rodada(self, peer, inicio_rodada):
+        if self._parar.is_set():
+            return
+        ok = self.sincronizar_peer(peer, inicio_rodada)
+        with self._lock:
+            self.rodada["concluidos" if ok else "erros"] += 1
+            if ok:
+                stats = peer.ultima_execucao.get("stats") or {}
+                self.rodada["registros"] += sum(v for k, v in stats.items() if k.endswith(("_adicionados", "_atualizados")))
+
+    def ciclo(self):
+        """
+        Uma rodada: atualiza a lista de peers e sincroniza os que estão no horário, até
+        `paralelo` ao mesmo tempo. Retorna depois que todos da rodada terminam.
+        """
+        self._atualizar_peers()
+        with self._lock:
+            agora = time.monotonic()
+            devidos = [p for p in self.peers.values() if p.proxima <= agora and p.estado != "sincronizando"]
+            rodada = self._selecionar(devidos, agora)
+            if not rodada:
+                return
+            self.rodadas += 1
+            self.rodada = {
+                "numero": self.rodadas,
+                "em_andamento": True,
+                "iniciada_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "peers": [p.chave for p in rodada],
+                "concluidos": 0,
+                "erros": 0,
+                "registros": 0,
+                "duracao_ms": None,
+            }
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.paralelo, len(rodada)),
+                                thread_name_prefix="sincronizador-peer") as executor:
+            for peer in rodada:
+                executor.submit(self._sincronizar_na_rodada, peer, agora)
+        with self._lock:
+            self.rodada["em_andamento"] = False
+            self.rodada["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    def _espera(self):
+        """Segundos até o próximo peer devido (no máximo o intervalo, para redescobrir peers)."""
+        with self._lock:
+            proximas = [p.proxima for p in self.peers.values()]
+        if not proximas:
+            return self.intervalo
+        return max(0.0, min(self.intervalo, min(proximas) - time.monotonic()))
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.ciclo()
+            except Exception as e:
+                with self._lock:
+                    self.erros_ciclo += 1
+                    self.ultimo_erro_ciclo = {
+                        "mensagem": f"{type(e).__name__}: {e}",
+                        "em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    }
+            self._acordar.wait(self._espera())
+            self._acordar.clear()
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="sincronizador-peers", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        with self._lock:
+            for peer in self.peers.values():
+                if peer.conexao is not None and peer.estado != "sincronizando":
+                    peer.conexao.fechar()
+
+    def status(self):
+        agora = time.monotonic()
+        with self._lock:
+            peers = [p.status(agora) for p in self.peers.values()]
+            rodada = dict(self.rodada)
+            erros_ciclo, ultimo_erro_ciclo = self.erros_ciclo, self.ultimo_erro_ciclo
+        if rodada:
+            # Fração concluída da rodada: peers terminados contam 1, os em andamento pela página
+            por_chave = {f"{p['ip']}:{p['port']}": p for p in peers}
+            feito = rodada["concluidos"] + rodada["erros"]
+            if rodada["em_andamento"]:
+                for chave in rodada["peers"]:
+                    p = por_chave.get(chave)
+                    if p is not None and p["estado"] == "sincronizando" and p["progresso"].get("seq_maximo"):
+                        feito += min(1.0, p["progresso"]["seq"] / p["progresso"]["seq_maximo"])
+            rodada["progresso"] = round(min(1.0, feito / len(rodada["peers"])), 3)
+        resumo = {}
+        for p in peers:
+            resumo[p["estado"]] = resumo.get(p["estado"], 0) + 1
+        return {
+            "ativo": self._thread is not None and self._thread.is_alive(),
+            "automatico": self.automatico,
+            "intervalo": self.intervalo,
+            "backoff_inicial": self.backoff_inicial,
+            "backoff_max": self.backoff_max,
+            "paralelo": self.paralelo,
+            "fanout": self.fanout,
+            "rodada": rodada,
+            "erros_ciclo": erros_ciclo,
+            "ultimo_erro_ciclo": ultimo_erro_ciclo,
+            "resumo": resumo,
+            "peers": sorted(peers, key=lambda p: (p["ip"], p["port"])),
+        }
+
+
+def sincronizador_para(database, porta=None):
+    """Sincronizador do banco (criado, sem iniciar, na primeira chamada)."""
+    with _sincronizadores_lock:
+        sinc = _sincronizadores.get(database.db_path)
+        if sinc is None:
+            sinc = _sincronizadores[database.db_path] = SincronizadorServidores.do_ambiente(database, porta)
+        elif porta is not None and sinc.porta is None:
+            sinc.porta = porta
+        return sinc
+
+
+def iniciar_sincronizador(database, porta):
+    """Inicia a thread de sincronização com os peers (também atende os pedidos do navegador)."""
+    return sincronizador_para(database, porta).iniciar()
+
+
+def parar_sincronizador():
+    with _sincronizadores_lock:
+        for sinc in _sincronizadores.values():
+            sinc.parar()
+
+
+def _sincronizador_do_request():
+    sp = request.environ.get("SERVER_PORT")
+    return sincronizador_para(get_db(), int(sp) if sp else None)
+
+
+@bp.route("", methods=["GET"])
+def status_sincronizador():
+    try:
+        return jsonify({"success": True, **_sincronizador_do_request().status()})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro ao obter status da sincronização: {str(e)}"}), 500
+
+
+@bp.route("/sincronizar", methods=["POST"])
+def sincronizar_agora():
+    """Pede a sincronização com um peer: {"ip": ..., "port": ..., "hostname": ...}."""
+    try:
+        data = request.get_json(silent=True) or {}
+        ip = (data.get("ip") or "").strip()
+        try:
+            port = int(data.get("port"))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "port deve ser um número inteiro"}), 400
+        if not ip:
+            return jsonify({"success": False, "message": "ip não fornecido"}), 400
+        sinc = _sincronizador_do_request()
+        if sinc._eh_local(ip, port):
+            return jsonify({"success": False, "message": "Não é possível sincronizar com este próprio servidor"}), 400
+        # Sem a thread (p.ex. rodando fora do run_flask), inicia na primeira chamada
+        sinc.iniciar()
+        peer, execucao = sinc.solicitar(ip, port, data.get("hostname"))
+        return jsonify({"success": True, "peer": peer.chave, "execucao": execucao})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro ao agendar sincronização: {str(e)}"}), 500
+
+
+@bp.route("/sincronizar_todos", methods=["POST"])
+def sincronizar_todos():
+    """Pede a sincronização com todos os peers conhecidos/descobertos, numa rodada em paralelo."""
+    try:
+        sinc = _sincronizador_do_request()
+        sinc.iniciar()
+        pedidos = sinc.solicitar_todos()
+        return jsonify({
+            "success": True,
+            "peers": [{"peer": peer.chave, "hostname": peer.hostname, "execucao": execucao}
+                      for peer, execucao in pedidos],
+        })
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Erro ao agendar sincronização: {str(e)}"}), 500
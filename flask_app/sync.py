@@ -1,58 +1,50 @@
 """
 API: Sincronização, descoberta de servidores, conflitos.
 """
+import base64
+import itertools
+import json
 import os
-from datetime import datetime
-from typing import Dict
 
-from flask import jsonify, request
+from flask import Response, jsonify, request, stream_with_context
 
+from .compressao import CorpoMuitoGrande
 from .db import db, get_db
 
-# Helpers usados pelo merge
+LIMITE_PADRAO_INCREMENTAL = 500
 
+# Transporte em NDJSON (uma linha JSON por registro) da cópia completa e do merge:
+#   {"tipo": "inicio", "success": true, "pc_id": ..., "total": {"pacientes": N, "agendamentos": M}}
+#   {"tipo": "paciente" | "agendamento", "registro": {...}}   (pacientes antes dos agendamentos)
+#   {"tipo": "fim", "success": true, "pacientes": N, "agendamentos": M}
+# Sem a linha "fim" a cópia foi interrompida; uma falha no meio vira {"tipo": "erro", ...}.
+MIMETYPE_NDJSON = "application/x-ndjson"
+LINHAS_POR_BLOCO_NDJSON = 500
+_TABELAS_NDJSON = {"paciente": "pacientes", "agendamento": "agendamentos"}
+_TIPOS_NDJSON = {tabela: tipo for tipo, tabela in _TABELAS_NDJSON.items()}
 
-def _registros_identicos(reg1: Dict, reg2: Dict, campos_ignorados: set = None) -> bool:
-    if campos_ignorados is None:
-        campos_ignorados = {"ultima_modificacao", "versao", "pc_id"}
-    campos_ignorados = campos_ignorados | {"id"}
-    todos = set(reg1.keys()) | set(reg2.keys())
-    for campo in todos:
-        if campo in campos_ignorados:
-            continue
-        if reg1.get(campo) != reg2.get(campo):
-            return False
-    return True
 
+def _codificar_cursor_sync(pc_id: str, seq: int, horizonte: int) -> str:
+    """
+    Cursor opaco do sync incremental: servidor de origem, posição no diário de mudanças e
+    horizonte da compactação quando a cópia começou.
+    """
+    bruto = json.dumps({"pc_id": pc_id, "seq": seq, "h": horizonte}).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
 
-def _marcar_conflito_paciente(paciente_id: str):
-    try:
-        paciente = db.buscar_paciente(paciente_id)
-        if paciente and paciente.get("status") != "conflito":
-            d = get_db()
-            c = d.conn.cursor()
-            c.execute(
-                "UPDATE pacientes SET status = 'conflito', ultima_modificacao = ?, versao = versao + 1 WHERE id = ?",
-                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), paciente_id),
-            )
-            d.conn.commit()
-    except Exception:
-        pass
 
-
-def _marcar_conflito_agendamento(agendamento_id: str):
+def _decodificar_cursor_sync(cursor: str, pc_id: str):
+    """(pc_id, seq, horizonte) do cursor; vazio ou "0" = início do diário deste servidor."""
+    if cursor in ("", "0"):
+        return pc_id, 0, 0
     try:
-        ag = db.obter_agendamento(agendamento_id)
-        if ag and ag.get("status") != "conflito":
-            d = get_db()
-            c = d.conn.cursor()
-            c.execute(
-                "UPDATE agendamentos SET status = 'conflito', ultima_modificacao = ?, versao = versao + 1 WHERE id = ?",
-                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), agendamento_id),
-            )
-            d.conn.commit()
-    except Exception:
-        pass
+        dados = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8"))
+        seq, horizonte = int(dados["seq"]), int(dados.get("h", 0))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Cursor inválido")
+    if seq < 0:
+        raise ValueError("Cursor inválido")
+    return dados.get("pc_id"), seq, horizonte
 
 
 def _discover_servers_impl():
@@ -191,136 +183,184 @@ def _discover_servers_impl():
     return out, 200
 
 
+def _linha_ndjson(dados) -> bytes:
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _quer_ndjson() -> bool:
+    """?formato=ndjson ou Accept: application/x-ndjson (navegador, com */*, continua em JSON)."""
+    if request.args.get("formato", "").lower() == "ndjson":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", MIMETYPE_NDJSON]) == MIMETYPE_NDJSON
+
+
+def _dados_completos_ndjson(pc_id, incluir):
+    """
+    Cópia completa em NDJSON, gerada enquanto é enviada (Database.iterar_dados_sincronizacao):
+    a memória do servidor fica em um bloco de linhas, não no banco inteiro.
+    """
+    database = get_db()
+
+    def gerar():
+        enviados = {"pacientes": 0, "agendamentos": 0}
+        try:
+            with database.instantaneo():
+                total = database.contar_dados_sincronizacao(incluir)
+                bloco = [_linha_ndjson({"tipo": "inicio", "success": True, "pc_id": pc_id, "total": total})]
+                for tabela, registro in database.iterar_dados_sincronizacao(incluir, LINHAS_POR_BLOCO_NDJSON):
+                    bloco.append(_linha_ndjson({"tipo": _TIPOS_NDJSON[tabela], "registro": registro}))
+                    enviados[tabela] += 1
+                    if len(bloco) >= LINHAS_POR_BLOCO_NDJSON:
+                        yield b"".join(bloco)
+                        bloco = []
+                bloco.append(_linha_ndjson({"tipo": "fim", "success": True, **enviados}))
+                yield b"".join(bloco)
+        except Exception as e:
+            # O 200 já foi enviado: a falha vai numa linha própria e o cliente não recebe "fim"
+            yield _linha_ndjson({"tipo": "erro", "success": False, "message": str(e)})
+
+    return Response(stream_with_context(gerar()), mimetype=MIMETYPE_NDJSON)
+
+
+def _merge_ndjson_impl():
+    """
+    Merge de um corpo NDJSON (o formato de GET /api/sync/data em NDJSON), lido linha a
+    linha do request e mesclado em blocos (Database.mesclar_sincronizacao_em_fluxo).
+    Retorna (json_dict, status_code); os blocos anteriores a um erro ficam gravados.
+    """
+    database = get_db()
+    linhas = request.stream
+    recebidos = {"pacientes": 0, "agendamentos": 0}
+    estado = {"fim": None, "erro": None}
+
+    # Cabeçalho opcional: o pc_id da origem vale para todos os blocos
+    primeira = linhas.readline()
+    pc_id_remoto = None
+    try:
+        cabecalho = json.loads(primeira) if primeira.strip() else None
+    except ValueError:
+        cabecalho = None
+    if isinstance(cabecalho, dict) and cabecalho.get("tipo") == "inicio":
+        pc_id_remoto = cabecalho.get("pc_id")
+        primeira = b""
+
+    def registros():
+        for numero, bruta in enumerate(itertools.chain([primeira], linhas), 1):
+            if not bruta.strip():
+                continue
+            try:
+                item = json.loads(bruta)
+            except ValueError:
+                estado["erro"] = f"Linha {numero}: JSON inválido"
+                return
+            tipo = item.get("tipo") if isinstance(item, dict) else None
+            if estado["fim"] is None and tipo in _TABELAS_NDJSON:
+                if not isinstance(item.get("registro"), dict):
+                    estado["erro"] = f"Linha {numero}: registro ausente"
+                    return
+                recebidos[_TABELAS_NDJSON[tipo]] += 1
+                yield _TABELAS_NDJSON[tipo], item["registro"]
+            elif estado["fim"] is None and tipo == "fim":
+                estado["fim"] = item
+            elif estado["fim"] is not None:
+                estado["erro"] = f"Linha {numero}: conteúdo depois da linha de fim"
+                return
+            elif tipo == "erro":
+                estado["erro"] = f"A origem falhou no meio da cópia: {item.get('message')}"
+                return
+            else:
+                estado["erro"] = f"Linha {numero}: tipo inesperado {tipo!r}"
+                return
+
+    stats = database.mesclar_sincronizacao_em_fluxo(registros(), pc_id_remoto=pc_id_remoto)
+    fim = estado["fim"]
+    if estado["erro"] is None and fim is None:
+        estado["erro"] = "Cópia interrompida: faltou a linha de fim"
+    elif estado["erro"] is None and any(t in fim and fim[t] != recebidos[t] for t in recebidos):
+        estado["erro"] = (
+            f"Cópia incompleta: a linha de fim não bate com os {recebidos['pacientes']} pacientes "
+            f"e {recebidos['agendamentos']} agendamentos recebidos"
+        )
+    if estado["erro"] is not None:
+        return {"success": False, "message": estado["erro"], "stats": stats, "recebidos": recebidos}, 400
+    return {
+        "success": True,
+        "message": "Sincronização concluída",
+        "stats": stats,
+        "recebidos": recebidos,
+    }, 200
+
+
 def _merge_impl():
     """Lógica do merge. Retorna (json_dict, status_code)."""
+    if request.mimetype == MIMETYPE_NDJSON:
+        return _merge_ndjson_impl()
     data = request.get_json()
     if not data:
         return {"success": False, "message": "Dados não fornecidos"}, 400
-    pacientes_remotos = data.get("pacientes", [])
-    agendamentos_remotos = data.get("agendamentos", [])
-    pc_id_remoto = data.get("pc_id")
-    pacientes_locais = db.buscar_pacientes(incluir_removidos=True)
-    pl_dict = {p["id"]: p for p in pacientes_locais}
-    agendamentos_locais = db.listar_agendamentos()
-    al_dict = {a["id"]: a for a in agendamentos_locais}
-    pa = pu = pc = aa = au = ac = 0
-
-    for pr in pacientes_remotos:
-        pid = pr["id"]
-        pl = pl_dict.get(pid)
-        if not pl:
-            try:
-                db.inserir_registro(
-                    pid,
-                    pr,
-                    arquivo_origem="sync",
-                    data_salvamento=pr.get("data_salvamento"),
-                    pc_id=pr.get("pc_id", pc_id_remoto),
-                    ultima_modificacao=pr.get("ultima_modificacao"),
-                    versao=pr.get("versao", 1),
-                    status=pr.get("status", "ativo"),
-                )
-                pa += 1
-            except Exception:
-                pass
-            continue
-        sl, sr = pl.get("status", "ativo"), pr.get("status", "ativo")
-        if (sl == "removido" and sr != "removido") or (sl != "removido" and sr == "removido"):
-            _marcar_conflito_paciente(pid)
-            pc += 1
-            continue
-        if sl == "removido" and sr == "removido":
-            continue
-        if _registros_identicos(pl, pr):
-            continue
-        uml = pl.get("ultima_modificacao") or pl.get("data_salvamento", "")
-        umr = pr.get("ultima_modificacao") or pr.get("data_salvamento", "")
-        if umr > uml:
-            try:
-                pr["pc_id"] = pr.get("pc_id", pc_id_remoto)
-                db.atualizar_paciente(pid, pr)
-                pu += 1
-            except Exception:
-                pass
-        elif uml > umr:
-            pass
-        else:
-            pcl = pl.get("pc_id", "")
-            pcr = pr.get("pc_id", pc_id_remoto or "")
-            if pcl != pcr or True:
-                _marcar_conflito_paciente(pid)
-                pc += 1
-
-    for ar in agendamentos_remotos:
-        aid = ar["id"]
-        al = al_dict.get(aid)
-        if not al:
-            try:
-                db.criar_agendamento(
-                    aid,
-                    ar["paciente_id"],
-                    ar["data_consulta"],
-                    ar["hora_consulta"],
-                    ar.get("tipo_consulta"),
-                    ar.get("observacoes"),
-                    ar.get("status", "agendado"),
-                    ar.get("data_criacao"),
-                    ar.get("data_atualizacao"),
-                    pc_id=ar.get("pc_id", pc_id_remoto),
-                    ultima_modificacao=ar.get("ultima_modificacao"),
-                    versao=ar.get("versao", 1),
-                )
-                aa += 1
-            except Exception:
-                pass
-            continue
-        sl, sr = al.get("status", "agendado"), ar.get("status", "agendado")
-        if (sl == "removido" and sr != "removido") or (sl != "removido" and sr == "removido"):
-            _marcar_conflito_agendamento(aid)
-            ac += 1
-            continue
-        if sl == "removido" and sr == "removido":
-            continue
-        if _registros_identicos(al, ar, {"nome_gestante", "unidade_saude"}):
-            continue
-        uml = al.get("ultima_modificacao") or al.get("data_atualizacao", "")
-        umr = ar.get("ultima_modificacao") or ar.get("data_atualizacao", "")
-        if umr > uml:
-            try:
-                db.atualizar_agendamento(
-                    aid,
-                    ar["paciente_id"],
-                    ar["data_consulta"],
-                    ar["hora_consulta"],
-                    ar.get("tipo_consulta"),
-                    ar.get("observacoes"),
-                    ar.get("status", "agendado"),
-                    pc_id=ar.get("pc_id", pc_id_remoto),
-                    ultima_modificacao=ar.get("ultima_modificacao"),
-                )
-                au += 1
-            except Exception:
-                pass
-        elif uml > umr:
-            pass
-        else:
-            _marcar_conflito_agendamento(aid)
-            ac += 1
-
+    # Em blocos (Database.mesclar_sincronizacao): só os ids recebidos são lidos do banco
+    # e cada bloco é gravado com executemany numa transação
+    stats = db.mesclar_sincronizacao(
+        data.get("pacientes", []),
+        data.get("agendamentos", []),
+        pc_id_remoto=data.get("pc_id"),
+    )
     return {
         "success": True,
         "message": "Sincronização concluída",
-        "stats": {
-            "pacientes_adicionados": pa,
-            "pacientes_atualizados": pu,
-            "pacientes_conflito": pc,
-            "agendamentos_adicionados": aa,
-            "agendamentos_atualizados": au,
-            "agendamentos_conflito": ac,
-        },
+        "stats": stats,
     }, 200
 
 
+def _dados_incrementais(pc_id, desde, incluir):
+    """
+    Página do sync incremental: registros alterados depois do cursor, pela ordem do
+    diário de mudanças. O cliente guarda next_cursor e repete enquanto "mais" for true.
+    Cursor inválido, de outro servidor, adiantado ou que perdeu exclusões na compactação
+    do diário volta a 0 com reiniciar=true (o cliente recebe tudo de novo; o merge é
+    idempotente). Exclusões de vez não vão na página (ver dados_sincronizacao_desde).
+    """
+    try:
+        limite = int(request.args.get("limite", LIMITE_PADRAO_INCREMENTAL))
+    except ValueError:
+        return jsonify({"success": False, "message": "limite deve ser um número inteiro"}), 400
+    if limite < 1:
+        return jsonify({"success": False, "message": "limite deve ser maior que zero"}), 400
+
+    reiniciar = False
+    try:
+        cursor_pc_id, seq, horizonte = _decodificar_cursor_sync(desde, pc_id)
+    except ValueError:
+        cursor_pc_id, seq, horizonte, reiniciar = pc_id, 0, 0, True
+    if cursor_pc_id != pc_id:
+        seq, horizonte, reiniciar = 0, 0, True
+
+    pagina = db.dados_sincronizacao_desde(seq, limite, incluir_removidos=incluir)
+    # Exclusões descartadas depois do início desta cópia (ou cursor à frente do diário,
+    # p.ex. banco restaurado): recomeça do zero. Uma cópia desde 0 não precisa das
+    # exclusões já descartadas, então o horizonte atual passa a valer para ela.
+    if pagina["success"] and seq > 0 and (
+        (seq < pagina["horizonte"] and pagina["horizonte"] > horizonte) or seq > pagina["seq_maximo"]
+    ):
+        seq, reiniciar = 0, True
+        pagina = db.dados_sincronizacao_desde(0, limite, incluir_removidos=incluir)
+    if pagina["success"] and seq == 0:
+        horizonte = pagina["horizonte"]
+    if not pagina["success"]:
+        return jsonify(pagina), 500
+    return jsonify({
+        "success": True,
+        "pc_id": pc_id,
+        "pacientes": pagina["pacientes"],
+        "agendamentos": pagina["agendamentos"],
+        "next_cursor": _codificar_cursor_sync(pc_id, pagina["ultimo_seq"], horizonte),
+        "mais": pagina["mais"],
+        "reiniciar": reiniciar,
+        "seq": pagina["ultimo_seq"],
+        "seq_maximo": pagina["seq_maximo"],
+    })
+
+
 def create_sync_blueprint():
     from flask import Blueprint
 
@@ -337,6 +377,13 @@ def create_sync_blueprint():
             from config import get_pc_id
 
             incluir = request.args.get("incluir_removidos", "false").lower() == "true"
+            if "desde" in request.args:
+                return _dados_incrementais(get_pc_id(), request.args.get("desde", ""), incluir)
+            if request.args.get("somente_hash", "false").lower() == "true":
+                # Prévia da sincronização: só id + hash_conteudo (ver comparar_com_banco_remoto)
+                return jsonify({"success": True, "pc_id": get_pc_id(), **db.hashes_conteudo(incluir)})
+            if _quer_ndjson():
+                return _dados_completos_ndjson(get_pc_id(), incluir)
             pacientes = db.buscar_pacientes(incluir_removidos=incluir)
             agendamentos = db.listar_agendamentos()
             return jsonify({
@@ -348,11 +395,54 @@ def create_sync_blueprint():
         except Exception as e:
             return jsonify({"success": False, "message": str(e)}), 500
 
+    @bp.route("/arvore", methods=["GET"])
+    def get_arvore_sync():
+        """Nó da árvore de hashes (Database.arvore_sincronizacao): ?tabela=&prefixo=&nivel=&folha=."""
+        try:
+            try:
+                nivel = int(request.args.get("nivel", 1))
+            except ValueError:
+                return jsonify({"success": False, "message": "nivel deve ser um número inteiro"}), 400
+            no = db.arvore_sincronizacao(
+                request.args.get("tabela", "pacientes"),
+                request.args.get("prefixo", ""),
+                nivel,
+                folha=request.args.get("folha", "false").lower() == "true",
+                incluir_removidos=request.args.get("incluir_removidos", "false").lower() == "true",
+            )
+            return jsonify(no), 200 if no["success"] else 400
+        except Exception as e:
+            return jsonify({"success": False, "message": str(e)}), 500
+
+    @bp.route("/registros", methods=["POST"])
+    def get_registros_sync():
+        """Registros pedidos por id: {"pacientes": [...], "agendamentos": [...], "incluir_removidos": bool}."""
+        try:
+            from config import get_pc_id
+
+            data = request.get_json(silent=True)
+            if not data:
+                return jsonify({"success": False, "message": "Dados não fornecidos"}), 400
+            incluir = bool(data.get("incluir_removidos", False))
+            with db.instantaneo():
+                pacientes = db.buscar_pacientes_por_ids(data.get("pacientes") or [], incluir_removidos=incluir)
+                agendamentos = db.buscar_agendamentos_por_ids(data.get("agendamentos") or [])
+            return jsonify({
+                "success": True,
+                "pc_id": get_pc_id(),
+                "pacientes": pacientes,
+                "agendamentos": agendamentos,
+            })
+        except Exception as e:
+            return jsonify({"success": False, "message": str(e)}), 500
+
     @bp.route("/merge", methods=["POST"])
     def merge_sync_data():
         try:
             out, code = _merge_impl()
             return jsonify(out), code
+        except CorpoMuitoGrande as e:
+            return jsonify({"success": False, "message": str(e)}), 413
         except Exception as e:
             import traceback
 
@@ -362,6 +452,15 @@ def create_sync_blueprint():
                 "traceback": traceback.format_exc(),
             }), 500
 
+    @bp.route("/sessoes", methods=["GET"])
+    def listar_sessoes_sync():
+        """Sessões do sincronizador com cada peer (?peer=ip:porta&limite=), com vazão."""
+        try:
+            resultado = db.listar_sessoes_sync(request.args.get("peer") or None, request.args.get("limite", 50))
+            return jsonify(resultado), 200 if resultado["success"] else 400
+        except Exception as e:
+            return jsonify({"success": False, "message": str(e)}), 500
+
     @bp.route("/conflitos", methods=["GET"])
     def listar_conflitos():
         try:
@@ -1,51 +1,293 @@
 """
-Sincronização de dados entre servidores (modo duplo).
+Sincronização de dados entre servidores (modo duplo, anti-entropia e sincronizador em
+segundo plano do flask_app).
 """
+import http.client
 import json
-import urllib.request
+import time
+import urllib.parse
+import zlib
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-def sincronizar_servidores(porta_origem, porta_destino):
-    """Sincroniza dados entre dois servidores"""
-    try:
-        print(f"Sincronizando servidor {porta_origem} -> {porta_destino}...")
+# Nó vazio: o outro lado não tem nenhum registro do balde
+_NO_VAZIO = {'hash': '', 'quantidade': 0, 'registros': {}}
+
+LIMITE_PAGINA = 500
+# Corpos de POST a partir deste tamanho vão comprimidos (se o peer já respondeu comprimido)
+MINIMO_CORPO_COMPRIMIDO = 1024
+CODIFICACOES = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+ACCEPT_ENCODING = ', '.join(CODIFICACOES)
+
+
+def _comprimir(dados, codificacao):
+    if codificacao == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(dados)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(dados) + compressor.flush()
+
+
+def _descomprimir(dados, codificacao):
+    if codificacao == 'zstd':
+        # Sem o tamanho no cabeçalho do frame (resposta em fluxo): precisa do decompressobj
+        return zstandard.ZstdDecompressor().decompressobj().decompress(dados)
+    if codificacao in ('gzip', 'x-gzip'):
+        return zlib.decompress(dados, 47)
+    if codificacao in ('', 'identity'):
+        return dados
+    raise RuntimeError(f'Content-Encoding não suportado: {codificacao}')
+
+
+class ConexaoPeer:
+    """
+    Conexão HTTP persistente (keep-alive) com outro servidor. Se o outro lado fechou a
+    conexão ociosa, ela é reaberta uma vez na requisição seguinte. Pede respostas
+    comprimidas e, quando o peer anuncia no Accept-Encoding da resposta que aceita
+    corpos comprimidos, comprime também os POSTs grandes. Conta requisições, conexões
+    abertas e bytes dos corpos como passaram pela rede.
+    """
 
-        url_data = f'http://127.0.0.1:{porta_origem}/api/sync/data'
-        req_data = urllib.request.Request(url_data)
-        response_data = urllib.request.urlopen(req_data, timeout=10)
-        sync_data = json.loads(response_data.read().decode())
-
-        if not sync_data.get('success'):
-            print(f"ERRO: Não foi possível obter dados do servidor {porta_origem}")
-            return False
-
-        url_merge = f'http://127.0.0.1:{porta_destino}/api/sync/merge'
-        data_json = json.dumps({
-            'pacientes': sync_data.get('pacientes', []),
-            'agendamentos': sync_data.get('agendamentos', [])
-        }).encode('utf-8')
-
-        req_merge = urllib.request.Request(
-            url_merge,
-            data=data_json,
-            headers={'Content-Type': 'application/json'},
-            method='POST'
+    def __init__(self, host, porta, timeout=30.0):
+        self.host = host
+        self.porta = int(porta)
+        self.timeout = timeout
+        self._conn = None
+        self.requisicoes = 0
+        self.conexoes = 0
+        self.bytes_enviados = 0
+        self.bytes_recebidos = 0
+        # Codificação para os corpos enviados, pelo Accept-Encoding da última resposta do peer
+        self.codificacao_peer = None
+
+    @classmethod
+    def de_url(cls, url, timeout=30.0):
+        partes = urllib.parse.urlsplit(url)
+        return cls(partes.hostname, partes.port or 80, timeout)
+
+    def fechar(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def requisitar_json(self, caminho, dados=None):
+        """GET (ou POST com `dados`) e o JSON da resposta; RuntimeError se success for false."""
+        corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+        cabecalhos = {'Accept': 'application/json', 'Accept-Encoding': ACCEPT_ENCODING}
+        if corpo is not None:
+            cabecalhos['Content-Type'] = 'application/json'
+            if self.codificacao_peer and len(corpo) >= MINIMO_CORPO_COMPRIMIDO:
+                corpo = _comprimir(corpo, self.codificacao_peer)
+                cabecalhos['Content-Encoding'] = self.codificacao_peer
+        for tentativa in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+            reaproveitada = self._conn.sock is not None
+            if not reaproveitada:
+                self.conexoes += 1
+            try:
+                self._conn.request('POST' if corpo is not None else 'GET', caminho, body=corpo, headers=cabecalhos)
+                resposta = self._conn.getresponse()
+                bruto = resposta.read()
+            except ConnectionError:
+                # Conexão ociosa fechada pelo outro lado: tenta de novo numa conexão nova
+                self.fechar()
+                if reaproveitada and tentativa == 0:
+                    continue
+                raise
+            except Exception:
+                self.fechar()
+                raise
+            break
+        self.requisicoes += 1
+        self.bytes_enviados += len(corpo or b'')
+        self.bytes_recebidos += len(bruto)
+        aceitas = (resposta.getheader('Accept-Encoding') or '').lower()
+        self.codificacao_peer = next((c for c in CODIFICACOES if c in aceitas), None)
+        try:
+            bruto = _descomprimir(bruto, (resposta.getheader('Content-Encoding') or '').strip().lower())
+            resultado = json.loads(bruto.decode())
+        except (ValueError, zlib.error):
+            raise RuntimeError(f'Resposta inválida de {self.host}:{self.porta}{caminho} (HTTP {resposta.status})')
+        if not resultado.get('success'):
+            raise RuntimeError(resultado.get('message') or f'Falha em {self.host}:{self.porta}{caminho} (HTTP {resposta.status})')
+        return resultado
+
+    def estatisticas(self):
+        return {
+            'requisicoes': self.requisicoes,
+            'conexoes': self.conexoes,
+            'bytes_enviados': self.bytes_enviados,
+            'bytes_recebidos': self.bytes_recebidos,
+        }
+
+
+def puxar_alteracoes(origem, aplicar, cursor='', limite=LIMITE_PAGINA, progresso=None):
+    """
+    Lê da `origem` (ConexaoPeer) as páginas do sync incremental a partir de `cursor` e
+    entrega cada uma a `aplicar(pagina) -> stats`. O cursor só avança depois da página
+    aplicada; `progresso(pagina, cursor)` é chamado a cada página.
+    Retorna (stats somadas, cursor final).
+    """
+    stats = {}
+    while True:
+        pagina = origem.requisitar_json(
+            '/api/sync/data?' + urllib.parse.urlencode({'desde': cursor, 'limite': limite})
         )
-        response_merge = urllib.request.urlopen(req_merge, timeout=30)
-        merge_result = json.loads(response_merge.read().decode())
-
-        if merge_result.get('success'):
-            stats = merge_result.get('stats', {})
-            print(f"SUCESSO: Sincronização {porta_origem} -> {porta_destino} concluída")
-            print(f"  - Pacientes adicionados: {stats.get('pacientes_adicionados', 0)}")
-            print(f"  - Pacientes atualizados: {stats.get('pacientes_atualizados', 0)}")
-            print(f"  - Agendamentos adicionados: {stats.get('agendamentos_adicionados', 0)}")
-            print(f"  - Agendamentos atualizados: {stats.get('agendamentos_atualizados', 0)}")
-            return True
-
-        print(f"ERRO: Falha na sincronização: {merge_result.get('message', 'Erro desconhecido')}")
-        return False
+        for campo, valor in (aplicar(pagina) or {}).items():
+            stats[campo] = stats.get(campo, 0) + valor
+        # Servidor sem sync incremental: a resposta já foi a cópia completa
+        if 'next_cursor' not in pagina:
+            return stats, cursor
+        cursor = pagina['next_cursor']
+        if progresso is not None:
+            progresso(pagina, cursor)
+        if not pagina.get('mais'):
+            return stats, cursor
+
+
+def sincronizar_servidores(porta_origem, porta_destino, intervalo_status=0.5, timeout_total=60):
+    """
+    Sincroniza dados entre dois servidores: pede ao destino que puxe da origem pelo seu
+    sincronizador (sessão gravada no banco do destino; se a anterior caiu no meio, é
+    retomada da última página confirmada) e acompanha pelo status até terminar.
+    Desiste de acompanhar depois de `timeout_total` segundos e retorna False (a sessão
+    continua no destino e a próxima execução retoma do cursor salvo).
+    """
+    prazo = time.monotonic() + timeout_total
+    destino = ConexaoPeer('127.0.0.1', porta_destino, min(30.0, timeout_total))
+    try:
+        print(f"Sincronizando servidor {porta_origem} -> {porta_destino}...")
+        pedido = destino.requisitar_json('/api/sync/servidor/sincronizar', {'ip': '127.0.0.1', 'port': porta_origem})
+        while True:
+            peers = destino.requisitar_json('/api/sync/servidor').get('peers', [])
+            peer = next((p for p in peers if f"{p['ip']}:{p['port']}" == pedido['peer']), None)
+            if peer is not None and peer['execucoes'] >= pedido['execucao'] and peer['estado'] != 'sincronizando':
+                break
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                print(f"AVISO: Sincronização {porta_origem} -> {porta_destino} não terminou em {timeout_total} s; "
+                      f"continua em segundo plano (GET /api/sync/servidor na porta {porta_destino})")
+                return False
+            time.sleep(min(intervalo_status, restante))
+        if peer['estado'] != 'ok':
+            raise RuntimeError((peer.get('ultimo_erro') or {}).get('mensagem') or 'falha na sincronização')
+        execucao = peer.get('ultima_execucao') or {}
+        stats = execucao.get('stats', {})
+        print(f"SUCESSO: Sincronização {porta_origem} -> {porta_destino} concluída"
+              + (" (sessão retomada)" if execucao.get('retomada') else ""))
+        print(f"  - Pacientes adicionados: {stats.get('pacientes_adicionados', 0)}")
+        print(f"  - Pacientes atualizados: {stats.get('pacientes_atualizados', 0)}")
+        print(f"  - Agendamentos adicionados: {stats.get('agendamentos_adicionados', 0)}")
+        print(f"  - Agendamentos atualizados: {stats.get('agendamentos_atualizados', 0)}")
+        return True
 
     except Exception as e:
         print(f"ERRO ao sincronizar servidores: {e}")
         return False
+    finally:
+        destino.fechar()
+
+
+def _no_arvore(conexao, tabela, prefixo, folha=False):
+    parametros = {'tabela': tabela, 'prefixo': prefixo}
+    if folha:
+        parametros['folha'] = 'true'
+    return conexao.requisitar_json(f'/api/sync/arvore?{urllib.parse.urlencode(parametros)}')
+
+
+def _ids_divergentes(conexao_a, conexao_b, tabela):
+    """
+    Desce pelas árvores de hashes dos dois servidores só onde os hashes diferem.
+    Retorna (ids a copiar de A para B, ids a copiar de B para A).
+    """
+    de_a, de_b = set(), set()
+    pendentes = [('', None, None)]
+    while pendentes:
+        prefixo, no_a, no_b = pendentes.pop()
+        no_a = no_a or _no_arvore(conexao_a, tabela, prefixo)
+        no_b = no_b or _no_arvore(conexao_b, tabela, prefixo)
+        if no_a['hash'] == no_b['hash']:
+            continue
+        # Folha só se compara com folha: pede a lista do lado que ainda veio em baldes
+        if 'baldes' in no_a and 'baldes' not in no_b:
+            no_a = _no_arvore(conexao_a, tabela, prefixo, folha=True)
+        elif 'baldes' in no_b and 'baldes' not in no_a:
+            no_b = _no_arvore(conexao_b, tabela, prefixo, folha=True)
+
+        registros_a, registros_b = no_a.get('registros', {}), no_b.get('registros', {})
+        for rid in registros_a.keys() | registros_b.keys():
+            if registros_a.get(rid) != registros_b.get(rid):
+                if rid in registros_a:
+                    de_a.add(rid)
+                if rid in registros_b:
+                    de_b.add(rid)
+
+        baldes_a, baldes_b = no_a.get('baldes', {}), no_b.get('baldes', {})
+        for chave in baldes_a.keys() | baldes_b.keys():
+            if baldes_a.get(chave) == baldes_b.get(chave):
+                continue
+            filho = prefixo + chave
+            if chave not in baldes_b:
+                pendentes.append((filho, _no_arvore(conexao_a, tabela, filho, folha=True), _NO_VAZIO))
+            elif chave not in baldes_a:
+                pendentes.append((filho, _NO_VAZIO, _no_arvore(conexao_b, tabela, filho, folha=True)))
+            else:
+                pendentes.append((filho, None, None))
+    return de_a, de_b
+
+
+def _buscar_registros(conexao, ids):
+    """Registros `ids` ({tabela: [...]}) do servidor, ou None se não houver nada a buscar."""
+    if not any(ids.values()):
+        return None
+    return conexao.requisitar_json('/api/sync/registros', ids)
+
+
+def _mesclar_registros(conexao, dados):
+    if dados is None:
+        return {}
+    return conexao.requisitar_json('/api/sync/merge', {
+        'pacientes': dados.get('pacientes', []),
+        'agendamentos': dados.get('agendamentos', []),
+        'pc_id': dados.get('pc_id'),
+    }).get('stats', {})
+
+
+def reconciliar_servidores(url_a, url_b):
+    """
+    Anti-entropia entre dois servidores (ex.: 'http://127.0.0.1:5000'): compara as árvores
+    de hashes de /api/sync/arvore e troca só os registros divergentes, nos dois sentidos,
+    pelo merge normal. Não depende de cursor: serve para backup restaurado ou PC novo.
+    """
+    conexao_a, conexao_b = ConexaoPeer.de_url(url_a, 120), ConexaoPeer.de_url(url_b, 120)
+
+    def contadores():
+        a, b = conexao_a.estatisticas(), conexao_b.estatisticas()
+        return {campo: a[campo] + b[campo] for campo in a}
+
+    try:
+        de_a, de_b = {}, {}
+        for tabela in ('pacientes', 'agendamentos'):
+            ids_a, ids_b = _ids_divergentes(conexao_a, conexao_b, tabela)
+            de_a[tabela], de_b[tabela] = sorted(ids_a), sorted(ids_b)
+        # Os dois lados são lidos antes de qualquer merge: o merge regrava ultima_modificacao
+        # em quem recebe, e a cópia relida voltaria como "mais nova" para a origem
+        registros_a = _buscar_registros(conexao_a, de_a)
+        registros_b = _buscar_registros(conexao_b, de_b)
+        return {
+            'success': True,
+            'divergentes': {
+                tabela: len(set(de_a[tabela]) | set(de_b[tabela])) for tabela in ('pacientes', 'agendamentos')
+            },
+            'stats_b': _mesclar_registros(conexao_b, registros_a),
+            'stats_a': _mesclar_registros(conexao_a, registros_b),
+            **contadores(),
+        }
+    except Exception as e:
+        return {'success': False, 'message': f'Erro ao reconciliar servidores: {e}', **contadores()}
+    finally:
+        conexao_a.fechar()
+        conexao_b.fechar()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da compressão HTTP (flask_app/compressao.py) nas respostas do sync e da API.
+
+Grava N pacientes e N/3 agendamentos com dados variados num banco temporário e pede,
+pelo app.test_client(), cada rota com Accept-Encoding identity, gzip e zstd (zstd só com
+o pacote zstandard). Mostra os bytes do corpo como passariam pela rede e o tempo da
+resposta, e confere que o corpo descomprimido é igual ao sem compressão. No fim, manda
+um POST /api/sync/merge com corpo gzip e confere que o merge aceita.
+
+Uso: python outros/benchmark_compressao.py [pacientes] (padrão: 10000)
+"""
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_bench_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'benchmark')
+os.environ['SYNC_AUTO'] = '0'
+
+import database  # noqa: E402
+from flask_app import app  # noqa: E402
+from flask_app.compressao import codificacoes_suportadas  # noqa: E402
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ROTAS = (
+    '/api/sync/data',
+    '/api/sync/data?formato=ndjson',
+    '/api/sync/data?desde=&limite=500',
+    '/api/sync/data?somente_hash=true',
+    '/api/pacientes',
+    '/api/agendamentos',
+)
+NOMES = ['Maria', 'Ana', 'Juliana', 'Fernanda', 'Patrícia', 'Aline', 'Camila', 'Bruna', 'Larissa', 'Jéssica']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Rodrigues', 'Almeida', 'Nascimento']
+REPETICOES = 3
+
+
+def popular(db, total, semente=42):
+    aleatorio = random.Random(semente)
+    db.inserir_registros_em_lote([
+        {
+            'id': f'P{i:06d}',
+            'data_salvamento': f'2025-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d} '
+                               f'{aleatorio.randint(7, 18):02d}:{aleatorio.randint(0, 59):02d}:00',
+            'identificacao': {
+                'nome_gestante': f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}',
+                'data_nasc': f'{aleatorio.randint(1980, 2008)}-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}',
+                'telefone': f'(11) 9{aleatorio.randint(1000, 9999)}-{aleatorio.randint(1000, 9999)}',
+                'unidade_saude': f'UBS {aleatorio.randint(1, 40)}',
+                'acs': f'ACS {aleatorio.randint(1, 200)}',
+            },
+            'avaliacao': {
+                'inicio_pre_natal_antes_12s': aleatorio.choice([True, False, None]),
+                'consultas_pre_natal': aleatorio.randint(0, 12),
+                'vacinas_completas': aleatorio.choice(['completa', 'incompleta', None]),
+                'plano_parto': aleatorio.choice([True, False]),
+                'dum': f'2025-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}',
+            },
+        }
+        for i in range(total)
+    ])
+    with db.escrita() as conn:
+        conn.executemany(
+            "INSERT INTO agendamentos (id, paciente_id, data_consulta, hora_consulta, tipo_consulta, observacoes, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'agendado')",
+            [
+                (f'A{j:06d}', f'P{aleatorio.randrange(total):06d}',
+                 f'2026-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}',
+                 f'{aleatorio.randint(7, 17):02d}:{aleatorio.choice(["00", "30"])}',
+                 aleatorio.choice(['consulta', 'retorno', 'exame']), aleatorio.choice([None, 'Trazer exames']))
+                for j in range(total // 3)
+            ],
+        )
+        conn.commit()
+
+
+def descomprimir(dados, codificacao):
+    if codificacao == 'zstd':
+        # Resposta em fluxo não traz o tamanho no frame: precisa do decompressobj
+        return zstandard.ZstdDecompressor().decompressobj().decompress(dados)
+    if codificacao == 'gzip':
+        return zlib.decompress(dados, 47)
+    return dados
+
+
+def pedir(cliente, rota, codificacao):
+    """Melhor tempo (ms) de REPETICOES GETs, o corpo como veio e o Content-Encoding."""
+    melhor, resposta = None, None
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        resposta = cliente.get(rota, headers={'Accept-Encoding': codificacao})
+        corpo = resposta.get_data()
+        decorrido = (time.perf_counter() - inicio) * 1000
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor, corpo, resposta.headers.get('Content-Encoding', 'identity')
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    codificacoes = ('identity',) + codificacoes_suportadas()[::-1]
+    try:
+        print(f"Gravando {total} pacientes e {total // 3} agendamentos...")
+        popular(database.db, total)
+        cliente = app.test_client()
+
+        print()
+        print("=" * 60)
+        print(f" Corpos das respostas ({total} pacientes, melhor de {REPETICOES})")
+        print("=" * 60)
+        ok = True
+        for rota in ROTAS:
+            print(f"  {rota}")
+            _, original, _ = pedir(cliente, rota, 'identity')
+            for codificacao in codificacoes:
+                ms, corpo, recebida = pedir(cliente, rota, codificacao)
+                igual = descomprimir(corpo, recebida) == original
+                ok &= igual and recebida == codificacao
+                print(f"    {codificacao:<9} {len(corpo) / 1024 / 1024:8.2f} MB  "
+                      f"{len(original) / max(1, len(corpo)):5.1f}x  {ms:8.1f} ms"
+                      f"{'' if igual and recebida == codificacao else f'  [X] veio {recebida}, igual={igual}'}")
+        if zstandard is None:
+            print("  (zstd não medido: pacote zstandard não instalado)")
+
+        dados = cliente.get('/api/sync/data').get_json()
+        corpo = json.dumps({'pacientes': dados['pacientes'][:1000], 'agendamentos': [], 'pc_id': 'outro'}).encode()
+        resposta = cliente.post('/api/sync/merge', data=gzip.compress(corpo),
+                                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        print()
+        if resposta.status_code != 200:
+            print(f"[X] POST /api/sync/merge com corpo gzip: HTTP {resposta.status_code}")
+            ok = False
+        else:
+            print(f"[OK] POST /api/sync/merge com corpo gzip: {len(corpo) / 1024:.0f} KB -> "
+                  f"{len(gzip.compress(corpo)) / 1024:.0f} KB")
+        print("[OK] Corpos descomprimidos iguais aos sem compressão" if ok else "[X] Falhas acima")
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark do merge de sincronização em blocos (Database.mesclar_sincronizacao).
+
+Grava N pacientes e N/2 agendamentos num banco temporário e monta um payload "remoto"
+com novos, atualizações (mais recentes), mais antigos, idênticos, conflitos (mesmo
+horário com conteúdo diferente) e removidos de um lado só. Mede, sobre cópias do mesmo
+banco:
+- o merge com TAMANHO_LOTE_MERGE (executemany, um COMMIT por bloco);
+- o merge com tamanho_lote=1 (um COMMIT por registro, como antes dos blocos);
+- um payload pequeno (5 atualizações + 5 novos) contra o banco inteiro.
+Confere as contagens do merge com as esperadas e que os dois tamanhos de bloco deixam
+o banco no mesmo estado (id, status e hash_conteudo).
+
+Uso: python outros/benchmark_merge_lote.py [pacientes] (padrão: 20000)
+"""
+import copy
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_bench_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'benchmark')
+
+import database  # noqa: E402
+
+MODIFICADO_LOCAL = '2025-06-01 10:00:00'
+
+
+def criar_banco_local(caminho, total):
+    db = database.Database(caminho)
+    aleatorio = random.Random(42)
+    db.inserir_registros_em_lote([
+        {
+            'id': f'L{i:06d}',
+            'data_salvamento': '2025-01-01 10:00:00',
+            'ultima_modificacao': MODIFICADO_LOCAL,
+            'pc_id': 'local',
+            'identificacao': {'nome_gestante': f'Local {i}', 'unidade_saude': f'UBS {i % 40}'},
+            'avaliacao': {'consultas_pre_natal': aleatorio.randint(0, 9), 'plano_parto': aleatorio.random() < 0.5},
+        }
+        for i in range(total)
+    ])
+    with db.escrita() as conn:
+        conn.executemany(
+            "INSERT INTO agendamentos (id, paciente_id, data_consulta, hora_consulta, tipo_consulta, status, "
+            "data_criacao, data_atualizacao, pc_id, ultima_modificacao, versao) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (f'AG{j:06d}', f'L{(j * 3) % total:06d}', f'2026-{1 + j % 12:02d}-{1 + j % 28:02d}', '09:00',
+                 'consulta', 'agendado', '2025-01-01 10:00:00', '2025-01-01 10:00:00', 'local', MODIFICADO_LOCAL, 1)
+                for j in range(total // 2)
+            ],
+        )
+        conn.commit()
+    return db
+
+
+def montar_payload(db, total):
+    """Payload remoto e as contagens que o merge deve devolver."""
+    aleatorio = random.Random(7)
+    locais = db.buscar_pacientes(incluir_removidos=True)
+    aleatorio.shuffle(locais)
+    fatia = total // 10
+    pacientes = []
+
+    def copia(p, alterado=True):
+        q = copy.deepcopy(p)
+        q['pc_id'] = 'remoto'
+        if alterado:
+            # O hash local não vale para o conteúdo alterado (ausente = desconhecido)
+            q.pop('hash_conteudo', None)
+        return q
+
+    for p in locais[:3 * fatia]:  # mais recentes: atualizam
+        q = copia(p)
+        q['identificacao']['nome_gestante'] += ' R'
+        q['ultima_modificacao'] = '2099-01-01 00:00:00'
+        pacientes.append(q)
+    for p in locais[3 * fatia:4 * fatia]:  # mais antigos: ignorados
+        q = copia(p)
+        q['identificacao']['nome_gestante'] += ' velho'
+        q['ultima_modificacao'] = '2000-01-01 00:00:00'
+        pacientes.append(q)
+    for p in locais[4 * fatia:5 * fatia]:  # idênticos
+        pacientes.append(copia(p, alterado=False))
+    for p in locais[5 * fatia:5 * fatia + fatia // 2]:  # mesmo horário, conteúdo diferente
+        q = copia(p)
+        q['identificacao']['nome_gestante'] += ' C'
+        pacientes.append(q)
+    for p in locais[5 * fatia + fatia // 2:6 * fatia]:  # removido só no remoto
+        q = copia(p)
+        q['status'] = 'removido'
+        pacientes.append(q)
+    for i in range(4 * fatia):  # novos
+        pacientes.append({
+            'id': f'R{i:06d}', 'data_salvamento': '2025-02-01 10:00:00', 'ultima_modificacao': '2025-07-01 10:00:00',
+            'pc_id': 'remoto', 'versao': 2,
+            'identificacao': {'nome_gestante': f'Remoto {i}', 'unidade_saude': f'UBS {i % 40}'},
+            'avaliacao': {'consultas_pre_natal': i % 9},
+        })
+    aleatorio.shuffle(pacientes)
+
+    ags = db.buscar_agendamentos_por_ids([f'AG{j:06d}' for j in range(total // 2)])
+    aleatorio.shuffle(ags)
+    quinto = len(ags) // 5
+    agendamentos = []
+    for a in ags[:quinto]:  # mais recentes
+        agendamentos.append({**a, 'observacoes': 'remoto', 'ultima_modificacao': '2099-01-01 00:00:00',
+                             'pc_id': 'remoto', 'hash_conteudo': None})
+    for a in ags[quinto:2 * quinto]:  # mesmo horário, conteúdo diferente
+        agendamentos.append({**a, 'observacoes': 'conflito', 'hash_conteudo': None})
+    for a in ags[2 * quinto:3 * quinto]:  # idênticos
+        agendamentos.append(dict(a))
+    for a in ags[3 * quinto:3 * quinto + quinto // 2]:  # removido só no remoto
+        agendamentos.append({**a, 'status': 'removido'})
+    for j in range(quinto):  # novos
+        agendamentos.append({
+            'id': f'AR{j:06d}', 'paciente_id': f'L{(j * 7) % total:06d}', 'data_consulta': '2026-05-05',
+            'hora_consulta': '10:00', 'tipo_consulta': 'consulta', 'status': 'agendado', 'pc_id': 'remoto',
+            'data_criacao': '2025-07-01 10:00:00', 'ultima_modificacao': '2025-07-01 10:00:00', 'versao': 1,
+        })
+
+    esperado = {
+        'pacientes_adicionados': 4 * fatia,
+        'pacientes_atualizados': 3 * fatia,
+        'pacientes_conflito': fatia,
+        'agendamentos_adicionados': quinto,
+        'agendamentos_atualizados': quinto,
+        'agendamentos_conflito': quinto + quinto // 2,
+    }
+    return pacientes, agendamentos, esperado
+
+
+def estado_final(db):
+    return [
+        tuple(row) for tabela in ('pacientes', 'agendamentos')
+        for row in db.conn.execute(f"SELECT id, status, hash_conteudo FROM {tabela} ORDER BY id")
+    ]
+
+
+def mesclar(origem, nome, pacientes, agendamentos, tamanho_lote=None):
+    """Merge numa cópia de `origem`: (segundos, stats, estado final)."""
+    caminho = os.path.join(TEMP, nome)
+    shutil.copy(origem, caminho)
+    db = database.Database(caminho)
+    try:
+        # Cópias: o merge não pode ver registros já alterados por outra rodada
+        pacientes, agendamentos = copy.deepcopy(pacientes), copy.deepcopy(agendamentos)
+        inicio = time.perf_counter()
+        stats = db.mesclar_sincronizacao(pacientes, agendamentos, 'remoto', tamanho_lote)
+        decorrido = time.perf_counter() - inicio
+        return decorrido, stats, estado_final(db)
+    finally:
+        db.close()
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    origem = os.path.join(TEMP, 'local.db')
+    try:
+        print(f"Gravando {total} pacientes e {total // 2} agendamentos locais...")
+        db = criar_banco_local(origem, total)
+        pacientes, agendamentos, esperado = montar_payload(db, total)
+        pequeno = []
+        for p in db.buscar_pacientes_por_ids([f'L{i:06d}' for i in range(5)]):
+            p['identificacao']['nome_gestante'] += ' R'
+            p.pop('hash_conteudo', None)
+            p['ultima_modificacao'] = '2099-01-01 00:00:00'
+            pequeno.append(p)
+        pequeno += [{'id': f'N{i}', 'identificacao': {'nome_gestante': f'Nova {i}', 'unidade_saude': 'UBS X'}}
+                    for i in range(5)]
+        with db.escrita() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        db.close()
+
+        t_lote, stats_lote, estado_lote = mesclar(origem, 'lote.db', pacientes, agendamentos)
+        t_linha, stats_linha, estado_linha = mesclar(origem, 'linha.db', pacientes, agendamentos, 1)
+        t_pequeno, stats_pequeno, _ = mesclar(origem, 'pequeno.db', pequeno, [])
+
+        print()
+        print("=" * 60)
+        print(f" Merge de {len(pacientes)} pacientes e {len(agendamentos)} agendamentos")
+        print("=" * 60)
+        print(f"  {f'Blocos de {database.Database.TAMANHO_LOTE_MERGE}:':<32} {t_lote:8.2f} s")
+        print(f"  {'Um COMMIT por registro:':<32} {t_linha:8.2f} s")
+        print(f"  {f'10 registros contra {total}:':<32} {t_pequeno * 1000:8.1f} ms")
+        print()
+
+        ok = True
+        for nome, stats in (('blocos', stats_lote), ('um por registro', stats_linha)):
+            if stats != esperado:
+                print(f"[X] Contagens ({nome}): {stats}\n    esperado: {esperado}")
+                ok = False
+        if stats_pequeno['pacientes_atualizados'] != 5 or stats_pequeno['pacientes_adicionados'] != 5:
+            print(f"[X] Contagens (payload pequeno): {stats_pequeno}")
+            ok = False
+        if estado_lote != estado_linha:
+            print("[X] Estado final diferente entre os tamanhos de bloco")
+            ok = False
+        if ok:
+            print(f"[OK] Contagens esperadas: {esperado}")
+            print("[OK] Mesmo estado final com blocos e com um COMMIT por registro")
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
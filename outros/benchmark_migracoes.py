@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da abertura do banco com as migrações versionadas (PRAGMA user_version).
+
+Cria um banco "antigo" (esquema da v1, sem user_version e sem os campos de
+sincronização preenchidos) com N pacientes e mede:
+- a primeira abertura, que aplica todas as migrações uma única vez;
+- as aberturas seguintes (só a leitura de PRAGMA user_version);
+- o trabalho que toda abertura fazia antes das migrações versionadas: completar as
+  colunas e os dois UPDATE de tabela inteira dos campos de sincronização.
+
+Uso: python outros/benchmark_migracoes.py [pacientes] (padrão: 200000)
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_bench_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'benchmark')
+
+import database  # noqa: E402
+
+REPETICOES = 5
+
+
+def criar_banco_antigo(caminho, total):
+    """Banco como o baseline deixava: tabelas da v1, user_version 0, campos de sync vazios."""
+    conn = sqlite3.connect(caminho)
+    conn.row_factory = sqlite3.Row
+    database.Database._criar_ou_completar_tabela(conn, 'pacientes', database.Database.COLUNAS_PACIENTES_V1)
+    database.Database._criar_ou_completar_tabela(conn, 'agendamentos', database.Database.COLUNAS_AGENDAMENTOS_V1)
+    conn.executemany(
+        "INSERT INTO pacientes (id, nome_gestante, unidade_saude, consultas_pre_natal, plano_parto, "
+        "vacinas_completas, data_salvamento) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            (f'P{i:07d}', f'Gestante {i}', f'UBS {i % 40}', i % 12, i % 2,
+             ('Completa', 'Incompleta', None)[i % 3], '2024-01-01 08:00:00')
+            for i in range(total)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def medir(funcao, repeticoes=REPETICOES):
+    """Melhor tempo (ms) de `repeticoes` chamadas."""
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        decorrido = (time.perf_counter() - inicio) * 1000
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    caminho = os.path.join(TEMP, 'antigo.db')
+    try:
+        print(f"Criando banco antigo com {total} pacientes em {caminho}...")
+        criar_banco_antigo(caminho, total)
+
+        inicio = time.perf_counter()
+        db = database.Database(caminho)
+        primeira = (time.perf_counter() - inicio) * 1000
+        versao = db.conn.execute('PRAGMA user_version').fetchone()[0]
+        db.close()
+
+        def abrir():
+            database.Database(caminho).close()
+
+        seguintes = medir(abrir)
+
+        # O que toda abertura fazia antes: completar colunas + UPDATE de tabela inteira
+        # (desfeito no fim, para cada repetição ver o mesmo banco)
+        db = database.Database(caminho)
+
+        def trabalho_antigo():
+            with db.escrita() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    db._criar_ou_completar_tabela(conn, 'pacientes', db.COLUNAS_PACIENTES)
+                    db._criar_ou_completar_tabela(conn, 'agendamentos', db.COLUNAS_AGENDAMENTOS)
+                    db._migracao_preencher_campos_sync(conn)
+                finally:
+                    conn.rollback()
+
+        antes = medir(trabalho_antigo)
+        db.close()
+
+        esperada = database.Database.MIGRACOES[-1][0]
+        print()
+        print("=" * 60)
+        print(f" Abertura do banco ({total} pacientes, melhor de {REPETICOES})")
+        print("=" * 60)
+        print(f"  Antes (trabalho repetido em toda abertura): {antes:9.1f} ms")
+        print(f"  Primeira abertura (migrações v1..v{esperada}):   {primeira:9.1f} ms")
+        print(f"  Aberturas seguintes:                        {seguintes:9.1f} ms")
+        if versao != esperada:
+            print(f"[X] user_version {versao}, esperado {esperada}")
+            return 1
+        print(f"[OK] user_version = {versao}")
+        return 0
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da decodificação de linhas de pacientes (_row_to_dict / _linhas_para_dicts).
+
+Grava N pacientes num banco temporário e mede, com SELECT * FROM pacientes:
+- só o fetchall (custo do SQLite, referência);
+- fetchall + decodificação com o decodificador compilado por conjunto de colunas;
+- só a conversão, sobre linhas já lidas.
+
+Com --referencia <revisão git>, mede também o _row_to_dict daquela revisão (ex.: a
+anterior ao decodificador compilado) sobre as mesmas linhas e confere que os campos de
+identificação e avaliação saem iguais.
+
+Confere também listar_conflitos() com um paciente e um agendamento em conflito (merge
+com o mesmo ultima_modificacao e conteúdo diferente): os dois listados, com os campos
+de sincronização.
+
+Uso: python outros/benchmark_row_to_dict.py [pacientes] [--referencia REV] (padrão: 200000)
+"""
+import importlib.util
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_bench_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'benchmark')
+
+import database  # noqa: E402
+
+REPETICOES = 3
+
+
+def gerar_pacientes(total, semente=42):
+    aleatorio = random.Random(semente)
+    for i in range(total):
+        yield {
+            'id': f'P{i:07d}',
+            'data_salvamento': '2024-01-01 08:00:00',
+            'identificacao': {'nome_gestante': f'Gestante {i}', 'unidade_saude': f'UBS {i % 40}'},
+            'avaliacao': {
+                'inicio_pre_natal_antes_12s': aleatorio.choice([True, False, None]),
+                'consultas_pre_natal': aleatorio.randint(0, 12),
+                'vacinas_completas': aleatorio.choice(['completa', 'incompleta', None]),
+                'plano_parto': aleatorio.choice([True, False]),
+                'estratificacao_problema': aleatorio.choice(['', 'Hipertensão', None]),
+                'dum': '2024-01-01',
+                'ganhou_kit': aleatorio.choice([True, False, None]),
+            },
+        }
+
+
+def carregar_referencia(revisao):
+    """Módulo database.py da revisão git `revisao`, importado de um arquivo temporário."""
+    codigo = subprocess.run(
+        ['git', 'show', f'{revisao}:database.py'], cwd=RAIZ, check=True, capture_output=True
+    ).stdout
+    caminho = os.path.join(TEMP, 'database_referencia.py')
+    with open(caminho, 'wb') as f:
+        f.write(codigo)
+    spec = importlib.util.spec_from_file_location('database_referencia', caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def medir(funcao):
+    """Melhor tempo (s) de REPETICOES chamadas e o último resultado."""
+    melhor, resultado = None, None
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor, resultado
+
+
+def conferir_conflitos(db):
+    """Merge que gera um conflito de paciente e um de agendamento; listar_conflitos lista os dois."""
+    paciente = db.buscar_paciente('P0000000')
+    db.criar_agendamento('AGCONFLITO', paciente['id'], '2026-01-10', '09:00')
+    agendamento = db.buscar_agendamentos_por_ids(['AGCONFLITO'])[0]
+    paciente['identificacao']['nome_gestante'] += ' (remoto)'
+    stats = db.mesclar_sincronizacao(
+        [{**paciente, 'hash_conteudo': None}],
+        [{**agendamento, 'observacoes': 'alterado no remoto', 'hash_conteudo': None}],
+        'remoto',
+    )
+    conflitos = db.listar_conflitos()
+    esperado = ({'P0000000'}, {'AGCONFLITO'})
+    obtido = ({p['id'] for p in conflitos['pacientes']}, {a['id'] for a in conflitos['agendamentos']})
+    campos_sync = all(
+        campo in item for item in conflitos['pacientes'] + conflitos['agendamentos']
+        for campo in ('pc_id', 'ultima_modificacao', 'versao')
+    )
+    if stats['pacientes_conflito'] != 1 or stats['agendamentos_conflito'] != 1 or not conflitos['success'] \
+            or obtido != esperado or not campos_sync:
+        print(f"[X] listar_conflitos: {conflitos.get('message', obtido)} (merge: {stats})")
+        return False
+    print("[OK] listar_conflitos com paciente e agendamento em conflito")
+    return True
+
+
+def main():
+    args = sys.argv[1:]
+    revisao = None
+    if '--referencia' in args:
+        i = args.index('--referencia')
+        revisao = args[i + 1]
+        del args[i:i + 2]
+    total = int(args[0]) if args else 200000
+    try:
+        db = database.Database(os.path.join(TEMP, 'bench.db'))
+        print(f"Gravando {total} pacientes...")
+        db.inserir_registros_em_lote(list(gerar_pacientes(total)))
+        conn = db.conn
+
+        t_fetch, linhas = medir(lambda: conn.execute("SELECT * FROM pacientes").fetchall())
+        t_total, dicts = medir(lambda: db._linhas_para_dicts(conn.execute("SELECT * FROM pacientes")))
+        colunas = tuple(linhas[0].keys())
+        t_conversao, _ = medir(lambda: [db._decodificador(colunas)(row) for row in linhas])
+
+        print()
+        print("=" * 60)
+        print(f" Decodificação de {total} pacientes (melhor de {REPETICOES})")
+        print("=" * 60)
+        print(f"  Só fetchall:                  {total / t_fetch:10.0f} linhas/s")
+        print(f"  fetchall + decodificação:     {total / t_total:10.0f} linhas/s")
+        print(f"  Só a conversão:               {total / t_conversao:10.0f} linhas/s")
+
+        ok = len(dicts) == total
+        if revisao:
+            referencia = carregar_referencia(revisao)
+            antigo = referencia.Database._row_to_dict
+            t_antigo, antigos = medir(lambda: [antigo(None, row) for row in linhas])
+            print(f"  Só a conversão em {revisao}:{'':>{max(0, 10 - len(revisao))}} {total / t_antigo:10.0f} linhas/s")
+            novos = [db._row_to_dict(row) for row in linhas]
+            diferentes = sum(
+                1 for a, n in zip(antigos, novos)
+                if (a['id'], a['identificacao'], a['avaliacao']) != (n['id'], n['identificacao'], n['avaliacao'])
+            )
+            if diferentes:
+                print(f"[X] {diferentes} linha(s) decodificadas diferente de {revisao}")
+                ok = False
+            else:
+                print(f"[OK] identificação e avaliação iguais às de {revisao}")
+        ok &= conferir_conflitos(db)
+        db.close()
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste da anti-entropia pela árvore de hashes (inicio.rede.sync.reconciliar_servidores).
+
+Cria dois bancos temporários com os mesmos N pacientes e agendamentos, edita alguns
+registros de cada lado e sobe os dois no flask_app (waitress, portas livres). Confere:
+- os ids que a descida pela árvore manda de A para B e de B para A (só os editados);
+- as contagens do merge nos dois sentidos;
+- raízes de pacientes e agendamentos iguais depois da reconciliação;
+- uma segunda passada sem divergências.
+
+Uso: python outros/testar_arvore_sync.py [pacientes] (padrão: 5000)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_teste_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'teste')
+os.environ['SYNC_AUTO'] = '0'
+
+import database  # noqa: E402
+from flask_app import app  # noqa: E402
+from inicio.rede.sync import ConexaoPeer, _ids_divergentes, reconciliar_servidores  # noqa: E402
+from waitress.server import create_server  # noqa: E402
+
+TABELAS = ('pacientes', 'agendamentos')
+
+
+def criar_banco(caminho, total):
+    db = database.Database(caminho)
+    db.inserir_registros_em_lote([
+        {
+            'id': f'P{i:06d}',
+            'data_salvamento': '2025-01-01 10:00:00',
+            'ultima_modificacao': '2025-01-01 10:00:00',
+            'identificacao': {'nome_gestante': f'Gestante {i}', 'unidade_saude': f'UBS {i % 20}'},
+            'avaliacao': {'consultas_pre_natal': i % 10},
+        }
+        for i in range(total)
+    ])
+    with db.escrita() as conn:
+        conn.executemany(
+            "INSERT INTO agendamentos (id, paciente_id, data_consulta, hora_consulta, status, data_criacao, "
+            "data_atualizacao, ultima_modificacao) VALUES (?, ?, ?, ?, 'agendado', ?, ?, ?)",
+            [
+                (f'A{j:06d}', f'P{j % total:06d}', f'2026-{1 + j % 12:02d}-{1 + j % 28:02d}', '09:00',
+                 '2025-01-01 10:00:00', '2025-01-01 10:00:00', '2025-01-01 10:00:00')
+                for j in range(total // 2)
+            ],
+        )
+        conn.commit()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db.close()
+
+
+def editar(db_a, db_b, total):
+    """Edições de cada lado; retorna os ids que cada lado deve mandar, por tabela."""
+    editados_a = [f'P{i:06d}' for i in range(0, total, total // 4)]
+    editados_b = [f'P{i:06d}' for i in range(7, total, total // 8)]
+    for pid in editados_a:
+        paciente = db_a.buscar_paciente(pid)
+        paciente['avaliacao']['consultas_pre_natal'] = 11
+        db_a.atualizar_paciente(pid, paciente)
+    for pid in editados_b:
+        paciente = db_b.buscar_paciente(pid)
+        paciente['identificacao']['nome_gestante'] += ' (B)'
+        db_b.atualizar_paciente(pid, paciente)
+    novos_a = [db_a.adicionar_paciente({'identificacao': {'nome_gestante': f'Nova A {i}', 'unidade_saude': 'UBS 1'}})['id']
+               for i in range(3)]
+    agendamentos_a = ['A000001', 'A000002']
+    for aid in agendamentos_a:
+        db_a.atualizar_agendamento(aid, observacoes='remarcado em A')
+    novos_b = ['AB0', 'AB1']
+    for i, aid in enumerate(novos_b):
+        db_b.criar_agendamento(aid, f'P{100 + i:06d}', '2026-03-03', '10:00')
+
+    # Registro presente nos dois lados com hash diferente: cada lado manda a sua versão
+    pacientes = set(editados_a) | set(editados_b)
+    esperado = {
+        'pacientes': (pacientes | set(novos_a), pacientes),
+        'agendamentos': (set(agendamentos_a), set(agendamentos_a) | set(novos_b)),
+    }
+    merge_b = {'pacientes_adicionados': len(novos_a), 'pacientes_atualizados': len(editados_a),
+               'agendamentos_atualizados': len(agendamentos_a)}
+    merge_a = {'pacientes_atualizados': len(editados_b), 'agendamentos_adicionados': len(novos_b)}
+    return esperado, merge_a, merge_b
+
+
+def subir(db):
+    servidor = create_server(app, host='127.0.0.1', port=0, threads=4)
+    sys.modules['flask_app.db']._db_instances[int(servidor.effective_port)] = db
+    threading.Thread(target=servidor.run, daemon=True).start()
+    return servidor, f'http://127.0.0.1:{servidor.effective_port}'
+
+
+def conferir(nome, ok, detalhe=''):
+    print(f"{'[OK]' if ok else '[X] '} {nome}{': ' + detalhe if detalhe else ''}")
+    return ok
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print("=" * 60)
+    print(" TESTE DA ÁRVORE DE SINCRONIZAÇÃO")
+    print("=" * 60)
+    servidores = []
+    try:
+        criar_banco(os.path.join(TEMP, 'a.db'), total)
+        shutil.copy(os.path.join(TEMP, 'a.db'), os.path.join(TEMP, 'b.db'))
+        db_a, db_b = database.Database(os.path.join(TEMP, 'a.db')), database.Database(os.path.join(TEMP, 'b.db'))
+        esperado, merge_a, merge_b = editar(db_a, db_b, total)
+        (srv_a, url_a), (srv_b, url_b) = subir(db_a), subir(db_b)
+        servidores += [srv_a, srv_b]
+
+        ok = True
+        conexao_a, conexao_b = ConexaoPeer.de_url(url_a), ConexaoPeer.de_url(url_b)
+        try:
+            for tabela in TABELAS:
+                de_a, de_b = _ids_divergentes(conexao_a, conexao_b, tabela)
+                ok &= conferir(f"ids de {tabela} enviados", (de_a, de_b) == esperado[tabela],
+                               f"A->B {len(de_a)}, B->A {len(de_b)} (esperado {len(esperado[tabela][0])}, "
+                               f"{len(esperado[tabela][1])})")
+            requisicoes = conexao_a.requisicoes + conexao_b.requisicoes
+        finally:
+            conexao_a.fechar()
+            conexao_b.fechar()
+
+        resultado = reconciliar_servidores(url_a, url_b)
+        if not conferir("reconciliação", resultado['success'], resultado.get('message', '')):
+            return 1
+        divergentes = {tabela: len(esperado[tabela][0] | esperado[tabela][1]) for tabela in TABELAS}
+        ok &= conferir("divergentes", resultado['divergentes'] == divergentes, str(resultado['divergentes']))
+        for nome, obtido, contagens in (('merge em B', resultado['stats_b'], merge_b),
+                                        ('merge em A', resultado['stats_a'], merge_a)):
+            contagens = {campo: contagens.get(campo, 0) for campo in obtido}
+            ok &= conferir(nome, obtido == contagens, str({k: v for k, v in obtido.items() if v}))
+        for tabela in TABELAS:
+            raiz_a = db_a.arvore_sincronizacao(tabela)['hash']
+            raiz_b = db_b.arvore_sincronizacao(tabela)['hash']
+            ok &= conferir(f"raízes de {tabela} iguais", raiz_a == raiz_b)
+
+        segunda = reconciliar_servidores(url_a, url_b)
+        ok &= conferir("segunda passada sem divergências",
+                       segunda['success'] and not any(segunda['divergentes'].values()), str(segunda['divergentes']))
+        print(f"\n  {total} pacientes: {requisicoes} requisições para achar as divergências, "
+              f"{(resultado['bytes_enviados'] + resultado['bytes_recebidos']) / 1024:.1f} KB na reconciliação")
+        return 0 if ok else 1
+    finally:
+        for servidor in servidores:
+            servidor.close()
+        shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Simulação da sincronização em segundo plano com N servidores (flask_app/sincronizador.py).
+
+Sobe N servidores no mesmo processo (waitress, portas livres), cada um com um banco
+temporário e `por_no` pacientes próprios, e dá a cada um um SincronizadorServidores que
+conhece todos os outros. Em cada rodada todos rodam ciclo() ao mesmo tempo, até as
+raízes da árvore de hashes de pacientes e agendamentos ficarem iguais em todos. Para cada
+N e fanout (0 = todos os peers em toda rodada) mostra rodadas, tempo e requisições, e
+falha se alguma configuração não convergir ou se algum banco ficar sem os N * por_no
+pacientes.
+
+Uso: python outros/testar_convergencia_sync.py [Ns] [fanouts] [por_no]
+     (padrão: 4,8 0,1,2,3 200; ex.: python outros/testar_convergencia_sync.py 16 2,3)
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_teste_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'teste')
+os.environ['SYNC_AUTO'] = '0'
+
+import database  # noqa: E402
+from flask_app import app  # noqa: E402
+from flask_app.sincronizador import PeerSync, SincronizadorServidores  # noqa: E402
+from waitress.server import create_server  # noqa: E402
+
+MAX_RODADAS = 40
+# Todos rodam ciclo() ao mesmo tempo: a fila do waitress cresce de propósito
+logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+
+
+def raizes(db):
+    try:
+        return tuple(db.arvore_sincronizacao(tabela)['hash'] for tabela in ('pacientes', 'agendamentos'))
+    finally:
+        db.liberar_conexao()
+
+
+def simular(n, fanout, por_no, rodada_id):
+    """Uma configuração: dict com rodadas, convergência, tempo e requisições."""
+    dbs, servidores, sincronizadores = [], [], []
+    try:
+        for i in range(n):
+            db = database.Database(os.path.join(TEMP, f'r{rodada_id}_n{i:02d}.db'))
+            db.inserir_registros_em_lote([
+                {
+                    'id': f'N{i:02d}-{j:05d}',
+                    'identificacao': {'nome_gestante': f'Gestante {i}.{j}', 'unidade_saude': f'UBS {j % 7}'},
+                    'avaliacao': {'consultas_pre_natal': j % 9},
+                }
+                for j in range(por_no)
+            ])
+            servidor = create_server(app, host='127.0.0.1', port=0, threads=8)
+            sys.modules['flask_app.db']._db_instances[int(servidor.effective_port)] = db
+            threading.Thread(target=servidor.run, daemon=True).start()
+            dbs.append(db)
+            servidores.append(servidor)
+        portas = [int(s.effective_port) for s in servidores]
+        for db, porta in zip(dbs, portas):
+            sincronizador = SincronizadorServidores(db, porta=porta, intervalo=0, automatico=False, fanout=fanout)
+            for outra in portas:
+                if outra != porta:
+                    sincronizador.peers[f'127.0.0.1:{outra}'] = PeerSync('127.0.0.1', outra)
+            sincronizadores.append(sincronizador)
+
+        inicio = time.perf_counter()
+        rodadas, convergiu = 0, False
+        while rodadas < MAX_RODADAS and not convergiu:
+            rodadas += 1
+            threads = [threading.Thread(target=s.ciclo) for s in sincronizadores]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            convergiu = len({raizes(db) for db in dbs}) == 1
+        totais = []
+        for db in dbs:
+            totais.append(db.conn.execute('SELECT COUNT(*) FROM pacientes').fetchone()[0])
+            db.liberar_conexao()
+        peers = [p for s in sincronizadores for p in s.peers.values()]
+        return {
+            'rodadas': rodadas,
+            'convergiu': convergiu,
+            'completo': all(total == n * por_no for total in totais),
+            'segundos': time.perf_counter() - inicio,
+            'requisicoes': sum(p.conexao.requisicoes for p in peers if p.conexao),
+            'falhas': sum(p.falhas for p in peers),
+        }
+    finally:
+        for sincronizador in sincronizadores:
+            sincronizador.parar()
+        for servidor in servidores:
+            servidor.close()
+        for db in dbs:
+            db.close()
+
+
+def main():
+    ns = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [4, 8]
+    fanouts = [int(x) for x in sys.argv[2].split(',')] if len(sys.argv) > 2 else [0, 1, 2, 3]
+    por_no = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    print("=" * 60)
+    print(f" CONVERGÊNCIA DA SINCRONIZAÇÃO ({por_no} pacientes por servidor)")
+    print("=" * 60)
+    ok = True
+    try:
+        for n in ns:
+            for fanout in fanouts:
+                r = simular(n, fanout, por_no, f'{n}_{fanout}')
+                certo = r['convergiu'] and r['completo']
+                ok &= certo
+                linha = (f"{'[OK]' if certo else '[X] '} N={n:2d} fanout={fanout or 'todos':<5} "
+                         f"{r['rodadas']:2d} rodada(s) {r['segundos']:6.2f} s {r['requisicoes']:5d} requisições")
+                if r['falhas']:
+                    linha += f", {r['falhas']} falha(s)"
+                if not r['convergiu']:
+                    linha += f", sem convergir em {MAX_RODADAS} rodadas"
+                print(linha)
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
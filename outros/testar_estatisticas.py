@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste de regressão de obter_estatisticas: compara, em bancos aleatórios com semente,
+todos os contadores com a contagem em Python que existia antes da agregação no SQLite
+(SELECT * + laço, copiada abaixo como referência).
+
+Cada banco tem NULLs, strings vazias, maiúsculas/minúsculas e valores fora do domínio,
+e passa por atualizações e exclusões depois da carga (o rollup indicadores_diarios é
+mantido por triggers). São conferidos, para cada unidade (em várias grafias) e sem filtro:
+- obter_estatisticas();
+- obter_estatisticas_por_unidade() (consulta agrupada com _SQL_AGREGADOS_ESTATISTICAS).
+
+Uso: python outros/testar_estatisticas.py [sementes] [linhas] (padrão: 5 sementes, 3000 linhas)
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_teste_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'teste')
+
+import database  # noqa: E402
+
+UNIDADES = ['UBS Centro', 'ubs centro', 'UBS CENTRO', 'UBS Norte', 'UBS São José', 'UBS SÃO JOSÉ', None, '', '  ']
+VALORES = {
+    'inicio_pre_natal_antes_12s': [1, 0, None, 2],
+    'consultas_pre_natal': [None, 0, 1, 5, 6, 7, 12, -1],
+    'vacinas_completas': [None, '', 'Completa', 'completa', 'INCOMPLETA', 'incompleta ', 'Não avaliado', 'x'],
+    'plano_parto': [1, 0, None, 2],
+    'participou_grupos': [1, 0, None, 2],
+    'possui_bolsa_familia': [1, 0, None, 2],
+    'tem_vacina_covid': [1, 0, None, 2],
+}
+DATAS = [None, '', '2024-01-15 10:00:00', '2024-02-01 08:30:00', '2023-12-31 23:59:59']
+
+
+def estatisticas_referencia(conn, unidade_saude=None):
+    """obter_estatisticas como era antes da agregação no SQLite (sem ultima_atualizacao)."""
+    if unidade_saude:
+        rows = conn.execute("SELECT * FROM pacientes WHERE LOWER(unidade_saude) = LOWER(?)", (unidade_saude,)).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM pacientes").fetchall()
+    stats = {
+        'total_pacientes': len(rows),
+        'inicio_pre_natal_antes_12s': {'sim': 0, 'nao': 0},
+        'consultas_pre_natal': {'ate_6': 0, 'mais_6': 0},
+        'vacinas_completas': {'completa': 0, 'incompleta': 0, 'nao_avaliado': 0},
+        'plano_parto': {'sim': 0, 'nao': 0},
+        'participou_grupos': {'sim': 0, 'nao': 0},
+        'possui_bolsa_familia': {'sim': 0, 'nao': 0},
+        'tem_vacina_covid': {'sim': 0, 'nao': 0}
+    }
+    for row in rows:
+        inicio = row['inicio_pre_natal_antes_12s']
+        stats['inicio_pre_natal_antes_12s']['sim'] += 1 if inicio == 1 else 0
+        stats['inicio_pre_natal_antes_12s']['nao'] += 1 if inicio == 0 else 0
+        num_consultas = row['consultas_pre_natal'] or 0
+        stats['consultas_pre_natal']['mais_6'] += 1 if num_consultas >= 6 else 0
+        stats['consultas_pre_natal']['ate_6'] += 1 if num_consultas < 6 else 0
+        vacinas = (row['vacinas_completas'] or '').lower()
+        if 'completa' in vacinas:
+            stats['vacinas_completas']['completa'] += 1
+        elif 'incompleta' in vacinas:
+            stats['vacinas_completas']['incompleta'] += 1
+        else:
+            stats['vacinas_completas']['nao_avaliado'] += 1
+        stats['plano_parto']['sim'] += 1 if row['plano_parto'] == 1 else 0
+        stats['plano_parto']['nao'] += 1 if row['plano_parto'] == 0 else 0
+        stats['participou_grupos']['sim'] += 1 if row['participou_grupos'] == 1 else 0
+        stats['participou_grupos']['nao'] += 1 if row['participou_grupos'] == 0 else 0
+        bf = row['possui_bolsa_familia']
+        stats['possui_bolsa_familia']['sim'] += 1 if bf == 1 else 0
+        stats['possui_bolsa_familia']['nao'] += 1 if bf == 0 or bf is None else 0
+        vc = row['tem_vacina_covid']
+        stats['tem_vacina_covid']['sim'] += 1 if vc == 1 else 0
+        stats['tem_vacina_covid']['nao'] += 1 if vc == 0 or vc is None else 0
+    return stats
+
+
+def sem_horario(stats):
+    return {k: v for k, v in stats.items() if k != 'ultima_atualizacao'}
+
+
+def popular(db, aleatorio, total):
+    """Carga com SQL direto (valores fora do domínio incluídos), depois atualizações e exclusões."""
+    campos = list(VALORES)
+    with db.escrita() as conn:
+        conn.executemany(
+            f"INSERT INTO pacientes (id, nome_gestante, unidade_saude, data_salvamento, {', '.join(campos)}) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in campos)})",
+            [
+                (f'P{i:05d}', f'Gestante {i}', aleatorio.choice(UNIDADES), aleatorio.choice(DATAS),
+                 *(aleatorio.choice(VALORES[c]) for c in campos))
+                for i in range(total)
+            ],
+        )
+        conn.commit()
+        for _ in range(total // 5):
+            campo = aleatorio.choice(campos + ['unidade_saude', 'data_salvamento'])
+            valores = {'unidade_saude': UNIDADES, 'data_salvamento': DATAS}.get(campo) or VALORES[campo]
+            conn.execute(f"UPDATE pacientes SET {campo} = ? WHERE id = ?",
+                         (aleatorio.choice(valores), f'P{aleatorio.randrange(total):05d}'))
+        conn.commit()
+        excluir = [(f'P{aleatorio.randrange(total):05d}',) for _ in range(total // 20)]
+        conn.executemany("DELETE FROM pacientes WHERE id = ?", excluir)
+        conn.commit()
+
+
+def conferir(semente, total):
+    db = database.Database(os.path.join(TEMP, f'estatisticas_{semente}.db'))
+    falhas = []
+    try:
+        popular(db, random.Random(semente), total)
+        conn = db.conn
+        filtros = [None] + sorted({u for u in UNIDADES if u}) + ['ubs são josé', 'Unidade Inexistente']
+        for unidade in filtros:
+            esperado = estatisticas_referencia(conn, unidade)
+            obtido = sem_horario(db.obter_estatisticas(unidade))
+            if obtido != esperado:
+                falhas.append((f'obter_estatisticas({unidade!r})', esperado, obtido))
+        for nome, dados in db.obter_estatisticas_por_unidade().items():
+            esperado = estatisticas_referencia(conn, nome)
+            obtido = sem_horario(dados['estatisticas'])
+            if obtido != esperado or dados['total'] != esperado['total_pacientes']:
+                falhas.append((f'obter_estatisticas_por_unidade()[{nome!r}]', esperado, obtido))
+        return falhas, len(filtros)
+    finally:
+        db.close()
+
+
+def main():
+    sementes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    linhas = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    print("=" * 60)
+    print(" TESTE DE REGRESSÃO - obter_estatisticas")
+    print("=" * 60)
+    todas = []
+    try:
+        for semente in range(1, sementes + 1):
+            falhas, filtros = conferir(semente, linhas)
+            marca = "[OK]" if not falhas else "[X] "
+            print(f"{marca} semente {semente}: {linhas} linhas, {filtros} filtros, {len(falhas)} divergência(s)")
+            todas += falhas
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+    for consulta, esperado, obtido in todas[:5]:
+        print(f"\n{consulta}\n  esperado: {esperado}\n  obtido:   {obtido}")
+    print()
+    if todas:
+        print(f"[X] {len(todas)} divergência(s) com a contagem em Python")
+        return 1
+    print("[OK] Todos os contadores iguais à contagem em Python")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Teste dos planos das consultas críticas (Database.verificar_planos_consulta).
+
+Cria um banco temporário com pacientes e agendamentos e falha se alguma consulta de
+CONSULTAS_CRITICAS cair numa varredura completa (SCAN sem índice), antes e depois das
+estatísticas do planejador (otimizar_estatisticas, que a manutenção agendada roda).
+Depois, num banco sem os índices de unidade e de agendamentos por paciente, confere
+que a verificação aponta as varreduras, para o teste não passar por engano.
+
+Uso: python outros/testar_planos_consulta.py [pacientes] (padrão: 2000)
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+TEMP = tempfile.mkdtemp(prefix='gerente_teste_')
+# database cria o banco de DB_PATH no import: aponta para a pasta temporária
+os.environ['DB_PATH'] = os.path.join(TEMP, 'padrao.db')
+os.environ.setdefault('PC_ID', 'teste')
+
+import database  # noqa: E402
+
+# Sem estes, as consultas por unidade e os agendamentos do paciente viram SCAN
+INDICES_REMOVIDOS = ('idx_pacientes_unidade_id', 'idx_agendamento_paciente', 'idx_agendamentos_ativos_paciente')
+
+
+def popular(db, total):
+    db.inserir_registros_em_lote([
+        {
+            'id': f'P{i:06d}',
+            'data_salvamento': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 08:00:00',
+            'identificacao': {'nome_gestante': f'Maria {i}', 'unidade_saude': f'UBS {i % 15}'},
+            'avaliacao': {'consultas_pre_natal': i % 10, 'plano_parto': i % 2 == 0},
+        }
+        for i in range(total)
+    ])
+    with db.escrita() as conn:
+        conn.executemany(
+            "INSERT INTO agendamentos (id, paciente_id, data_consulta, hora_consulta, status) VALUES (?, ?, ?, ?, ?)",
+            [
+                (f'A{i:06d}', f'P{i % total:06d}', f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+                 f'{8 + i % 9:02d}:00', 'removido' if i % 10 == 0 else 'agendado')
+                for i in range(total * 2)
+            ],
+        )
+        conn.commit()
+
+
+def imprimir_falhas(resultado):
+    for consulta in resultado['consultas']:
+        if consulta['varreduras']:
+            print(f"     - {consulta['consulta']}: {'; '.join(consulta['varreduras'])}")
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("=" * 60)
+    print(" TESTE DE PLANOS DE CONSULTA")
+    print("=" * 60)
+    try:
+        db = database.Database(os.path.join(TEMP, 'planos.db'))
+        popular(db, total)
+
+        for etapa in ('sem estatísticas', 'com estatísticas'):
+            if etapa == 'com estatísticas':
+                db.otimizar_estatisticas()
+            resultado = db.verificar_planos_consulta()
+            print(f"{'[OK]' if resultado['success'] else '[X] '} {etapa}: {resultado['message']} "
+                  f"({len(resultado['consultas'])} SELECTs, {total} pacientes)")
+            if not resultado['success']:
+                imprimir_falhas(resultado)
+                return 1
+
+        db.close()
+
+        # Sem os índices a verificação precisa falhar (banco novo, sem estatísticas)
+        db = database.Database(os.path.join(TEMP, 'sem_indices.db'))
+        popular(db, total)
+        with db.escrita() as conn:
+            for indice in INDICES_REMOVIDOS:
+                conn.execute(f"DROP INDEX {indice}")
+            conn.commit()
+        sem_indices = db.verificar_planos_consulta()
+        db.close()
+        if sem_indices['success']:
+            print("[X]  Sem os índices a verificação deveria falhar")
+            return 1
+        print(f"[OK] Sem os índices: {sem_indices['message']}")
+        imprimir_falhas(sem_indices)
+        return 0
+    finally:
+        shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -142,24 +142,17 @@ def _gerar_paciente(i: int) -> tuple[str, dict]:
 def main() -> None:
     db = Database()
     print(f"Injetando {N} pacientes em {db.db_path} ...")
-    ok = 0
-    err = 0
-    for i in range(1, N + 1):
-        try:
+
+    def registros():
+        for i in range(1, N + 1):
             pid, paciente_data, data_salv = _gerar_paciente(i)
-            db.inserir_registro(
-                pid,
-                paciente_data,
-                arquivo_origem=ARQUIVO_ORIGEM,
-                data_salvamento=data_salv,
-            )
-            ok += 1
-            if i % 250 == 0:
-                print(f"  {i}/{N} ...")
-        except Exception as e:
-            err += 1
-            print(f"  Erro ao inserir paciente {i}: {e}")
-    print(f"Concluído: {ok} inseridos, {err} erros.")
+            yield {"id": pid, "data_salvamento": data_salv, **paciente_data}
+
+    resultado = db.inserir_registros_em_lote(registros(), arquivo_origem=ARQUIVO_ORIGEM)
+    for r in resultado["resultados"]:
+        if not r["success"]:
+            print(f"  Erro ao inserir paciente {r['id']}: {r['message']}")
+    print(f"Concluído: {resultado['inseridos']} inseridos, {resultado['falhas']} erros.")
 
 
 if __name__ == "__main__":
@@ -265,6 +265,11 @@ function configurarEventos() {
         discoverBtn.addEventListener('click', descobrirServidores);
     }
 
+    const syncAllBtn = document.getElementById('syncAllBtn');
+    if (syncAllBtn) {
+        syncAllBtn.addEventListener('click', sincronizarComTodos);
+    }
+
     if (removeSelectedBtn) {
         removeSelectedBtn.addEventListener('click', removerPacientesSelecionados);
     }
@@ -1036,58 +1041,71 @@ async function descobrirServidores() {
     }
 }
 
+// A sincronização roda no servidor local (POST /api/sync/servidor/sincronizar): ele puxa
+// do peer numa conexão keep-alive e mescla direto no banco; aqui só acompanhamos o status
+const SYNC_INTERVALO_STATUS_MS = 1000;
+
+function esperar(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+async function statusPeerSync(chavePeer) {
+    const response = await fetch('/api/sync/servidor');
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.message || 'Erro ao obter status da sincronização');
+    }
+    return (data.peers || []).find(p => `${p.ip}:${p.port}` === chavePeer);
+}
+
 async function sincronizarComServidor(server) {
     try {
         syncProgress.style.display = 'block';
         syncStatusMessage.textContent = 'Conectando ao servidor...';
         atualizarProgressoSync(10);
         
-        // Obter dados do servidor remoto
-        const remoteUrl = `http://${server.ip}:${server.port}`;
-        syncStatusMessage.textContent = 'Obtendo dados do servidor remoto...';
-        atualizarProgressoSync(30);
-        
-        const remoteResponse = await fetch(`${remoteUrl}/api/sync/data`);
-        if (!remoteResponse.ok) {
-            throw new Error('Não foi possível conectar ao servidor remoto');
-        }
-        
-        const remoteData = await remoteResponse.json();
-        if (!remoteData.success) {
-            throw new Error(remoteData.message || 'Erro ao obter dados do servidor remoto');
-        }
-        
-        syncStatusMessage.textContent = 'Sincronizando dados...';
-        atualizarProgressoSync(50);
-        
-        const pacientesRemotos = remoteData.pacientes || [];
-        const agendamentosRemotos = remoteData.agendamentos || [];
-        
-        // Enviar dados para merge (adiciona, atualiza e detecta remoções)
-        const mergeResponse = await fetch('/api/sync/merge', {
+        const response = await fetch('/api/sync/servidor/sincronizar', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                pacientes: pacientesRemotos,
-                agendamentos: agendamentosRemotos
+                ip: server.ip,
+                port: server.port,
+                hostname: server.hostname
             })
         });
+        const pedido = await response.json();
+        if (!pedido.success) {
+            throw new Error(pedido.message || 'Erro ao iniciar sincronização');
+        }
+        syncStatusMessage.textContent = 'Obtendo dados do servidor remoto...';
+        atualizarProgressoSync(30);
         
-        atualizarProgressoSync(90);
-        const mergeData = await mergeResponse.json();
-        
-        if (!mergeData.success) {
-            throw new Error(mergeData.message || 'Erro ao sincronizar dados');
+        let peer;
+        while (true) {
+            await esperar(SYNC_INTERVALO_STATUS_MS);
+            peer = await statusPeerSync(pedido.peer);
+            if (!peer) {
+                throw new Error('Servidor remoto não está mais na lista de sincronização');
+            }
+            if (peer.execucoes >= pedido.execucao && peer.estado !== 'sincronizando') {
+                break;
+            }
+            const progresso = peer.progresso || {};
+            if (progresso.seq_maximo) {
+                atualizarProgressoSync(Math.round(30 + 65 * Math.min(1, progresso.seq / progresso.seq_maximo)));
+                syncStatusMessage.textContent = `Sincronizando dados... (${progresso.seq} de ${progresso.seq_maximo} mudanças)`;
+            }
+        }
+        if (peer.estado === 'erro') {
+            throw new Error((peer.ultimo_erro && peer.ultimo_erro.mensagem) || 'Erro ao sincronizar dados');
         }
         
         atualizarProgressoSync(100);
         syncStatusMessage.textContent = 'Sincronização concluída!';
         
-        // Mostrar resultados (usar pacientes_removidos retornados pelo servidor)
-        const pacientesRemovidos = mergeData.pacientes_removidos || [];
-        mostrarResultadosSync(mergeData.stats, pacientesRemovidos);
+        mostrarResultadosSync((peer.ultima_execucao && peer.ultima_execucao.stats) || {}, []);
         
     } catch (error) {
         console.error('Erro ao sincronizar:', error);
@@ -1096,6 +1114,75 @@ async function sincronizarComServidor(server) {
     }
 }
 
+// Todos os peers numa rodada do sincronizador (em paralelo no servidor); o progresso é o
+// da rodada, e o resultado soma as estatísticas de cada peer
+async function sincronizarComTodos() {
+    const syncAllBtn = document.getElementById('syncAllBtn');
+    try {
+        syncAllBtn.disabled = true;
+        syncProgress.style.display = 'block';
+        syncStatusMessage.textContent = 'Agendando sincronização com todos os servidores...';
+        atualizarProgressoSync(5);
+
+        const response = await fetch('/api/sync/servidor/sincronizar_todos', { method: 'POST' });
+        const pedido = await response.json();
+        if (!pedido.success) {
+            throw new Error(pedido.message || 'Erro ao iniciar sincronização');
+        }
+        const pedidos = pedido.peers || [];
+        if (pedidos.length === 0) {
+            throw new Error('Nenhum servidor para sincronizar');
+        }
+
+        let peers = [];
+        while (true) {
+            await esperar(SYNC_INTERVALO_STATUS_MS);
+            const statusResponse = await fetch('/api/sync/servidor');
+            const data = await statusResponse.json();
+            if (!data.success) {
+                throw new Error(data.message || 'Erro ao obter status da sincronização');
+            }
+            peers = pedidos.map(p => ({
+                pedido: p,
+                peer: (data.peers || []).find(s => `${s.ip}:${s.port}` === p.peer)
+            }));
+            const terminados = peers.filter(({ pedido: p, peer }) =>
+                !peer || (peer.execucoes >= p.execucao && peer.estado !== 'sincronizando')).length;
+            const rodada = data.rodada || {};
+            const progresso = rodada.em_andamento ? (rodada.progresso || 0) : terminados / pedidos.length;
+            atualizarProgressoSync(Math.round(5 + 90 * progresso));
+            syncStatusMessage.textContent = `Sincronizando... (${terminados} de ${pedidos.length} servidores concluídos)`;
+            if (terminados === pedidos.length) {
+                break;
+            }
+        }
+
+        const stats = {};
+        const falhas = [];
+        peers.forEach(({ pedido: p, peer }) => {
+            if (!peer || peer.estado === 'erro') {
+                falhas.push(`${p.hostname || p.peer}: ${(peer && peer.ultimo_erro && peer.ultimo_erro.mensagem) || 'sem resposta'}`);
+                return;
+            }
+            Object.entries((peer.ultima_execucao && peer.ultima_execucao.stats) || {}).forEach(([campo, valor]) => {
+                stats[campo] = (stats[campo] || 0) + valor;
+            });
+        });
+
+        atualizarProgressoSync(100);
+        syncStatusMessage.textContent = falhas.length
+            ? `Sincronização concluída com ${falhas.length} servidor(es) com erro: ${falhas.join('; ')}`
+            : 'Sincronização concluída!';
+        mostrarResultadosSync(stats, []);
+    } catch (error) {
+        console.error('Erro ao sincronizar:', error);
+        syncStatusMessage.textContent = `Erro: ${error.message}`;
+        mostrarStatus(`Erro ao sincronizar: ${error.message}`, 'error');
+    } finally {
+        syncAllBtn.disabled = false;
+    }
+}
+
 function atualizarProgressoSync(percent) {
     const clampedPercent = Math.max(0, Math.min(100, percent));
     syncProgressFill.style.width = clampedPercent + '%';